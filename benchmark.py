@@ -13,8 +13,13 @@ import time
 import shutil
 import subprocess
 import datetime
-from globalconfig import Framework, NetworkType, FCN, Status, Synthetic
+import random
+from globalconfig import Framework, NetworkType, FCN, Status, Synthetic, Precision, GradientAggregation, \
+    DataFormat, Xla, LstmImpl, Mode
 from nvidiasmi import GPUManager, ModeStatus
+import fingerprint
+import sysinfo
+from resultprocess import scaling, variance, htmlreport
 import logging
 logger = logging.getLogger(__name__ if __name__ != '__main__' else os.path.splitext(os.path.basename(__file__))[0])
 logger.setLevel(logging.DEBUG)
@@ -36,7 +41,16 @@ FIELDS = [
     'epoch_size',
     'learning_rate',
     'synthetic',
-    'enabled'
+    'enabled',
+    # Optional columns, config files written before they were added keep working (see CONFIG_DEFAULTS).
+    'precision',
+    'gradient_aggregation',  # multi-GPU rows only
+    'data_format',  # cnn rows only
+    'xla',
+    'lstm_impl',  # lstm rows only
+    'mode',  # train, inference or loadgen
+    'profile_steps',  # steady-state steps to trace into the config dir, 0 for none
+    'repeats',  # runs of the row, see resultprocess/variance.py
 ]
 
 TestResultFields = [
@@ -56,20 +70,56 @@ TestResultFields = [
     'gpu_utilization',
     'mem_utilization',
     'max_memory_usage',
+    'input_memory_mb',  # host RAM of the input pipeline buffers, '-' for synthetic data
+    'precision',  # as reported by the training script, fp32 if it does not report one
+    'gradient_aggregation',
+    'scaling_efficiency',  # against the 1-GPU row with the same batch per GPU, see resultprocess/scaling.py
+    'data_format',  # layout the cnn ran in, '-' for other networks
+    'xla',  # as reported by the training script
+    'compile_time',  # seconds the first step took beyond the steady-state training_speed
+    'lstm_impl',  # LSTM implementation that ran, '-' for other networks
+    'mode',
+    'inference_throughput',  # examples/sec of the frozen graph at batch_size, '-' for training rows
+    'inference_p50_ms',  # latency percentiles as batch:ms pairs, e.g. 1:0.512;8:0.734;32:1.520
+    'inference_p90_ms',
+    'inference_p99_ms',
+    'loadgen_peak_qps',  # highest requests/sec of the load sweep, the curve is in loadgen-curve.csv of the log dir
+    'loadgen_p99_ms',  # p99 latency per load point, c<clients> closed loop and q<target qps> open loop
+    'profiled_steps',  # steps traced into timeline-step-<N>.json and op-profile.csv, left out of training_speed
+    'device_model',  # nvidia-smi name of the first GPU, cpu:<model name> for CPU rows
+    'flops_per_step',  # analytic forward + backward FLOPs of one training step of all devices, see flops.py
+    'parameters',  # trainable parameters of the model
+    'achieved_tflops',  # flops_per_step over the step time
+    'peak_fraction',  # achieved_tflops over the peak of the devices at the row's precision, see device_specs.py
+    'memory_bytes_per_step',  # bytes the ops of one training step read and write, see flops.py
+    'arithmetic_intensity',  # flops_per_step over memory_bytes_per_step
+    'attainable_tflops',  # roofline ceiling of the devices at that intensity
+    'roofline_bound',  # compute or bandwidth, which of the two ceilings limits the row
+    'repeat',  # 1-based run of the config row
+    'fingerprint',  # hardware and software configuration of the machine, see fingerprint.py
 ]
 
 TestConfigEntry = namedtuple('TestConfigEntry', FIELDS)
 TestResultEntry = namedtuple('TestResultEntry', TestResultFields)
 
+# Defaults of the optional trailing config columns, in FIELDS order.
+CONFIG_DEFAULTS = (Precision.fp32, GradientAggregation.central, DataFormat.auto, Xla.off, LstmImpl.unrolled,
+                   Mode.train, 0, 1)
+TestConfigEntry.__new__.__defaults__ = CONFIG_DEFAULTS
+
 
 def generate_configs(config_file):
     config = TestConfigEntry(Framework.tensorflow, NetworkType.fc, FCN.fcn5,
-                             0, 1, 4096, 2, 60000, 0.05, Synthetic.true, Status.enabled)
+                             0, 1, 4096, 2, 60000, 0.05, Synthetic.true, Status.enabled, Precision.fp32,
+                             GradientAggregation.central, DataFormat.auto, Xla.off, LstmImpl.unrolled, Mode.train,
+                             0, 1)
     with open(config_file, 'wb') as csv_file:
         writer = csv.writer(csv_file)
         writer.writerow(FIELDS)
         writer.writerow(config)
-        writer.writerow(TestConfigEntry('tensorflow', 'cnn', 'alexnet', 0, 1, 1024, 2, 50000, 0.01, False, True))
+        writer.writerow(TestConfigEntry('tensorflow', 'cnn', 'alexnet', 0, 1, 1024, 2, 50000, 0.01, False, True,
+                                        Precision.fp16, GradientAggregation.ring, DataFormat.auto,
+                                        Xla.scoped, LstmImpl.unrolled, Mode.train, 0, 1))
 
 
 def generate_log_file(config):
@@ -85,6 +135,37 @@ def generate_log_file(config):
     return log_file_name
 
 
+def read_configs(config_file):
+    """
+    Read config rows by header name, so columns may come in any order and optional ones may be left out.
+    :param config_file: config csv file path
+    :return: list of TestConfigEntry
+    """
+    with open(config_file, 'rb') as csv_file:
+        reader = csv.reader(csv_file)
+        header = [name.strip() for name in next(reader)]
+        unknown = [name for name in header if name not in FIELDS]
+        if unknown:
+            raise ValueError('Unknown config columns in %s: %s' % (config_file, ', '.join(unknown)))
+        return [TestConfigEntry(**dict(zip(header, row))) for row in reader if row]
+
+
+def schedule_runs(configs, shuffle=False, seed=None):
+    """
+    (config, repeat) of every run of the enabled configs, repeat counting from 1 up to the repeats of a config.
+    :param shuffle: interleave the runs of all configs in random order, so slow drifts (temperature, other load
+                    on the host) spread over all of them instead of biasing whichever ran at the time. 1-device
+                    runs still come first, they are the baselines of the scaling efficiency of the others.
+    :param seed: random seed of the order, to repeat a sweep in the same order
+    """
+    runs = [(config, repeat) for config in configs if config.enabled == Status.enabled
+            for repeat in range(1, int(config.repeats) + 1)]
+    if shuffle:
+        random.Random(seed).shuffle(runs)
+        runs.sort(key=lambda run: str(run[0].device_count) != '1')
+    return runs
+
+
 def save_a_result(test_result_entry, result_file):
     with open(result_file, 'wb') as csv_file:
         writer = csv.writer(csv_file)
@@ -100,18 +181,14 @@ def pretest(gpus, log_dir):
         if gpu.auto_boost_mode.status == ModeStatus.On:
             gpu.auto_boost_mode.turn_off()
 
-    collect_env_sh = os.path.join(PROJECT_ROOT, 'collect_systen_info.sh')
-    if os.path.isfile(collect_env_sh):
-        system_info_log = os.path.join(log_dir, 'system-info.txt')
-        cmd = 'bash %s %s' % (collect_env_sh, system_info_log)
-        logger.debug('[Querying system info] Executing shell: %s' % cmd)
-        if os.system(cmd) != 0:
-            logger.error('[Querying system info] Executing shell failed: %s' % cmd)
-        else:
-            logger.debug('[Querying system info] Executing shell success: %s' % cmd)
+    info = sysinfo.write_system_info(log_dir)
+    cached = [name for name, result in sorted(info['probes'].items()) if result['cached']]
+    logger.debug('[Querying system info] Done in %.2f seconds, cached: %s'
+                 % (info['seconds'], ', '.join(cached) or '-'))
 
 
-def run(config_file, log_dir=None, test_summary_file=None):
+def run(config_file, log_dir=None, test_summary_file=None, shuffle=False, seed=None,
+        cv_threshold=variance.DEFAULT_CV_THRESHOLD):
     if not log_dir:
         timestamp = datetime.datetime.now()
         log_dir = 'GpuBenchmarkLog_%s' % timestamp.strftime('%y%m%d-%H%M%S')
@@ -129,64 +206,96 @@ def run(config_file, log_dir=None, test_summary_file=None):
     gpu_count = len(gpus)
     logger.info('Found %d GPUs.' % len(gpus))
     pretest(gpus, log_dir)
+    # After pretest, which sets the ECC and persistence modes the tests run with.
+    machine = fingerprint.write_fingerprint(os.path.join(log_dir, fingerprint.FINGERPRINT_FILE_NAME))
+    os.environ[fingerprint.FINGERPRINT_ENV] = machine
+    logger.info('Machine fingerprint: %s' % machine)
     devId = ','.join([str(i) for i in range(gpu_count)])  # use all GPUs.
 
-    with open(config_file, 'rb') as csv_file:
-        reader = csv.reader(csv_file)
-        next(reader, None)  # skip the header
-        configs = [TestConfigEntry(*row) for row in reader]
-        for config in configs:
-            if config.enabled != Status.enabled:
-                continue
-            os.environ['training_speed'] = str(0)
-            logger.info('===== Running test with config: %s =====' % str(config))
-            sub_benchmark_file_name = config.framework + 'bm.py'
-            sub_benchmark = os.path.join(PROJECT_ROOT, 'frameworks', config.framework, sub_benchmark_file_name)
-            if not os.path.exists(sub_benchmark):
-                logger.error('File not found: %s' % (sub_benchmark,))
-                continue
-            log_file_name = generate_log_file(config)
-            log_file_path = os.path.join(log_dir, log_file_name)
-            network_dir = os.path.join(log_dir, config.framework, config.network_type, config.network_name)
-            config_dir_name = '--'.join([str(config.device_id),
-                                         str(config.device_count),
-                                         str(config.batch_size),
-                                         str(config.number_of_epochs),
-                                         str(config.epoch_size),
-                                         str(config.learning_rate),
-                                         str(config.synthetic)]).replace(' ', '_')
-            # configs may be the same, so we add a timestamp to distinguish them.
-            config_dir = os.path.join(network_dir,
-                                      config_dir_name,
-                                      datetime.datetime.now().strftime('%y%m%d-%H%M%S'))
-            if not os.path.isdir(config_dir):
-                os.makedirs(config_dir)
-            args = {
-                'netType': config.network_type,
-                'log': log_file_path,
-                'batchSize': config.batch_size,
-                'numEpochs': config.number_of_epochs,
-                'epochSize': config.epoch_size,
-                'network': config.network_name,
-                'lr': config.learning_rate,
-                'log_dir': config_dir,
-                'gpuCount': config.device_count,
-                'devId': config.device_id.replace(';', ','),
-                'synthetic': config.synthetic,
-                'test_summary_file': test_summary_file,
-                'cpuCountForGpu': config.cpu_count,
-            }
-            args_str = ' '.join(['-%s %s' % (k, v) for k, v in args.items()])
-            cmd = 'python {scriptFile} {argsStr}'.format(scriptFile=sub_benchmark, argsStr=args_str)
-            logger.debug('Executing shell: %s' % cmd)
-            try:
-                subprocess.check_call(cmd, shell=True)
-                logger.info('Executing shell success: %s' % cmd)
-                logger.info('Config run success: %s' % str(config))
-            except subprocess.CalledProcessError:
-                logger.error('Executing shell failed: %s' % cmd)
-                logger.info('Config run failed: %s' % str(config))
-                continue
+    runs = schedule_runs(read_configs(config_file), shuffle, seed)
+    for index, (config, repeat) in enumerate(runs):
+        os.environ['training_speed'] = str(0)
+        logger.info('===== Running test %d of %d, run %d of %s of config: %s ====='
+                    % (index + 1, len(runs), repeat, config.repeats, str(config)))
+        sub_benchmark_file_name = config.framework + 'bm.py'
+        sub_benchmark = os.path.join(PROJECT_ROOT, 'frameworks', config.framework, sub_benchmark_file_name)
+        if not os.path.exists(sub_benchmark):
+            logger.error('File not found: %s' % (sub_benchmark,))
+            continue
+        log_file_name = generate_log_file(config)
+        log_file_path = os.path.join(log_dir, log_file_name)
+        network_dir = os.path.join(log_dir, config.framework, config.network_type, config.network_name)
+        config_dir_name = '--'.join([str(config.device_id),
+                                     str(config.device_count),
+                                     str(config.batch_size),
+                                     str(config.number_of_epochs),
+                                     str(config.epoch_size),
+                                     str(config.learning_rate),
+                                     str(config.synthetic),
+                                     str(config.precision),
+                                     str(config.gradient_aggregation),
+                                     str(config.data_format),
+                                     str(config.xla),
+                                     str(config.lstm_impl),
+                                     str(config.mode),
+                                     str(config.profile_steps)]).replace(' ', '_')
+        # configs may be the same, so we add a timestamp to distinguish them.
+        config_dir = os.path.join(network_dir,
+                                  config_dir_name,
+                                  datetime.datetime.now().strftime('%y%m%d-%H%M%S') + '-r%d' % repeat)
+        if not os.path.isdir(config_dir):
+            os.makedirs(config_dir)
+        args = {
+            'netType': config.network_type,
+            'log': log_file_path,
+            'batchSize': config.batch_size,
+            'numEpochs': config.number_of_epochs,
+            'epochSize': config.epoch_size,
+            'network': config.network_name,
+            'lr': config.learning_rate,
+            'log_dir': config_dir,
+            'gpuCount': config.device_count,
+            'devId': config.device_id.replace(';', ','),
+            'synthetic': config.synthetic,
+            'test_summary_file': test_summary_file,
+            'cpuCountForGpu': config.cpu_count,
+            'precision': config.precision,
+            'gradientAggregation': config.gradient_aggregation,
+            'dataFormat': config.data_format,
+            'xla': config.xla,
+            'lstmImpl': config.lstm_impl,
+            'mode': config.mode,
+            'profileSteps': config.profile_steps,
+            'repeat': repeat,
+        }
+        args_str = ' '.join(['-%s %s' % (k, v) for k, v in args.items()])
+        cmd = 'python {scriptFile} {argsStr}'.format(scriptFile=sub_benchmark, argsStr=args_str)
+        logger.debug('Executing shell: %s' % cmd)
+        try:
+            subprocess.check_call(cmd, shell=True)
+            logger.info('Executing shell success: %s' % cmd)
+            logger.info('Config run success: %s' % str(config))
+        except subprocess.CalledProcessError:
+            logger.error('Executing shell failed: %s' % cmd)
+            logger.info('Config run failed: %s' % str(config))
+            continue
+
+    report = scaling.scaling_report(scaling.read_results(test_summary_file))
+    if any(entry['device_count'] > 1 for entry in report):
+        report_file = os.path.join(os.path.dirname(os.path.abspath(test_summary_file)), 'scaling_report.csv')
+        scaling.write_report(report, report_file)
+        logger.info('Multi-GPU scaling:\n%s' % scaling.format_report(report))
+        logger.info('Scaling report written to %s' % report_file)
+    report = variance.variance_report(scaling.read_results(test_summary_file), threshold=cv_threshold, min_runs=2)
+    if report:
+        report_file = os.path.join(os.path.dirname(os.path.abspath(test_summary_file)), 'variance_report.csv')
+        variance.write_report(report, report_file)
+        logger.info('Run-to-run variance:\n%s' % variance.format_report(report))
+        noisy = [e for e in report if e['flag'] == variance.NOISY]
+        if noisy:
+            logger.warning('%d of %d repeated tests vary by more than %.1f%% (cv), see %s'
+                           % (len(noisy), len(report), cv_threshold * 100, report_file))
+    logger.info('HTML report written to %s' % htmlreport.write_report(log_dir, result_file=test_summary_file))
 
 
 def set_arguments():
@@ -195,8 +304,14 @@ def set_arguments():
     parser.add_argument("-config", "--config_file", help="file path of config file", type=str)
     parser.add_argument("-log_dir", "--log_dir", help="Directory for logs.", type=str, default=None)
     parser.add_argument("-test_summary_file", "--test_summary_file", help="test_summary_file", type=str, default=None)
+    parser.add_argument("-shuffle", "--shuffle", help="run the repeats of all rows in random order",
+                        action="store_true")
+    parser.add_argument("-seed", "--seed", help="random seed of the shuffled order", type=int, default=None)
+    parser.add_argument("-cv_threshold", "--cv_threshold", help="flag repeated rows varying by more than this cv",
+                        type=float, default=variance.DEFAULT_CV_THRESHOLD)
     args = parser.parse_args()
-    run(args.config_file, log_dir=args.log_dir, test_summary_file=args.test_summary_file)
+    run(args.config_file, log_dir=args.log_dir, test_summary_file=args.test_summary_file, shuffle=args.shuffle,
+        seed=args.seed, cv_threshold=args.cv_threshold)
 
 
 if __name__ == '__main__':
@@ -73,6 +73,42 @@ def get_cpu_count_via_cpuinfo():
         return len(content.split('\n\n')) - 1
 
 
+def get_cpu_model_name():
+    with open(PROC_CPU_FILE, 'rb') as cpu_file:
+        result = re.search('model name\s*:\s*(.+)', cpu_file.read())
+        return result.group(1).strip() if result else 'unknown'
+
+
+def get_cpu_flags():
+    with open(PROC_CPU_FILE, 'rb') as cpu_file:
+        result = re.search('flags\s*:\s*(.+)', cpu_file.read())
+        return set(result.group(1).split()) if result else set()
+
+
+def get_physical_core_count():
+    """Cores of all sockets, hyper-threads not counted. The logical CPU count if cpuinfo does not tell."""
+    cores = set()
+    with open(PROC_CPU_FILE, 'rb') as cpu_file:
+        for block in cpu_file.read().split('\n\n'):
+            physical = re.search('physical id\s*:\s*(\d+)', block)
+            core = re.search('core id\s*:\s*(\d+)', block)
+            if physical and core:
+                cores.add((physical.group(1), core.group(1)))
+    return len(cores) or get_cpu_count_via_cpuinfo()
+
+
+def get_cpu_max_mhz():
+    """Highest clock of cpu0, the current clock in cpuinfo if cpufreq is not available."""
+    try:
+        with open(os.path.join(CPU_DIR, 'cpu0', 'cpufreq', 'cpuinfo_max_freq'), 'rb') as f:
+            return int(f.read().strip()) / 1000.0
+    except (IOError, OSError, ValueError):
+        pass
+    with open(PROC_CPU_FILE, 'rb') as cpu_file:
+        result = re.search('cpu MHz\s*:\s*([\d.]+)', cpu_file.read())
+        return float(result.group(1)) if result else None
+
+
 class CPU(object):
     def __init__(self, cpu_id):
         self._id = cpu_id
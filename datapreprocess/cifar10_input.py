@@ -27,6 +27,8 @@ import numpy as np
 #from six.moves import xrange  # pylint: disable=redefined-builtin
 import tensorflow as tf
 
+from datapreprocess.pipeline_budget import size_pipeline, PIPELINE_MEMORY_TEMPLATE, MB, DEFAULT_BUDGET_MB
+
 # Process images of this size. Note that this differs from the original CIFAR
 # image size of 32 x 32. If one alters this number, then the entire model
 # architecture will change and any model would need to be retrained.
@@ -37,8 +39,17 @@ NUM_CLASSES = 10
 NUM_EXAMPLES_PER_EPOCH_FOR_TRAIN = 50000
 NUM_EXAMPLES_PER_EPOCH_FOR_EVAL = 10000
 
+# Bytes of one queued or buffered example: a float32 image and an int32 label.
+EXAMPLE_BYTES = IMAGE_SIZE * IMAGE_SIZE * 3 * 4 + 4
+
 FLAGS = tf.app.flags.FLAGS
 
+# The shuffle queue (and shuffle buffer of dataSet) holds decoded float32
+# images, sized from this budget instead of a fixed fraction of the epoch.
+# Scripts with one queue per tower split it between the towers.
+tf.app.flags.DEFINE_integer('input_memory_budget_mb', DEFAULT_BUDGET_MB,
+                            """Host RAM the input queues and buffers may use.""")
+
 class Dataset(object):
   """Abstract class for cnn benchmarks dataset."""
 
@@ -148,17 +159,36 @@ def read_cifar10(filename_queue, data_format):
   return result
 
 
+def _budget(memory_budget_mb, batch_size, num_preprocess_threads,
+            max_shuffle_examples, max_prefetch_batches, resident_bytes=0):
+  """Size a pipeline of CIFAR examples and print its memory estimate."""
+  if memory_budget_mb is None:
+    memory_budget_mb = FLAGS.input_memory_budget_mb
+  sizes = size_pipeline(memory_budget_mb * MB - resident_bytes, EXAMPLE_BYTES,
+                        EXAMPLE_BYTES, batch_size, num_preprocess_threads,
+                        max_shuffle_examples=max_shuffle_examples,
+                        max_prefetch_batches=max_prefetch_batches)
+  print(PIPELINE_MEMORY_TEMPLATE % (sizes.memory_bytes + resident_bytes))
+  print('shuffle buffer: %d examples, prefetch: %d batches'
+        % (sizes.shuffle_examples, sizes.prefetch_batches))
+  return sizes
+
+
 def _generate_image_and_label_batch(image, label, min_queue_examples,
-                                    batch_size, shuffle):
+                                    batch_size, shuffle,
+                                    memory_budget_mb=None):
   """Construct a queued batch of images and labels.
 
   Args:
     image: 3-D Tensor of [height, width, 3] of type.float32.
     label: 1-D Tensor of type.int32
     min_queue_examples: int32, minimum number of samples to retain
-      in the queue that provides of batches of examples.
+      in the queue that provides of batches of examples. The budget
+      may lower it.
     batch_size: Number of images per batch.
     shuffle: boolean indicating whether to use a shuffling queue.
+    memory_budget_mb: host RAM of the queue, None for
+      --input_memory_budget_mb.
 
   Returns:
     images: Images. 4D tensor of [batch_size, height, width, 3] size.
@@ -167,19 +197,22 @@ def _generate_image_and_label_batch(image, label, min_queue_examples,
   # Create a queue that shuffles the examples, and then
   # read 'batch_size' images + labels from the example queue.
   num_preprocess_threads = 8 
+  sizes = _budget(memory_budget_mb, batch_size, num_preprocess_threads,
+                  min_queue_examples, 16)
+  capacity = sizes.shuffle_examples + sizes.prefetch_batches * batch_size
   if shuffle:
     images, label_batch = tf.train.shuffle_batch(
         [image, label],
         batch_size=batch_size,
         num_threads=num_preprocess_threads,
-        capacity=min_queue_examples + 16 * batch_size,
-        min_after_dequeue=min_queue_examples)
+        capacity=capacity,
+        min_after_dequeue=sizes.shuffle_examples)
   else:
     images, label_batch = tf.train.batch(
         [image, label],
         batch_size=batch_size,
         num_threads=num_preprocess_threads,
-        capacity=min_queue_examples + 16 * batch_size)
+        capacity=capacity)
 
   # Display the training images in the visualizer.
   #tf.image_summary('images', images)
@@ -187,12 +220,14 @@ def _generate_image_and_label_batch(image, label, min_queue_examples,
   return images, tf.reshape(label_batch, [batch_size])
 
 
-def distorted_inputs(data_dir, batch_size):
+def distorted_inputs(data_dir, batch_size, memory_budget_mb=None):
   """Construct distorted input for CIFAR training using the Reader ops.
 
   Args:
     data_dir: Path to the CIFAR-10 data directory.
     batch_size: Number of images per batch.
+    memory_budget_mb: host RAM of the queue, None for
+      --input_memory_budget_mb.
 
   Returns:
     images: Images. 4D tensor of [batch_size, IMAGE_SIZE, IMAGE_SIZE, 3] size.
@@ -243,7 +278,8 @@ def distorted_inputs(data_dir, batch_size):
   # Generate a batch of images and labels by building up a queue of examples.
   return _generate_image_and_label_batch(float_image, read_input.label,
                                          min_queue_examples, batch_size,
-                                         shuffle=True)
+                                         shuffle=True,
+                                         memory_budget_mb=memory_budget_mb)
 
 # Exampe of how to pass to function dataset.map if doing
 # distortions or other work.
@@ -253,7 +289,8 @@ def distorted_inputs(data_dir, batch_size):
 #  return image, label
 
 
-def dataSet(data_dir, batch_size, data_format='NCHW', device='gpu'):
+def dataSet(data_dir, batch_size, data_format='NCHW', device='gpu',
+            memory_budget_mb=None):
   data = Cifar10Data(data_dir=data_dir)
   images, labels = data.read_data_files()
   images = tf.cast(images, tf.float32)
@@ -270,7 +307,11 @@ def dataSet(data_dir, batch_size, data_format='NCHW', device='gpu'):
   else:
     dataset = dataset.map(lambda x,y:(x,y),num_threads=2,output_buffer_size=batch_size)
   dataset = dataset.repeat()
-  dataset = dataset.shuffle(buffer_size=50000)
+  # The whole training set stays resident as well, it counts against the
+  # budget before the shuffle buffer is sized.
+  sizes = _budget(memory_budget_mb, batch_size, 1, 50000, 1,
+                  resident_bytes=50000 * EXAMPLE_BYTES)
+  dataset = dataset.shuffle(buffer_size=sizes.shuffle_examples)
   dataset = dataset.batch(batch_size)
   
   # Needed to let rest of the graph know the shape of the data
@@ -283,13 +324,16 @@ def dataSet(data_dir, batch_size, data_format='NCHW', device='gpu'):
   return iterator,initializer
 
 
-def inputs(eval_data, data_dir, batch_size, data_format='NCHW'):
+def inputs(eval_data, data_dir, batch_size, data_format='NCHW',
+           memory_budget_mb=None):
   """Construct input for CIFAR evaluation using the Reader ops.
 
   Args:
     eval_data: bool, indicating if one should use the train or eval data set.
     data_dir: Path to the CIFAR-10 data directory.
     batch_size: Number of images per batch.
+    memory_budget_mb: host RAM of the queue, None for
+      --input_memory_budget_mb.
 
   Returns:
     images: Images. 4D tensor of [batch_size, IMAGE_SIZE, IMAGE_SIZE, 3] size.
@@ -339,4 +383,5 @@ def inputs(eval_data, data_dir, batch_size, data_format='NCHW'):
   # Generate a batch of images and labels by building up a queue of examples.
   return _generate_image_and_label_batch(reshaped_image, read_input.label,
                                          min_queue_examples, batch_size,
-                                         shuffle=shuffle)
+                                         shuffle=shuffle,
+                                         memory_budget_mb=memory_budget_mb)
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+""" image_cache.py: Caches of decoded, resized uint8 images for repeated epochs.
+
+Two tiers share the same get/put interface, keyed by the integer image index of the manifest:
+  * MemoryImageCache keeps images in RAM within a byte budget, evicting the least recently used ones.
+  * MmapImageCache keeps one fixed-size slot per image in a local memory-mapped file, which survives
+    across runs. A sidecar file records the dataset it was filled from (source_identity of the manifest or
+    shard files) and the slot shape; when either differs, every slot is marked empty again, so a rebuilt
+    manifest or another dataset of the same length never gets stale pixels.
+Only decoding and resizing are cached. Random distortions are still applied on every pass by the caller.
+"""
+
+import os
+import json
+import hashlib
+import threading
+import collections
+
+import numpy as np
+
+
+def source_identity(paths):
+    """Hash of the real paths, sizes and modification times of the files a dataset is read from."""
+    digest = hashlib.sha1()
+    for path in paths:
+        stat = os.stat(path)
+        digest.update('%s\0%d\0%r\n' % (os.path.realpath(path), stat.st_size, stat.st_mtime))
+    return digest.hexdigest()
+
+
+class MemoryImageCache(object):
+    def __init__(self, byte_budget):
+        self._budget = int(byte_budget)
+        self._images = collections.OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            image = self._images.pop(key, None)
+            if image is None:
+                self.misses += 1
+                return None
+            self._images[key] = image  # most recently used goes last
+            self.hits += 1
+            return image
+
+    def put(self, key, image):
+        if image.nbytes > self._budget:
+            return
+        with self._lock:
+            old = self._images.pop(key, None)
+            if old is not None:
+                self._bytes -= old.nbytes
+            while self._images and self._bytes + image.nbytes > self._budget:
+                _, evicted = self._images.popitem(last=False)
+                self._bytes -= evicted.nbytes
+                self.evictions += 1
+            self._images[key] = image
+            self._bytes += image.nbytes
+
+    @property
+    def nbytes(self):
+        return self._bytes
+
+    def stats(self):
+        return 'hits: %d, misses: %d, evictions: %d, bytes: %d' % (self.hits, self.misses, self.evictions,
+                                                                   self._bytes)
+
+
+class MmapImageCache(object):
+    def __init__(self, path, num_images, height, width, depth=3, source=None):
+        """
+        :param source: source_identity of the dataset, None if unknown (the cache is then never reused)
+        """
+        self._shape = (num_images, height, width, depth)
+        meta = {'source': source, 'shape': list(self._shape)}
+        meta_path = path + '.meta'
+        mode = 'r+' if os.path.isfile(path) and os.path.getsize(path) == int(np.prod(self._shape)) else 'w+'
+        self._images = np.memmap(path, dtype=np.uint8, mode=mode, shape=self._shape)
+        filled_path = path + '.filled'
+        if mode == 'w+' or not os.path.isfile(filled_path) or source is None or self._read_meta(meta_path) != meta:
+            filled_mode = 'w+'
+        else:
+            filled_mode = 'r+'
+        self._filled = np.memmap(filled_path, dtype=np.uint8, mode=filled_mode, shape=(num_images,))
+        if filled_mode == 'w+':
+            self._filled.flush()
+            with open(meta_path, 'w') as f:
+                json.dump(meta, f)
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _read_meta(meta_path):
+        try:
+            with open(meta_path, 'r') as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return None
+
+    def get(self, key):
+        if not self._filled[key]:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return self._images[key]
+
+    def put(self, key, image):
+        if image.shape != self._shape[1:]:
+            raise ValueError('Image shape %s does not fit cache slots of %s' % (image.shape, self._shape[1:]))
+        self._images[key] = image
+        self._filled[key] = 1  # set after the pixels so a concurrent reader never sees a half-written slot
+
+    @property
+    def nbytes(self):
+        return int(self._images.nbytes)
+
+    def stats(self):
+        return 'hits: %d, misses: %d, filled: %d/%d' % (self.hits, self.misses, int(self._filled.sum()),
+                                                        self._shape[0])
+
+    def flush(self):
+        self._images.flush()
+        self._filled.flush()
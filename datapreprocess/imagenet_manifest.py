@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+""" imagenet_manifest.py: Compact, memory-mapped file index of an ImageNet-style directory tree.
+
+The manifest replaces the `<data_dir>.txt` listing that used to be parsed line by line (plus a regex and a
+synset lookup per file). Class directories are scanned in parallel and the result is stored as a small binary
+file that can be mapped in a few milliseconds:
+
+    header   : magic(8s) version(uint32) count(uint64) blob_size(uint64)
+    offsets  : uint64[count + 1]   byte offsets of each relative path inside the blob
+    labels   : int16[count]        label index of each file
+    padding  : up to 8-byte alignment
+    blob     : utf-8 relative paths ('n01440764/n01440764_10026.JPEG'), concatenated
+"""
+
+import os
+import mmap
+import struct
+import logging
+from multiprocessing.pool import ThreadPool
+
+import numpy as np
+
+logger = logging.getLogger(__name__ if __name__ != '__main__' else os.path.splitext(os.path.basename(__file__))[0])
+logger.setLevel(logging.DEBUG)
+
+MANIFEST_MAGIC = b'IMNETIDX'
+MANIFEST_VERSION = 1
+MANIFEST_SUFFIX = '.manifest'
+HEADER = struct.Struct('<8sIQQ')
+IMAGE_EXTENSIONS = ('.JPEG', '.jpeg', '.jpg', '.JPG')
+
+
+def default_manifest_path(data_dir):
+    return data_dir.rstrip(os.sep) + MANIFEST_SUFFIX
+
+
+def _scan_class_dir(args):
+    data_dir, class_name = args
+    class_dir = os.path.join(data_dir, class_name)
+    names = [n for n in os.listdir(class_dir) if os.path.splitext(n)[1] in IMAGE_EXTENSIONS]
+    names.sort()
+    return class_name, names
+
+
+def scan(data_dir, label_map=None, num_workers=16):
+    """
+    List every image under data_dir/<class>/ using one listdir per class directory, in parallel.
+    :param data_dir: root directory whose sub directories are the classes (e.g. synset ids)
+    :param label_map: dict mapping class directory name to label index. None means sorted directory order.
+    :param num_workers: number of concurrent directory scans
+    :return: (relative_paths, labels)
+    """
+    class_names = sorted(n for n in os.listdir(data_dir) if os.path.isdir(os.path.join(data_dir, n)))
+    if label_map is None:
+        label_map = dict((name, index) for index, name in enumerate(class_names))
+    unknown = [n for n in class_names if n not in label_map]
+    if unknown:
+        logger.warning('Skipping %d class directories without a label: %s' % (len(unknown), unknown[:5]))
+    class_names = [n for n in class_names if n in label_map]
+
+    pool = ThreadPool(max(1, num_workers))
+    try:
+        listings = pool.map(_scan_class_dir, [(data_dir, n) for n in class_names])
+    finally:
+        pool.close()
+        pool.join()
+
+    paths = []
+    labels = []
+    for class_name, names in listings:
+        label = label_map[class_name]
+        paths.extend('%s/%s' % (class_name, n) for n in names)
+        labels.extend([label] * len(names))
+    return paths, labels
+
+
+def write_manifest(output_path, paths, labels):
+    if len(paths) != len(labels):
+        raise ValueError('paths(%d) and labels(%d) differ in length' % (len(paths), len(labels)))
+    encoded = [p.encode('utf-8') if not isinstance(p, bytes) else p for p in paths]
+    offsets = np.zeros(len(encoded) + 1, dtype='<u8')
+    np.cumsum([len(p) for p in encoded], out=offsets[1:])
+    label_array = np.asarray(labels, dtype='<i2')
+    blob = b''.join(encoded)
+
+    tmp_path = output_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MANIFEST_MAGIC, MANIFEST_VERSION, len(encoded), len(blob)))
+        f.write(offsets.tobytes())
+        f.write(label_array.tobytes())
+        f.write(b'\0' * (-f.tell() % 8))
+        f.write(blob)
+    os.rename(tmp_path, output_path)
+
+
+def build_manifest(data_dir, output_path=None, label_map=None, num_workers=16):
+    output_path = output_path or default_manifest_path(data_dir)
+    paths, labels = scan(data_dir, label_map=label_map, num_workers=num_workers)
+    write_manifest(output_path, paths, labels)
+    logger.info('Wrote manifest of %d files to %s' % (len(paths), output_path))
+    return output_path
+
+
+class ImageNetManifest(object):
+    """Read-only view over a manifest file. Nothing is decoded until a path is requested."""
+
+    def __init__(self, manifest_path, data_dir=None):
+        self._path = manifest_path
+        self._data_dir = data_dir
+        with open(manifest_path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, count, blob_size = HEADER.unpack_from(self._mm, 0)
+        if magic != MANIFEST_MAGIC or version != MANIFEST_VERSION:
+            raise RuntimeError('Not a manifest (or unsupported version): %s' % manifest_path)
+        offset = HEADER.size
+        self._offsets = np.frombuffer(self._mm, dtype='<u8', count=count + 1, offset=offset)
+        offset += self._offsets.nbytes
+        self.labels = np.frombuffer(self._mm, dtype='<i2', count=count, offset=offset)
+        offset += self.labels.nbytes
+        self._blob_start = offset + (-offset % 8)
+        self._count = count
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def manifest_path(self):
+        return self._path
+
+    def relative_path(self, index):
+        start = self._blob_start + int(self._offsets[index])
+        end = self._blob_start + int(self._offsets[index + 1])
+        return self._mm[start:end].decode('utf-8')
+
+    def path(self, index):
+        relative = self.relative_path(index)
+        return os.path.join(self._data_dir, relative) if self._data_dir else relative
+
+    def filenames(self):
+        """All (absolute when data_dir is known) paths, in manifest order."""
+        blob = self._mm[self._blob_start:self._blob_start + int(self._offsets[-1])]
+        bounds = self._offsets.tolist()
+        prefix = self._data_dir.rstrip(os.sep) + os.sep if self._data_dir else ''
+        return [prefix + blob[bounds[i]:bounds[i + 1]].decode('utf-8') for i in range(self._count)]
+
+    def close(self):
+        self._offsets = None
+        self.labels = None
+        self._mm.close()
+
+
+def load_manifest(data_dir, manifest_path=None, label_map=None, num_workers=16):
+    """Map the manifest of data_dir, building it first (parallel directory scan) if it does not exist yet."""
+    manifest_path = manifest_path or default_manifest_path(data_dir)
+    if not os.path.isfile(manifest_path):
+        logger.info('Manifest not found, scanning %s' % data_dir)
+        build_manifest(data_dir, manifest_path, label_map=label_map, num_workers=num_workers)
+    return ImageNetManifest(manifest_path, data_dir=data_dir)
+
+
+if __name__ == '__main__':
+    import argparse
+    logging.basicConfig(level=logging.DEBUG)
+    parser = argparse.ArgumentParser(description='Build a binary file manifest of an ImageNet-style directory')
+    parser.add_argument('-data_dir', '--data_dir', help='directory containing one sub directory per class')
+    parser.add_argument('-output', '--output', help='manifest file path, default: <data_dir>.manifest', default=None)
+    parser.add_argument('-workers', '--workers', help='parallel directory scans', type=int, default=16)
+    args = parser.parse_args()
+    build_manifest(args.data_dir, args.output, num_workers=args.workers)
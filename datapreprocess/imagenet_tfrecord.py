@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+""" imagenet_tfrecord.py: Pack ImageNet JPEGs into size-bounded TFRecord shards.
+
+Each record is an Example holding the JPEG bytes themselves (image/encoded) and the label, so that the
+training input pipeline streams a few large files instead of opening one small file per image.
+The list of files to pack comes from the manifest (see imagenet_manifest.py).
+"""
+
+import os
+import glob
+import json
+import random
+import logging
+from multiprocessing import Pool
+
+import tensorflow as tf
+
+from datapreprocess import imagenet_manifest
+
+logger = logging.getLogger(__name__ if __name__ != '__main__' else os.path.splitext(os.path.basename(__file__))[0])
+logger.setLevel(logging.DEBUG)
+
+SHARD_PATTERN = '%s-%03d-%05d.tfrecord'  # prefix, worker, shard index
+META_PATTERN = '%s-meta.json'  # prefix
+
+
+def _bytes_feature(value):
+    return tf.train.Feature(bytes_list=tf.train.BytesList(value=[value]))
+
+
+def _int64_feature(value):
+    return tf.train.Feature(int64_list=tf.train.Int64List(value=[value]))
+
+
+def make_example(image_buffer, label, relative_path, index):
+    synset_id = relative_path.split('/', 1)[0]
+    return tf.train.Example(features=tf.train.Features(feature={
+        'image/encoded': _bytes_feature(image_buffer),
+        'image/format': _bytes_feature(b'JPEG'),
+        'image/index': _int64_feature(index),
+        'image/class/label': _int64_feature(label),
+        'image/class/synset': _bytes_feature(synset_id.encode('utf-8')),
+        'image/filename': _bytes_feature(os.path.basename(relative_path).encode('utf-8')),
+    }))
+
+
+def _pack_worker(args):
+    worker_id, data_dir, items, output_dir, prefix, shard_size = args
+    shards = []
+    writer = None
+    written = 0
+    for index, relative_path, label in items:
+        if writer is None or written >= shard_size:
+            if writer is not None:
+                writer.close()
+            shard_path = os.path.join(output_dir, SHARD_PATTERN % (prefix, worker_id, len(shards)))
+            writer = tf.python_io.TFRecordWriter(shard_path)
+            shards.append(shard_path)
+            written = 0
+        with open(os.path.join(data_dir, relative_path), 'rb') as f:
+            image_buffer = f.read()
+        writer.write(make_example(image_buffer, label, relative_path, index).SerializeToString())
+        written += len(image_buffer)
+    if writer is not None:
+        writer.close()
+    return shards
+
+
+def pack(data_dir, output_dir, prefix='train', shard_size_mb=128, num_workers=8, label_map=None, seed=0):
+    """
+    Write every image listed by the manifest of data_dir into shards of about shard_size_mb each.
+    Files are shuffled once (with seed) before packing so each shard mixes all classes.
+    :return: list of shard paths
+    """
+    manifest = imagenet_manifest.load_manifest(data_dir, label_map=label_map)
+    items = [(i, manifest.relative_path(i), int(label)) for i, label in enumerate(manifest.labels.tolist())]
+    random.Random(seed).shuffle(items)
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+
+    num_workers = max(1, num_workers)
+    chunk = (len(items) + num_workers - 1) // num_workers
+    tasks = [(w, data_dir, items[w * chunk:(w + 1) * chunk], output_dir, prefix, shard_size_mb * 1024 * 1024)
+             for w in range(num_workers)]
+    pool = Pool(num_workers)
+    try:
+        shards = sum(pool.map(_pack_worker, tasks), [])
+    finally:
+        pool.close()
+        pool.join()
+    with open(os.path.join(output_dir, META_PATTERN % prefix), 'w') as f:
+        json.dump({'num_examples': len(items), 'shards': [os.path.basename(s) for s in shards]}, f)
+    logger.info('Packed %d images into %d shards under %s' % (len(items), len(shards), output_dir))
+    return shards
+
+
+class PackedImageNetData(object):
+    """Dataset of shards written by pack(). image_processing.batch_inputs dispatches on `packed`."""
+    packed = True
+
+    def __init__(self, data_dir, prefix='train'):
+        self.name = 'imagenet'
+        self.data_dir = data_dir
+        self.prefix = prefix
+
+    def data_files(self):
+        return sorted(glob.glob(os.path.join(self.data_dir, '%s-*.tfrecord' % self.prefix)))
+
+    def num_examples(self):
+        with open(os.path.join(self.data_dir, META_PATTERN % self.prefix), 'r') as f:
+            return json.load(f)['num_examples']
+
+    def average_example_bytes(self):
+        total = sum(os.path.getsize(f) for f in self.data_files())
+        return max(1, total // max(1, self.num_examples()))
+
+    def __str__(self):
+        return self.name
+
+
+if __name__ == '__main__':
+    import argparse
+    logging.basicConfig(level=logging.DEBUG)
+    parser = argparse.ArgumentParser(description='Pack ImageNet JPEGs into TFRecord shards')
+    parser.add_argument('-data_dir', '--data_dir', help='directory containing one sub directory per class')
+    parser.add_argument('-output_dir', '--output_dir', help='directory to write the shards to')
+    parser.add_argument('-prefix', '--prefix', help='shard file name prefix', default='train')
+    parser.add_argument('-shard_size_mb', '--shard_size_mb', help='approximate shard size', type=int, default=128)
+    parser.add_argument('-workers', '--workers', help='number of packing processes', type=int, default=8)
+    args = parser.parse_args()
+    pack(args.data_dir, args.output_dir, prefix=args.prefix, shard_size_mb=args.shard_size_mb,
+         num_workers=args.workers)
@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+""" mnist_cache.py: Preprocessed, memory-mapped MNIST store with an index-permutation batcher.
+
+The gzipped IDX files are decoded once into .npy files under <data_dir>/npy (float32 images scaled to [0, 1] and
+float32 one-hot labels). Later runs map those files instead of decompressing and converting again.
+The batcher gathers each epoch in permuted order into one contiguous buffer and hands out slices of it,
+so a training step costs no copy at all, except for the one batch that straddles two epochs.
+The split matches tensorflow.examples.tutorials.mnist.input_data.read_data_sets(one_hot=True): the first
+validation_size training images are held out.
+"""
+
+import os
+import gzip
+import logging
+from collections import namedtuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__ if __name__ != '__main__' else os.path.splitext(os.path.basename(__file__))[0])
+logger.setLevel(logging.DEBUG)
+
+NUM_CLASSES = 10
+CACHE_DIR_NAME = 'npy'
+IDX_FILES = {
+    'train': ('train-images-idx3-ubyte.gz', 'train-labels-idx1-ubyte.gz'),
+    'test': ('t10k-images-idx3-ubyte.gz', 't10k-labels-idx1-ubyte.gz'),
+}
+IMAGES_PATTERN = '%s-images.npy'  # split
+LABELS_PATTERN = '%s-labels.npy'  # split
+
+Datasets = namedtuple('Datasets', ['train', 'validation', 'test'])
+
+
+def read_idx(path):
+    """Decode a (gzipped) IDX file into a numpy array of its declared shape."""
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rb') as f:
+        content = f.read()
+    magic = np.frombuffer(content, dtype='>u4', count=1)[0]
+    if magic >> 8 != 0x08:
+        raise ValueError('Only unsigned byte IDX files are supported: %s (magic %#x)' % (path, magic))
+    ndim = magic & 0xff
+    shape = tuple(int(d) for d in np.frombuffer(content, dtype='>u4', count=ndim, offset=4))
+    return np.frombuffer(content, dtype=np.uint8, offset=4 + 4 * ndim).reshape(shape)
+
+
+def _save(path, array):
+    tmp_path = path + '.tmp.npy'
+    np.save(tmp_path, array)
+    os.rename(tmp_path, path)
+
+
+def cache_dir_of(data_dir):
+    return os.path.join(data_dir, CACHE_DIR_NAME)
+
+
+def build_cache(data_dir, cache_dir=None):
+    cache_dir = cache_dir or cache_dir_of(data_dir)
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    for split, (images_file, labels_file) in IDX_FILES.items():
+        images = read_idx(os.path.join(data_dir, images_file))
+        images = images.reshape(images.shape[0], -1).astype(np.float32)
+        images *= 1.0 / 255.0
+        labels = read_idx(os.path.join(data_dir, labels_file))
+        one_hot = np.zeros((labels.shape[0], NUM_CLASSES), dtype=np.float32)
+        one_hot[np.arange(labels.shape[0]), labels] = 1.0
+        _save(os.path.join(cache_dir, IMAGES_PATTERN % split), images)
+        _save(os.path.join(cache_dir, LABELS_PATTERN % split), one_hot)
+        logger.info('Cached %d %s images under %s' % (images.shape[0], split, cache_dir))
+    return cache_dir
+
+
+def _cache_complete(cache_dir):
+    return all(os.path.isfile(os.path.join(cache_dir, pattern % split))
+               for split in IDX_FILES for pattern in (IMAGES_PATTERN, LABELS_PATTERN))
+
+
+class PermutationBatcher(object):
+    """
+    next_batch() compatible replacement for the input_data DataSet, backed by (memory-mapped) arrays.
+    Returned batches are views into a buffer that is rewritten at the next epoch, so consume them before
+    asking for batch_size more examples than an epoch holds.
+    """
+
+    def __init__(self, images, labels, seed=None):
+        if images.shape[0] != labels.shape[0]:
+            raise ValueError('images(%d) and labels(%d) differ in length' % (images.shape[0], labels.shape[0]))
+        self.images = images
+        self.labels = labels
+        self.num_examples = images.shape[0]
+        self.epochs_completed = 0
+        self._rng = np.random.RandomState(seed)
+        self._epoch_images = None  # allocated on the first next_batch(), test sets are only read as a whole
+        self._epoch_labels = None
+        self._position = self.num_examples
+
+    def _next_epoch(self):
+        if self._epoch_images is None:
+            self._epoch_images = np.empty(self.images.shape, dtype=np.float32)
+            self._epoch_labels = np.empty(self.labels.shape, dtype=np.float32)
+        else:
+            self.epochs_completed += 1
+        order = self._rng.permutation(self.num_examples)
+        np.take(self.images, order, axis=0, out=self._epoch_images)
+        np.take(self.labels, order, axis=0, out=self._epoch_labels)
+        self._position = 0
+
+    def next_batch(self, batch_size):
+        if batch_size > self.num_examples:
+            raise ValueError('batch_size %d exceeds the %d examples of the dataset' % (batch_size,
+                                                                                        self.num_examples))
+        start = self._position
+        end = start + batch_size
+        if end <= self.num_examples:
+            self._position = end
+            return self._epoch_images[start:end], self._epoch_labels[start:end]
+        # The batch straddles two epochs: keep the tail of this one, then start the next.
+        if start == self.num_examples:
+            self._next_epoch()
+            self._position = batch_size
+            return self._epoch_images[:batch_size], self._epoch_labels[:batch_size]
+        tail_images = self._epoch_images[start:].copy()
+        tail_labels = self._epoch_labels[start:].copy()
+        self._next_epoch()
+        head = batch_size - tail_images.shape[0]
+        self._position = head
+        return (np.concatenate((tail_images, self._epoch_images[:head])),
+                np.concatenate((tail_labels, self._epoch_labels[:head])))
+
+
+def read_data_sets(data_dir, validation_size=5000, seed=None):
+    """
+    Drop-in replacement for input_data.read_data_sets(data_dir, one_hot=True) reading the .npy cache.
+    The cache is built from the IDX files of data_dir on first use.
+    :return: Datasets(train, validation, test) of PermutationBatcher
+    """
+    cache_dir = cache_dir_of(data_dir)
+    if not _cache_complete(cache_dir):
+        build_cache(data_dir, cache_dir)
+    arrays = {}
+    for split in IDX_FILES:
+        arrays[split] = (np.load(os.path.join(cache_dir, IMAGES_PATTERN % split), mmap_mode='r'),
+                         np.load(os.path.join(cache_dir, LABELS_PATTERN % split), mmap_mode='r'))
+    train_images, train_labels = arrays['train']
+    test_images, test_labels = arrays['test']
+    return Datasets(train=PermutationBatcher(train_images[validation_size:], train_labels[validation_size:], seed),
+                    validation=PermutationBatcher(train_images[:validation_size], train_labels[:validation_size],
+                                                  seed),
+                    test=PermutationBatcher(test_images, test_labels, seed))
+
+
+if __name__ == '__main__':
+    import argparse
+    logging.basicConfig(level=logging.DEBUG)
+    parser = argparse.ArgumentParser(description='Convert the MNIST IDX files into a memory-mapped .npy cache')
+    parser.add_argument('-data_dir', '--data_dir', help='directory holding the gzipped IDX files')
+    parser.add_argument('-output', '--output', help='cache directory, default: <data_dir>/npy', default=None)
+    args = parser.parse_args()
+    build_cache(args.data_dir, args.output)
@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+""" pipeline_budget.py: Size shuffle and prefetch buffers of an input pipeline from a host-RAM budget.
+
+The shuffle buffer holds raw examples (e.g. encoded JPEG records) while the prefetch buffer holds
+preprocessed batches, so both sizes are derived from the per-example byte sizes instead of a fixed
+multiplier. The estimate is printed in the training log so it ends up in the results; a script with one
+pipeline per tower prints one line per pipeline and the results report their sum.
+"""
+
+from collections import namedtuple
+
+MB = 1024 * 1024
+DEFAULT_BUDGET_MB = 4096
+PIPELINE_MEMORY_TEMPLATE = 'input_pipeline_memory_bytes: %d'
+
+PipelineSizes = namedtuple('PipelineSizes', ['shuffle_examples', 'prefetch_batches', 'memory_bytes'])
+
+
+def size_pipeline(budget_bytes, example_bytes, preprocessed_example_bytes, batch_size, num_preprocess_threads,
+                  max_shuffle_examples=None, max_prefetch_batches=4):
+    """
+    Split budget_bytes between the prefetch buffer (whole batches) and the shuffle buffer.
+    Prefetch gets up to max_prefetch_batches batches (at least one), the rest goes to shuffling.
+    :param budget_bytes: host RAM the pipeline may use
+    :param example_bytes: bytes of one element of the shuffle buffer
+    :param preprocessed_example_bytes: bytes of one example after preprocessing
+    :param batch_size: examples per batch
+    :param num_preprocess_threads: examples being preprocessed concurrently
+    :param max_shuffle_examples: upper bound of the shuffle buffer, e.g. the dataset size
+    :param max_prefetch_batches: upper bound of the prefetch buffer
+    :return: PipelineSizes
+    """
+    batch_bytes = batch_size * preprocessed_example_bytes
+    in_flight_bytes = num_preprocess_threads * preprocessed_example_bytes
+    min_bytes = batch_bytes + in_flight_bytes + batch_size * example_bytes
+    if budget_bytes < min_bytes:
+        raise ValueError('Input memory budget of %.1f MB is too small, at least %.1f MB are needed for batch size %d'
+                         % (float(budget_bytes) / MB, float(min_bytes) / MB, batch_size))
+
+    prefetch_batches = 1
+    while prefetch_batches < max_prefetch_batches and \
+            (prefetch_batches + 1) * batch_bytes + in_flight_bytes + batch_size * example_bytes <= budget_bytes / 2:
+        prefetch_batches += 1
+
+    shuffle_examples = (budget_bytes - prefetch_batches * batch_bytes - in_flight_bytes) // example_bytes
+    if max_shuffle_examples:
+        shuffle_examples = min(shuffle_examples, max_shuffle_examples)
+    shuffle_examples = int(max(shuffle_examples, batch_size))
+    memory_bytes = shuffle_examples * example_bytes + prefetch_batches * batch_bytes + in_flight_bytes
+    return PipelineSizes(shuffle_examples, prefetch_batches, int(memory_bytes))
@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+""" device_specs.py: Peak arithmetic throughput and memory bandwidth of the benchmarked GPUs.
+
+Peaks are the vendor numbers at boost clock, per GPU as nvidia-smi lists them (a K80 board is two GPUs). fp16 is
+the tensor core peak on Volta and Turing and the (slow) native half rate on consumer Pascal parts; None means the
+GPU has no fp16 arithmetic and fp16 models compute in fp32 there.
+
+CPU rows use the peaks of the host CPUs, CPU_PEAK_TFLOPS and CPU_MEMORY_BANDWIDTH_GBS of globalconfig.py if they
+are set and measured otherwise (see cpu_spec).
+
+roofline() places a training step on the roofline of its devices: with I the FLOPs per byte of memory traffic
+of the step, the attainable throughput is min(peak, I * bandwidth). A step left of the ridge point
+(I < peak / bandwidth) is bandwidth-bound and only gets faster with fewer bytes per FLOP (fusion, fp16, larger
+tiles); right of it, it is compute-bound and achieved_tflops far below the ceiling is worth optimizing.
+"""
+
+import os
+import time
+from collections import namedtuple
+
+import numpy as np
+
+import globalconfig
+from nvidiasmi import GPU
+from cpu import get_cpu_model_name, get_cpu_flags, get_physical_core_count, get_cpu_max_mhz
+import logging
+logger = logging.getLogger(__name__ if __name__ != '__main__' else os.path.splitext(os.path.basename(__file__))[0])
+logger.setLevel(logging.DEBUG)
+
+DeviceSpec = namedtuple('DeviceSpec', ['fp32_tflops', 'fp16_tflops', 'memory_bandwidth_gbs'])
+
+# Keyed by a part of the nvidia-smi name, the longest matching key wins ('GTX 1080 Ti' over 'GTX 1080').
+GPU_SPECS = {
+    'K80': DeviceSpec(4.37, None, 240.0),
+    'M40': DeviceSpec(7.0, None, 288.0),
+    'GTX TITAN X': DeviceSpec(6.6, None, 336.0),
+    'P100-PCIE': DeviceSpec(9.3, 18.7, 732.0),
+    'P100-SXM2': DeviceSpec(10.6, 21.2, 732.0),
+    'P40': DeviceSpec(12.0, 0.19, 346.0),
+    'GTX 1080': DeviceSpec(8.9, 0.14, 320.0),
+    'GTX 1080 Ti': DeviceSpec(11.3, 0.18, 484.0),
+    'TITAN X (Pascal)': DeviceSpec(11.0, 0.17, 480.0),
+    'TITAN Xp': DeviceSpec(12.1, 0.19, 548.0),
+    'V100-PCIE': DeviceSpec(14.0, 112.0, 900.0),
+    'V100-SXM2': DeviceSpec(15.7, 125.0, 900.0),
+    'Tesla T4': DeviceSpec(8.1, 65.0, 320.0),
+}
+
+CPU_PREFIX = 'cpu:'
+BANDWIDTH_TEST_BYTES = 256 * 1024 * 1024
+COMPUTE_BOUND = 'compute'
+BANDWIDTH_BOUND = 'bandwidth'
+
+_cpu_specs = []
+
+
+def device_model(dev_id):
+    """nvidia-smi name of the first GPU of dev_id, 'cpu:<model name>' for -1."""
+    first_id = str(dev_id).split(',')[0]
+    if first_id == '-1':
+        return CPU_PREFIX + get_cpu_model_name()
+    try:
+        return GPU(first_id).query('name')[0]
+    except Exception as e:
+        logger.warning('Could not query GPU %s: %s' % (first_id, e))
+        return 'unknown'
+
+
+def _flops_per_cycle(flags):
+    """fp32 FLOPs per cycle and core: SIMD lanes, x2 for fused multiply-add, x2 FMA units on AVX2 and AVX-512."""
+    if 'avx512f' in flags:
+        return 64
+    if 'avx2' in flags and 'fma' in flags:
+        return 32
+    if 'avx' in flags:
+        return 16
+    return 8
+
+
+def measure_memory_bandwidth(size=BANDWIDTH_TEST_BYTES, repeats=5):
+    """
+    GB/s of the fastest of repeats copies of a size bytes array, counting the bytes read and written (STREAM copy).
+    One thread copies, so this is a lower bound on hosts with several memory controllers.
+    """
+    source = np.ones(size // 4, dtype=np.float32)
+    target = np.empty_like(source)
+    best = None
+    for _ in range(repeats):
+        start = time.time()
+        np.copyto(target, source)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return 2.0 * source.nbytes / max(best, 1e-9) / 1e9
+
+
+def cpu_spec():
+    """
+    DeviceSpec of the host CPUs. Peaks not configured in globalconfig.py are measured, once per process: the fp32
+    peak as physical cores x max clock x FLOPs per cycle of the widest SIMD unit, the bandwidth by copying arrays.
+    """
+    if not _cpu_specs:
+        peak = globalconfig.CPU_PEAK_TFLOPS
+        if peak is None:
+            mhz = get_cpu_max_mhz()
+            peak = get_physical_core_count() * mhz * 1e6 * _flops_per_cycle(get_cpu_flags()) / 1e12 if mhz else None
+        bandwidth = globalconfig.CPU_MEMORY_BANDWIDTH_GBS
+        if bandwidth is None:
+            bandwidth = measure_memory_bandwidth()
+        _cpu_specs.append(DeviceSpec(peak, None, bandwidth))
+        logger.info('CPU peaks: %s TFLOPS fp32, %.1f GB/s' % (peak, bandwidth))
+    return _cpu_specs[0]
+
+
+def lookup(model):
+    """DeviceSpec of a device_model() name, None if it is not in GPU_SPECS. CPU models get cpu_spec()."""
+    if model.startswith(CPU_PREFIX):
+        return cpu_spec()
+    keys = [key for key in GPU_SPECS if key in model]
+    if not keys:
+        return None
+    return GPU_SPECS[max(keys, key=len)]
+
+
+def peak_tflops(model, precision='fp32'):
+    spec = lookup(model)
+    if spec is None:
+        return None
+    if precision == 'fp16' and spec.fp16_tflops is not None:
+        return spec.fp16_tflops
+    return spec.fp32_tflops
+
+
+def efficiency(flops_per_step, step_time, model, precision='fp32', device_count=1):
+    """
+    Achieved TFLOPS of a training run and its fraction of the peak of its devices.
+    :param flops_per_step: forward plus backward FLOPs of one step of all devices (see flops.py)
+    :param step_time: seconds of one step
+    :return: (achieved TFLOPS, fraction of peak) as strings, '-' when unknown
+    """
+    try:
+        achieved = float(flops_per_step) / float(step_time) / 1e12
+    except (TypeError, ValueError, ZeroDivisionError):
+        return '-', '-'
+    peak = peak_tflops(model, precision)
+    if not peak:
+        return '%.3f' % achieved, '-'
+    return '%.3f' % achieved, '%.3f' % (achieved / (peak * device_count))
+
+
+def roofline(flops_per_step, bytes_per_step, model, precision='fp32', device_count=1):
+    """
+    Place a training step on the roofline of its devices, see the module docstring.
+    :param bytes_per_step: memory traffic of one step of all devices (see flops.py)
+    :return: (FLOPs per byte, attainable TFLOPS of all devices, COMPUTE_BOUND or BANDWIDTH_BOUND) as strings,
+        '-' when unknown
+    """
+    try:
+        intensity = float(flops_per_step) / float(bytes_per_step)
+    except (TypeError, ValueError, ZeroDivisionError):
+        return '-', '-', '-'
+    spec = lookup(model)
+    peak = peak_tflops(model, precision)
+    if not peak or not spec.memory_bandwidth_gbs:
+        return '%.2f' % intensity, '-', '-'
+    bandwidth_ceiling = intensity * spec.memory_bandwidth_gbs / 1e3
+    bound = COMPUTE_BOUND if peak <= bandwidth_ceiling else BANDWIDTH_BOUND
+    return '%.2f' % intensity, '%.3f' % (min(peak, bandwidth_ceiling) * device_count), bound
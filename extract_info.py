@@ -1,30 +1,96 @@
+import os
 import re
-from datetime import datetime, timedelta
+import time
+from collections import namedtuple
+from datetime import datetime
 import numpy as np
 import argparse
 
+_PARSERS = {}
 
-def _time_delta_in_second(time_str0, time_str1, split='.'):
-    format = '%H:%M:%S'
+
+class ParseResult(namedtuple('ParseResult', ['framework', 'total_time', 'batch_time', 'epochs', 'accuracies',
+                                             'losses'])):
+    """
+    What every registered log parser returns.
+    total_time and batch_time are seconds (None when the log does not tell), epochs, accuracies and losses are
+    per-epoch arrays of the same length with nan for values a framework does not log. Caffe logs evaluate per
+    test interval, their epochs are iterations.
+    """
+
+    def seq_str(self):
+        """The former epoch:accuracy:loss,... string of the extractors."""
+        return ','.join('%s:%s:%s' % (epoch, _format(accuracy), _format(loss))
+                        for epoch, accuracy, loss in zip(self.epochs, self.accuracies, self.losses))
+
+
+def _format(value):
+    return '-' if value is None or np.isnan(value) else '%g' % value
+
+
+def _per_epoch(framework, total_time, batch_time, rows):
+    """ParseResult of (epoch, accuracy, loss) rows, accuracy and loss strings or numbers, '-' or '_' if missing."""
+    def number(value):
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return np.nan
+    return ParseResult(framework, total_time, batch_time,
+                       np.array([int(float(r[0])) for r in rows], dtype=np.int64),
+                       np.array([number(r[1]) for r in rows], dtype=np.float64),
+                       np.array([number(r[2]) for r in rows], dtype=np.float64))
+
+
+def register_parser(framework):
+    """Decorator registering parser(filename, **options) -> ParseResult as the log parser of framework."""
+    def register(parser):
+        _PARSERS[framework.lower()] = parser
+        return parser
+    return register
+
+
+def registered_parsers():
+    return sorted(_PARSERS)
+
+
+def parse_log(filename, framework, **options):
+    """ParseResult of the log of framework, see register_parser."""
+    parser = _PARSERS.get(framework.lower())
+    if parser is None:
+        raise ValueError('No log parser for %s (registered: %s)' % (framework, ', '.join(registered_parsers())))
+    return parser(filename, **options)
+
+
+def _seconds_of_day(time_strs, split='.'):
+    """
+    Clock times as seconds since midnight.
+    :param time_strs: 'HH:MM:SS' strings followed by split and a fraction of a second when split is given
+    """
     if split:
-        format = '%H:%M:%S' + split + '%f'
-    time0 = datetime.strptime(time_str0, format)
-    time1 = datetime.strptime(time_str1, format)
-    if time0 > time1:
-        time0 = time0 - timedelta(hours=24)
-    total_seconds = (time1 - time0).total_seconds()
-    return total_seconds
+        parts = [t.split(split, 1) + ['0'] for t in time_strs]
+        clocks = [p[0] for p in parts]
+        fractions = np.array([float('0.' + p[1]) for p in parts])
+    else:
+        clocks = time_strs
+        fractions = 0.0
+    hms = np.array([c.split(':') for c in clocks], dtype=np.float64).reshape(-1, 3)
+    return hms.dot([3600.0, 60.0, 1.0]) + fractions
+
+
+def _elapsed_seconds(time_strs, split='.'):
+    """Seconds between consecutive clock times, a negative step being a wrap past midnight."""
+    deltas = np.diff(_seconds_of_day(time_strs, split))
+    deltas[deltas < 0] += 24 * 3600
+    return deltas
+
+
+def _time_delta_in_second(time_str0, time_str1, split='.'):
+    return float(_elapsed_seconds([time_str0, time_str1], split)[0])
 
 
 def _calculate_average_caffe(lines):
-    average = 0.0
-    for i in range(1, len(lines)):
-        time_delta = _time_delta_in_second(lines[i - 1].split()[1], lines[i].split()[1])
-        average += time_delta
-    average_loss = 0.0
-    for line in lines:
-        average_loss += float(line.split()[-1])
-    average_loss /= len(lines)
+    average = _elapsed_seconds([line.split()[1] for line in lines]).sum()
+    average_loss = np.mean([float(line.split()[-1]) for line in lines])
     iterations = int(lines[1].split()[5].strip(',')) - int(lines[0].split()[5].strip(','))
     return average / (len(lines) - 1) / iterations, average_loss
 
@@ -34,31 +100,25 @@ def print_arguments(info):
     # return '-t %.6f -a %.6f -I %s' % info
 
 
+@register_parser('caffe')
 def extract_info_caffe(filename):
     """
     Use for caffe1.0.0
     """
-    f = open(filename)
-    content = f.readlines()
-    useful_lines = []
+    with open(filename) as f:
+        content = f.readlines()
     accuracies = []
-    is_cpu = False
     average_times = []
     loss_indexes = []
     all_losses = []
     for index, line in enumerate(content):
-        if line.find('Use CPU') > 0:
-            is_cpu = True
         if line.find('solver.cpp:218') > 0:
-            useful_lines.append(line)
             items = line.split(' ')
             iteration_idx = items.index('Iteration') + 1
-            iteration = items[iteration_idx]
             average_time = float(items[iteration_idx + 3].split('s/')[0])
             average_times.append(average_time)
             loss = float(items[-1].split('\n')[0])
             all_losses.append(loss)
-            # accuracies.append((iteration, '-', loss))
         if line.find('Testing net ') > 0:
             items = line.split(' ')
             iteration_idx = items.index('Iteration') + 1
@@ -66,26 +126,22 @@ def extract_info_caffe(filename):
     start_index = loss_indexes[0]
     for i in loss_indexes[1:]:
         end_index = i
-        iteration = i
         loss = np.mean(all_losses[start_index:end_index])
-        accuracies.append((iteration, '-', loss))
+        accuracies.append((i, '-', loss))
         start_index = end_index
 
-    # print average_times
     average_time = np.average(average_times)
     try:
         total_time = _time_delta_in_second(content[0].split()[1], content[-1].split()[1])
-    except:
+    except (IndexError, ValueError):
         total_time = _time_delta_in_second(content[0].split()[1], content[-3].split()[1])
-    seq_str = accuracies
-    seq_str = ','.join(['%s:%s:%s' % item for item in accuracies])
-    # print seq_str
-    return total_time, average_time, seq_str
+    return _per_epoch('caffe', total_time, average_time, accuracies)
 
 
+@register_parser('cntk')
 def extract_info_cntk(filename):
-    f = open(filename)
-    content = f.readlines()
+    with open(filename) as f:
+        content = f.readlines()
     useful_lines = []
     for index, line in enumerate(content):
         if line.find('Finished Epoch') >= 0:
@@ -108,96 +164,297 @@ def extract_info_cntk(filename):
             average_time += float(time_str)
             valid_line += 1
             loss = float(line.split('=')[1].split('*')[0].strip())
-            accuracies.append((index, loss))
-        except:
+            accuracies.append((index, '-', loss))
+        except (IndexError, ValueError):
             pass
-        # if index % gpu_count == 0:
-        #    loss = float(line.split('=')[1].split('*')[0].strip())
-        #    accuracies.append((index, loss))
 
     average_epoch_time = average_time / valid_line
     total_time = float(content[-1].split(':')[1])
     average_batch_time = average_epoch_time / ((epoch_size + actual_batch_size - 1) / actual_batch_size)
+    return _per_epoch('cntk', total_time, average_batch_time, accuracies)
 
-    seq_str = ','.join(['%s:-:%s' % item for item in accuracies])
-    return total_time, average_batch_time, seq_str
 
-
-def extract_info_mxnet(filename):
-    f = open(filename)
-    content = f.readlines()
-    average_batch_time = 0.0
-    total_time = 0
-    seq_str = None
+@register_parser('mxnet')
+def extract_info_mxnet(filename, num_epochs=None):
+    """:param num_epochs: epochs the timing covers, the number of epoch timings in the log by default"""
+    with open(filename) as f:
+        content = f.readlines()
+    epoch_times = []
     batch_size = int(content[0].split('=')[1].split(',')[0])
     s = content[0]
     epoch_size = int(s[s.find('num_examples=') + len('num_examples='):].split(',')[0])
     accuracies = []
     for index, line in enumerate(content):
         if line.find('Time cost=') >= 0:
-            average_batch_time += float(line.split('=')[1])
+            epoch_times.append(float(line.split('=')[1]))
         if line.find('Validation-cross-entropy=') >= 0:
             epoch_index = line[line.find('Epoch[') + len('Epoch['):].split(']')[0]
             loss = content[index - 4].split('=')[1].strip('\n')
             accuracy = content[index - 1].split('=')[1].strip('\n')
             accuracies.append((epoch_index, accuracy, loss))
 
-    average_batch_time = (average_batch_time / 40) / (epoch_size / batch_size)
-    seq_str = ','.join(['%s:%s:%s' % item for item in accuracies])
+    average_batch_time = (sum(epoch_times) / (num_epochs or len(epoch_times))) / (epoch_size / batch_size)
     total_time = _time_delta_in_second(content[0].split()[1], content[-1].split()[1], split=',')
-    return total_time, average_batch_time, seq_str
+    return _per_epoch('mxnet', total_time, average_batch_time, accuracies)
+
+
+# Metrics of the tensorflow scripts, one per printed line: (name, marker, pattern, keep, convert). marker is a
+# plain substring the line must contain before the pattern is tried. keep is 'first', 'last' or 'all' matches.
+TENSORFLOW_METRICS = [
+    ('average_batch_time', 'average_batch_time:', re.compile('average_batch_time:\s*(\S+)'), 'last', float),
+    ('total_time', 'finished with execute time', re.compile('finished with execute time:\s*(\S+)'), 'last', float),
+    ('epoch_info', 'epoch_info:', re.compile('epoch_info:\s*(.*)'), 'last', str),
+    # e.g. Forward-backward across 50 steps, 0.698 +/- 0.100 sec / batch
+    ('synthetic_batch_time', 'across', re.compile('across \d+ steps, (\d+\.\d+) .+'), 'first', float),
+    # e.g. 2018-04-08 10:00:00: step 100, loss = 2.30 (5120.0 examples/sec; 0.012 sec/batch)
+    ('step', 'sec/batch', re.compile('step (\d+), .*\((\d+\.\d+) examples/sec; (\d+\.\d+) sec/batch\)'), 'last',
+     tuple),
+    # e.g. input_pipeline_memory_bytes: 4294859120, printed by real-data input pipelines only, once per pipeline
+    ('input_memory_bytes', 'input_pipeline_memory_bytes:', re.compile('input_pipeline_memory_bytes: (\d+)'),
+     'all', int),
+    # e.g. precision: fp16, printed by scripts supporting --use_fp16
+    ('precision', 'precision: ', re.compile('precision: (fp\d+)'), 'first', str),
+    # e.g. data_format: NCHW, printed by the cnn scripts
+    ('data_format', 'data_format: ', re.compile('data_format: (NCHW|NHWC)'), 'first', str),
+    # e.g. xla: scoped, printed by scripts supporting --xla
+    ('xla', 'xla: ', re.compile('xla: (\w+)'), 'first', str),
+    # e.g. compile_time: 12.345678, first step time in excess of the steady-state step time
+    ('compile_time', 'compile_time: ', re.compile('compile_time: (\d+\.\d+)'), 'last', str),
+    # e.g. lstm_impl: block, printed by the lstm script after the cudnn fallback on CPU
+    ('lstm_impl', 'lstm_impl: ', re.compile('lstm_impl: (\w+)'), 'first', str),
+    # e.g. inference_throughput: 12345.6, see frameworks/tensorflow/inference.py
+    ('inference_throughput', 'inference_throughput: ', re.compile('inference_throughput: (\d+\.\d+)'), 'first',
+     str),
+    # e.g. inference_latency_ms: batch=8 p50=1.234 p90=1.456 p99=2.345
+    ('inference_latency', 'inference_latency_ms: ',
+     re.compile('inference_latency_ms: batch=(\d+) p50=(\d+\.\d+) p90=(\d+\.\d+) p99=(\d+\.\d+)'), 'all', tuple),
+    # e.g. loadgen: loop=open concurrency=16 target_qps=500.0 throughput=498.2 mean_batch_size=1.00 p50=1.2 ...
+    ('loadgen_point', 'loadgen: loop=',
+     re.compile('loadgen: loop=(\w+) concurrency=(\d+) target_qps=(\S+) throughput=(\d+\.\d+) .*p99=(\S+)'), 'all',
+     tuple),
+    # e.g. profile: traced steps 20,21,22, excluded from the step time, written to /path/to/config_dir
+    ('profiled_steps', 'profile: traced steps', re.compile('profile: traced steps ([\d,]+)'), 'first', str),
+    # e.g. flops_forward: 123456789, see frameworks/tensorflow/flops.py
+    ('flops_forward', 'flops_forward: ', re.compile('flops_forward: (\d+)'), 'last', int),
+    ('flops_backward', 'flops_backward: ', re.compile('flops_backward: (\d+)'), 'last', int),
+    ('parameters', 'parameters: ', re.compile('parameters: (\d+)'), 'last', str),
+    # not input_pipeline_memory_bytes
+    ('memory_bytes', 'memory_bytes: ', re.compile('(?<!_)memory_bytes: (\d+)'), 'last', str),
+    # e.g. step_times: 0.012345,0.012401,0.012377, steady-state step seconds printed by xla.StepTimer
+    ('step_times', 'step_times: ', re.compile('step_times: ([\d.,]*)'), 'last', str),
+    ('test_accuracy', 'Final test accuracy', re.compile('Final test accuracy (\d+\.\d+)'), 'first', str),
+    ('test_perplexity', 'Test Perplexity:', re.compile('Test Perplexity: (\d+\.\d+)'), 'first', str),
+    # printed by the cnn eval scripts to their own log
+    ('eval_precision', 'precision @ 1', re.compile('precision @ 1 = (\d+\.\d+)'), 'first', str),
+]
+
+
+class TensorflowLogParser(object):
+    """
+    Extracts all TENSORFLOW_METRICS of a log in one pass over its lines, holding no more than the last partial
+    line and the kept values in memory. update() picks up where the previous call stopped, so the parser can
+    tail the log of a running script (see follow()) and still give the final values once it is done:
+
+        parser = TensorflowLogParser(log_path)
+        for name, value in parser.follow(lambda: process.poll() is not None):
+            ...
+        parser.get('average_batch_time')
+    """
+
+    def __init__(self, filepath, metrics=TENSORFLOW_METRICS):
+        self.filepath = filepath
+        self.metrics = metrics
+        self.values = {}
+        self._offset = 0
+        self._partial = ''
+
+    def feed(self, line):
+        """Parse one line. :return: list of (name, value) of the metrics it matched"""
+        events = []
+        for name, marker, pattern, keep, convert in self.metrics:
+            if marker not in line or (keep == 'first' and name in self.values):
+                continue
+            result = pattern.search(line)
+            if not result:
+                continue
+            groups = result.groups()
+            value = convert(groups if convert is tuple else groups[0])
+            if keep == 'all':
+                self.values.setdefault(name, []).append(value)
+            else:
+                self.values[name] = value
+            events.append((name, value))
+        return events
+
+    def update(self, final=False):
+        """
+        Parse the lines appended to the log since the last call.
+        :param final: also parse a last line without a newline, for a log that is complete
+        :return: list of (name, value) of the matched metrics
+        """
+        if not os.path.isfile(self.filepath):
+            return []
+        events = []
+        with open(self.filepath, 'r') as f:
+            f.seek(self._offset)
+            # readline() rather than iteration, which reads ahead and spoils tell() on python 2.
+            for line in iter(f.readline, ''):
+                if not line.endswith('\n') and not final:
+                    self._partial += line
+                    break
+                events += self.feed(self._partial + line)
+                self._partial = ''
+            self._offset = f.tell()
+        if final and self._partial:
+            events += self.feed(self._partial)
+            self._partial = ''
+        return events
+
+    def parse(self):
+        """Parse the whole (rest of the) log. :return: self"""
+        self.update(final=True)
+        return self
+
+    def follow(self, finished, interval=1.0):
+        """
+        Parse the log while it is written, until finished() is true and the rest is parsed.
+        :return: generator of (name, value) of the matched metrics
+        """
+        while not finished():
+            for event in self.update():
+                yield event
+            time.sleep(interval)
+        for event in self.update(final=True):
+            yield event
+
+    def get(self, name, default='-'):
+        return self.values.get(name, default)
+
+
+def _parsed(source):
+    """A parsed TensorflowLogParser of a log path, or the given parser itself."""
+    if isinstance(source, TensorflowLogParser):
+        return source
+    return TensorflowLogParser(source).parse()
 
 
 def extract_info_tensorflow(filename):
-    f = open(filename)
-    content = f.readlines()
-    average_batch_time = 0
-    total_time = 0
-    seq_str = None
-    for index, line in enumerate(content):
-        if line.find('average_batch_time:') >= 0:
-            average_batch_time = float(line.split(':')[1])
-        if line.find('finished with execute time') >= 0:
-            total_time = float(line.split(':')[1].strip())
-        if line.find('epoch_info:') >= 0:
-            seq_str = line[11:-1].strip()
-    if not seq_str:
-        try:
-            seq_str = '40:%s:-' % content[-1].split('=').strip()
-        except:
-            seq_str = '0:-:-'
-    else:
-        seq_split = seq_str.split(',')
-        if len(seq_split) > 2000:
-            new_seq_split = []
-            index = 0
-            for i in range(len(seq_split)):
-                item = seq_split[i].split(':')
-                if int(item[0]) == index:
-                    new_seq_split.append(seq_split[i].strip('\''))
-                    index += 1
-            seq_str = ','.join(new_seq_split)
-            # seq_str = new_seq_split
-    # return average_batch_time, seq_str
-    return average_batch_time
+    """
+    Average batch time of a real-data training log, 0 when missing.
+    :param filename: log path or TensorflowLogParser, as all extract_info_tensorflow_* functions
+    """
+    return _parsed(filename).get('average_batch_time', 0)
+
+
+def extract_info_tensorflow_epoch_info(filepath):
+    """
+    (epoch, loss) pairs of the epoch_info line, e.g. epoch_info: 0:_:2.30,1:_:1.98
+    Runs of more than 2000 entries keep the first entry of every epoch only.
+    """
+    seq_str = _parsed(filepath).get('epoch_info', '')
+    entries = [item.strip('\'').split(':') for item in seq_str.split(',') if item.strip()]
+    if len(entries) > 2000:
+        epochs = []
+        for entry in entries:
+            if int(entry[0]) == len(epochs):
+                epochs.append(entry)
+        entries = epochs
+    return [(int(entry[0]), entry[-1]) for entry in entries]
 
 
 def extract_info_tensorflow_synthetic(filepath):
-    # e.g. Forward-backward across 50 steps, 0.698 +/- 0.100 sec / batch
-    pattern = 'across \d+ steps, (\d+\.\d+) .+'
-    with open(filepath, 'r') as f:
-        content = f.read()
-        result = re.search(pattern, content)
-        average_batch_time = result.group(1)
-        return float(average_batch_time)
-
-
-def extract_info_torch(filename):
-    f = open(filename)
-    content = f.readlines()
-    average_batch_time = 0.0
-    total_time = 0
-    seq_str = None
+    return _parsed(filepath).get('synthetic_batch_time', 0)
+
+
+def extract_info_tensorflow_input_memory(filepath):
+    memory_bytes = _parsed(filepath).get('input_memory_bytes', None)
+    if not memory_bytes:
+        return '-'
+    return '%.1f' % (float(sum(memory_bytes)) / (1024 * 1024))
+
+
+def extract_info_tensorflow_precision(filepath, default='fp32'):
+    return _parsed(filepath).get('precision', default)
+
+
+def extract_info_tensorflow_data_format(filepath):
+    return _parsed(filepath).get('data_format')
+
+
+def extract_info_tensorflow_xla(filepath, default='off'):
+    return _parsed(filepath).get('xla', default)
+
+
+def extract_info_tensorflow_compile_time(filepath):
+    return _parsed(filepath).get('compile_time')
+
+
+def extract_info_tensorflow_inference(filepath):
+    """
+    Inference results printed by frameworks/tensorflow/inference.py.
+    :return: (throughput, p50, p90, p99), every percentile as batch:ms pairs separated by ';', '-' when missing
+    """
+    parser = _parsed(filepath)
+    latencies = parser.get('inference_latency', [])
+    percentiles = ['-', '-', '-']
+    if latencies:
+        percentiles = [';'.join('%s:%s' % (l[0], l[i]) for l in latencies) for i in range(1, 4)]
+    return tuple([parser.get('inference_throughput')] + percentiles)
+
+
+def extract_info_tensorflow_loadgen(filepath):
+    """
+    Load points printed by frameworks/tensorflow/loadgen.py.
+    :return: (highest throughput, p99 per point as c<concurrency>:ms for closed and q<target_qps>:ms for open
+        loop points separated by ';'), '-' when missing
+    """
+    points = _parsed(filepath).get('loadgen_point', [])
+    if not points:
+        return '-', '-'
+    peak = max(points, key=lambda p: float(p[3]))[3]
+    p99 = ';'.join('%s:%s' % ('c' + p[1] if p[0] == 'closed' else 'q' + p[2], p[4]) for p in points)
+    return peak, p99
+
+
+def extract_info_tensorflow_profiled_steps(filepath):
+    return _parsed(filepath).get('profiled_steps').replace(',', ';')
+
+
+def extract_info_tensorflow_flops(filepath):
+    """
+    Cost of a training step printed by frameworks/tensorflow/flops.py.
+    :return: (forward plus backward FLOPs, parameters), '-' when missing
+    """
+    parser = _parsed(filepath)
+    forward, backward = parser.get('flops_forward', None), parser.get('flops_backward', None)
+    flops_per_step = str(forward + backward) if forward is not None and backward is not None else '-'
+    return flops_per_step, parser.get('parameters')
+
+
+def extract_info_tensorflow_memory_bytes(filepath):
+    """Bytes the ops of a training step read and write, see flops.py. '-' when missing."""
+    return _parsed(filepath).get('memory_bytes')
+
+
+def extract_info_tensorflow_step_times(filepath):
+    return [float(t) for t in _parsed(filepath).get('step_times', '').split(',') if t]
+
+
+def extract_info_tensorflow_lstm_impl(filepath):
+    return _parsed(filepath).get('lstm_impl')
+
+
+def extract_info_tensorflow_accuracy(filepath, metric):
+    """Final accuracy of a log, metric is test_accuracy (fcn5), test_perplexity (lstm) or eval_precision (cnn)."""
+    return _parsed(filepath).get(metric, None)
+
+
+@register_parser('torch')
+def extract_info_torch(filename, num_epochs=None):
+    """:param num_epochs: epochs the timing covers, the number of epoch timings in the log by default"""
+    with open(filename) as f:
+        content = f.readlines()
+    epoch_times = []
     batch_size = 0
     epoch_size = 0
     accuracies = []
@@ -210,39 +467,62 @@ def extract_info_torch(filename):
             else:
                 epoch_size = 60000
         if line.find('Epoch time:') >= 0:
-            average_batch_time += float(line.split(':')[-1])
+            epoch_times.append(float(line.split(':')[-1]))
         if line.find('Test accuracy = ') >= 0:
             epoch_index = line.split(':')[3]
             loss = content[index - 15].split(':')[-1].strip('\n').strip()
             accuracy = line.split(':')[-1].strip('\n').strip()
             accuracies.append((epoch_index, accuracy, loss))
 
-    average_batch_time = (average_batch_time / 40) / (int(epoch_size) / int(batch_size))
-    # average_batch_time = average_batch_time * int(batch_size) / int(epoch_size)
-    seq_str = ','.join(['%s:%s:%s' % item for item in accuracies])
+    average_batch_time = (sum(epoch_times) / (num_epochs or len(epoch_times))) / (int(epoch_size) / int(batch_size))
     total_time = _time_delta_in_second(content[0].split()[1], content[-1].split()[1], split=None)
-    return total_time, average_batch_time, seq_str
+    return _per_epoch('torch', total_time, average_batch_time, accuracies)
+
+
+@register_parser('tensorflow')
+def parse_tensorflow(filename):
+    parser = _parsed(filename)
+    batch_time = parser.get('average_batch_time', None)
+    if batch_time is None:
+        batch_time = parser.get('synthetic_batch_time', None)
+    return _per_epoch('tensorflow', parser.get('total_time', None), batch_time,
+                      [(epoch, '-', loss) for epoch, loss in extract_info_tensorflow_epoch_info(parser)])
+
+
+def to_result_row(result, **config):
+    """
+    A row for resultprocess.resultstore.ResultStore.add of a ParseResult.
+    :param config: TestResultFields values the log does not contain, e.g. network_name, batch_size, device_model
+    """
+    accuracies = result.accuracies[~np.isnan(result.accuracies)]
+    row = dict(config)
+    row.update(framework=result.framework,
+               training_speed=result.batch_time if result.batch_time is not None else '-',
+               accuracy=accuracies[-1] if len(accuracies) else '-')
+    return row
 
 
 def extract_info(filename, tool, batch_size=32):
-    tool = tool.lower()
-    if tool == 'caffe':
-        return extract_info_caffe(filename)
-    elif tool == 'cntk':
-        return extract_info_cntk(filename)
-    elif tool == 'mxnet':
-        return extract_info_mxnet(filename)
-    elif tool == 'tensorflow':
-        return extract_info_tensorflow(filename)
-    elif tool == 'torch':
-        return extract_info_torch(filename)
+    """(total_time, batch_time, epoch:accuracy:loss string) of a log of any registered framework."""
+    result = parse_log(filename, tool)
+    return result.total_time or 0.0, result.batch_time or 0.0, result.seq_str()
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Extract information from log file')
     parser.add_argument('-f', '--file', help='Full path of log file')
-    parser.add_argument('-t', '--tool', help='Tool name')
+    parser.add_argument('-t', '--tool', help='Tool name: %s' % ', '.join(registered_parsers()))
+    parser.add_argument('-db', '--store', help='also record the log in this result store', default=None)
+    parser.add_argument('-n', '--network', help='network_name of the recorded row', default='-')
+    parser.add_argument('-b', '--batch_size', help='batch_size of the recorded row', default='-')
+    parser.add_argument('-m', '--device_model', help='device_model of the recorded row', default='-')
     p = parser.parse_args()
     info = extract_info(p.file, p.tool)
     # print info
     print print_arguments(info)
+    if p.store:
+        from resultprocess.resultstore import ResultStore
+        with ResultStore(p.store) as store:
+            store.add(to_result_row(parse_log(p.file, p.tool), network_name=p.network, batch_size=p.batch_size,
+                                    device_model=p.device_model),
+                      recorded_at=datetime.fromtimestamp(os.path.getmtime(p.file)), source=os.path.basename(p.file))
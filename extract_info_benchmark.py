@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+""" extract_info_benchmark.py: Time the registered log parsers of extract_info.py on synthetic logs.
+
+Every fixture writes a log in the format its parser reads, with the given number of epochs and progress lines per
+epoch, so a change of a parser can be checked for speed (best of a few runs, lines per second) and for reading
+every epoch back, e.g.:
+
+  python extract_info_benchmark.py --epochs 90 --lines_per_epoch 2000
+
+The defaults give logs of a few MB, about what a 40 epoch cifar10 run prints.
+"""
+
+import os
+import shutil
+import tempfile
+import time
+import argparse
+from datetime import datetime, timedelta
+
+from extract_info import parse_log, registered_parsers
+import logging
+logger = logging.getLogger(__name__ if __name__ != '__main__' else os.path.splitext(os.path.basename(__file__))[0])
+logger.setLevel(logging.DEBUG)
+
+FIXTURES = {}
+START = datetime(2018, 4, 8, 23, 30, 0)  # runs past midnight, which the parsers must wrap
+BATCH_SIZE = 128
+EPOCH_SIZE = 50000
+
+
+def fixture(framework):
+    """Decorator registering write(f, epochs, lines_per_epoch) as the log writer of framework."""
+    def register(write):
+        FIXTURES[framework] = write
+        return write
+    return register
+
+
+def _clock(step, fmt='%Y-%m-%d %H:%M:%S.%f'):
+    return (START + timedelta(seconds=0.05 * step)).strftime(fmt)
+
+
+@fixture('caffe')
+def _caffe_log(f, epochs, lines_per_epoch):
+    step = 0
+    for epoch in range(epochs + 1):
+        f.write('I0408 %s  4242 solver.cpp:330] Iteration %d, Testing net (#0)\n'
+                % (_clock(step, '%H:%M:%S.%f'), epoch * lines_per_epoch))
+        if epoch == epochs:
+            break
+        for i in range(lines_per_epoch):
+            step += 1
+            f.write('I0408 %s  4242 solver.cpp:218] Iteration %d (20.1 iter/s, 0.0498s/1 iters), loss = %.4f\n'
+                    % (_clock(step, '%H:%M:%S.%f'), epoch * lines_per_epoch + i, 2.3 / (1 + epoch)))
+
+
+@fixture('cntk')
+def _cntk_log(f, epochs, lines_per_epoch):
+    for epoch in range(epochs):
+        for i in range(lines_per_epoch):
+            f.write(' Epoch[%2d of %d]-Minibatch[%4d-%4d]: ce = %.4f * %d; errs = 80.0%% * %d; time = 0.0500s\n'
+                    % (epoch + 1, epochs, i, i + 1, 2.3 / (1 + epoch), BATCH_SIZE, BATCH_SIZE))
+        f.write('Finished Epoch[%2d of %d]: [Training] ce = %.4f * %d; errs = 80.0%% * %d; totalSamplesSeen = %d; '
+                'learningRatePerSample = 0.001; epochTime=%.3fs\n'
+                % (epoch + 1, epochs, 2.3 / (1 + epoch), EPOCH_SIZE, EPOCH_SIZE, EPOCH_SIZE * (epoch + 1), 19.5))
+    f.write('GPU count: 1\nbatch size: %d\ntotal time: %.3f\n' % (BATCH_SIZE, 19.5 * epochs))
+
+
+@fixture('mxnet')
+def _mxnet_log(f, epochs, lines_per_epoch):
+    step = 0
+    f.write('INFO %s Namespace(batch_size=%d, network=resnet, num_examples=%d, num_epochs=%d)\n'
+            % (_clock(step, '%H:%M:%S,%f'), BATCH_SIZE, EPOCH_SIZE, epochs))
+    for epoch in range(epochs):
+        for i in range(lines_per_epoch):
+            step += 1
+            f.write('INFO %s Epoch[%d] Batch [%d]\tSpeed: 2560.00 samples/sec\tTrain-accuracy=0.500000\n'
+                    % (_clock(step, '%H:%M:%S,%f'), epoch, i))
+        for line in ('Train-cross-entropy=%.6f' % (2.3 / (1 + epoch)), 'Time cost=19.500',
+                     'Saved checkpoint', 'Validation-accuracy=0.550000', 'Validation-cross-entropy=1.900000'):
+            f.write('INFO %s Epoch[%d] %s\n' % (_clock(step, '%H:%M:%S,%f'), epoch, line))
+
+
+@fixture('torch')
+def _torch_log(f, epochs, lines_per_epoch):
+    step = 0
+    f.write('%s Options\nbatchSize %d\nnetwork resnet\n' % (_clock(step, '%Y-%m-%d %H:%M:%S'), BATCH_SIZE))
+    for epoch in range(epochs):
+        for i in range(lines_per_epoch):
+            step += 1
+            f.write(' | Epoch: [%d][%d/%d]  Time 0.050  Loss: %.4f\n' % (epoch + 1, i, lines_per_epoch,
+                                                                        2.3 / (1 + epoch)))
+        f.write('Epoch time: 19.500\n')
+        for i in range(13):
+            f.write(' | Test: [%d][%d/13]\n' % (epoch + 1, i))
+        f.write(' * Finished: Test: Epoch: %d: Test accuracy = :55.10\n' % (epoch + 1))
+    f.write('%s Done\n' % _clock(step, '%Y-%m-%d %H:%M:%S'))
+
+
+@fixture('tensorflow')
+def _tensorflow_log(f, epochs, lines_per_epoch):
+    step = 0
+    f.write('precision: fp32\ndata_format: NCHW\nxla: off\nflops_forward: 1234567890\nflops_backward: 2469135780\n'
+            'parameters: 1234567\n')
+    for epoch in range(epochs):
+        for i in range(lines_per_epoch):
+            step += 1
+            f.write('%s: step %d, loss = %.2f (2560.0 examples/sec; 0.050 sec/batch)\n'
+                    % (_clock(step, '%Y-%m-%d %H:%M:%S'), step, 2.3 / (1 + epoch)))
+    f.write('step_times: %s\n' % ','.join(['0.050000'] * min(step, 1000)))
+    f.write('epoch_info: %s\n' % ','.join('%d:_:%.4f' % (epoch, 2.3 / (1 + epoch)) for epoch in range(epochs)))
+    f.write('average_batch_time: 0.050000\nfinished with execute time: %.3f\n' % (0.05 * step))
+
+
+def benchmark(framework, path, epochs, repeats=3):
+    """
+    Parse path repeats times.
+    :return: (best seconds, ParseResult of the last run)
+    """
+    best = None
+    result = None
+    for _ in range(repeats):
+        start = time.time()
+        result = parse_log(path, framework)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    if framework != 'caffe' and len(result.epochs) != epochs:
+        logger.warning('%s: parsed %d of %d epochs' % (framework, len(result.epochs), epochs))
+    return best, result
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description='Time the log parsers of extract_info.py on synthetic logs')
+    parser.add_argument('-t', '--tools', help='comma separated frameworks, all registered ones by default',
+                        default=None)
+    parser.add_argument('--epochs', help='epochs per log', type=int, default=40)
+    parser.add_argument('--lines_per_epoch', help='progress lines per epoch', type=int, default=500)
+    parser.add_argument('-r', '--repeats', help='runs per parser, the best is reported', type=int, default=3)
+    parser.add_argument('--keep', help='keep the generated logs in this directory', default=None)
+    args = parser.parse_args()
+    frameworks = args.tools.split(',') if args.tools else [t for t in registered_parsers() if t in FIXTURES]
+    directory = args.keep or tempfile.mkdtemp(prefix='extract_info_benchmark')
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    try:
+        print('%-12s %10s %10s %10s %14s %8s' % ('framework', 'lines', 'MB', 'seconds', 'lines/sec', 'epochs'))
+        for framework in frameworks:
+            path = os.path.join(directory, '%s.log' % framework)
+            with open(path, 'w') as f:
+                FIXTURES[framework](f, args.epochs, args.lines_per_epoch)
+            with open(path) as f:
+                lines = sum(1 for _ in f)
+            seconds, result = benchmark(framework, path, args.epochs, args.repeats)
+            print('%-12s %10d %10.2f %10.4f %14.0f %8d' % (framework, lines, os.path.getsize(path) / 1e6, seconds,
+                                                           lines / max(seconds, 1e-9), len(result.epochs)))
+    finally:
+        if not args.keep:
+            shutil.rmtree(directory)
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+""" fingerprint.py: A stable key of the hardware and software configuration of this machine.
+
+The fingerprint is a hash of the normalized GPU configuration (get_gpu_config.py: GPU models, memory, driver,
+VBIOS, ECC/persistence mode, power limits), the CPU model and core count, the memory size, the kernel, the CUDA
+version of the driver and of the toolkit, and the cuDNN, Python and TensorFlow versions. Two machines with the
+same fingerprint run the same benchmark on the same setup, so results, cached probes and regression baselines of
+one hold for the other. It changes with any upgrade, which is what a regression comparison across an upgrade
+must not match on.
+
+benchmark.py computes it once per sweep and exports it in FINGERPRINT_ENV to the test processes, every result
+row is tagged with it. The versions come from the system info of the sweep (sysinfo.py), which caches them. Run
+this file to print the fingerprint and what it is made of.
+"""
+
+import os
+import re
+import json
+import hashlib
+import platform
+import xml.etree.ElementTree as ET
+
+from get_gpu_config import query_gpu_config
+from cpu import get_cpu_model_name, get_physical_core_count, get_cpu_count_via_cpuinfo
+import sysinfo
+import logging
+logger = logging.getLogger(__name__ if __name__ != '__main__' else os.path.splitext(os.path.basename(__file__))[0])
+logger.setLevel(logging.DEBUG)
+
+FINGERPRINT_ENV = 'GPU_BENCHMARK_FINGERPRINT'
+FINGERPRINT_FILE_NAME = 'fingerprint.json'
+FINGERPRINT_LENGTH = 16
+UNKNOWN = 'unknown'
+MEMINFO_FILE = '/proc/meminfo'
+
+_machine = []
+
+
+def memory_gb():
+    """Installed memory in whole GiB, MemTotal varies by a few MB with the kernel's reservations."""
+    try:
+        with open(MEMINFO_FILE, 'rb') as f:
+            result = re.search('MemTotal:\s*(\d+) kB', f.read())
+    except (IOError, OSError):
+        return UNKNOWN
+    return int(round(int(result.group(1)) / (1024.0 * 1024.0))) if result else UNKNOWN
+
+
+def cuda_version(gpu_xml=None):
+    """CUDA version of the driver API as nvidia-smi reports it, the toolkit is a component of its own."""
+    if gpu_xml is not None and gpu_xml.findtext('cuda_version'):
+        return gpu_xml.findtext('cuda_version')
+    return UNKNOWN
+
+
+def collect_components():
+    """What the fingerprint is made of, as a dict of strings and numbers."""
+    gpu_config = query_gpu_config()
+    gpu_xml = ET.fromstring(gpu_config) if gpu_config else None
+    info = sysinfo.system_info()
+    return {
+        'gpu_config': hashlib.sha1(gpu_config).hexdigest() if gpu_config else UNKNOWN,
+        'gpus': [gpu.findtext('product_name') for gpu in gpu_xml.findall('gpu')] if gpu_xml is not None else [],
+        'driver': gpu_xml.findtext('driver_version') if gpu_xml is not None else UNKNOWN,
+        'cuda': cuda_version(gpu_xml),
+        'cuda_toolkit': sysinfo.get(info, 'cuda.release', UNKNOWN),
+        'cudnn': sysinfo.get(info, 'cudnn.version', UNKNOWN),
+        'cpu_model': get_cpu_model_name(),
+        'cpu_cores': get_physical_core_count(),
+        'logical_cpus': get_cpu_count_via_cpuinfo(),
+        'memory_gb': memory_gb(),
+        'kernel': platform.release(),
+        'python': platform.python_version(),
+        'tensorflow': sysinfo.get(info, 'tensorflow.version', UNKNOWN),
+    }
+
+
+def fingerprint_of(components):
+    return hashlib.sha1(json.dumps(components, sort_keys=True)).hexdigest()[:FINGERPRINT_LENGTH]
+
+
+def machine_fingerprint():
+    """(fingerprint, components) of this machine, collected once per process."""
+    if not _machine:
+        components = collect_components()
+        _machine.append((fingerprint_of(components), components))
+    return _machine[0]
+
+
+def current():
+    """Fingerprint of this machine, the one benchmark.py exported if there is one."""
+    return os.environ.get(FINGERPRINT_ENV) or machine_fingerprint()[0]
+
+
+def write_fingerprint(output_file):
+    fingerprint, components = machine_fingerprint()
+    with open(output_file, 'w') as f:
+        json.dump({'fingerprint': fingerprint, 'components': components}, f, indent=2, sort_keys=True)
+    return fingerprint
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.DEBUG)
+    machine, parts = machine_fingerprint()
+    print(machine)
+    print(json.dumps(parts, indent=2, sort_keys=True))
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+""" allreduce.py: Gradient aggregation strategies for the in-graph multi-GPU scripts.
+
+All strategies take the per-tower (gradient, variable) lists of optimizer.compute_gradients and return one
+averaged (gradient, variable) list for a single apply_gradients, like average_gradients always did:
+
+  * central      every gradient is summed on the parameter server device (the original behaviour).
+  * round_robin  the sum of the i-th variable's gradients runs on tower i % num_towers, spreading the
+                 reduction traffic over all GPUs instead of funnelling it through one device.
+  * ring         in-graph ring all-reduce: each gradient is split into num_towers chunks which travel
+                 around the ring of tower devices (reduce-scatter, then all-gather), so every link carries
+                 2 * (n - 1) / n of the gradient instead of one device receiving all of them.
+"""
+
+import tensorflow as tf
+
+CENTRAL = 'central'
+ROUND_ROBIN = 'round_robin'
+RING = 'ring'
+STRATEGIES = (CENTRAL, ROUND_ROBIN, RING)
+AGGREGATION_TEMPLATE = 'gradient_aggregation: %s'
+
+
+def _mean(grads):
+    grad = tf.add_n(grads)
+    return tf.multiply(grad, 1.0 / len(grads))
+
+
+def average_gradients(tower_grads):
+    """Calculate the average gradient for each shared variable across all towers.
+
+    Note that this function provides a synchronization point across all towers.
+
+    Args:
+      tower_grads: List of lists of (gradient, variable) tuples. The outer list
+        is over individual gradients. The inner list is over the gradient
+        calculation for each tower.
+    Returns:
+       List of pairs of (gradient, variable) where the gradient has been averaged
+       across all towers.
+    """
+    average_grads = []
+    for single_grads in zip(*tower_grads):
+        grads = [g for g, _ in single_grads]
+        v = single_grads[0][1]
+        average_grads.append((_mean(grads), v))
+    return average_grads
+
+
+def round_robin_gradients(tower_grads, devices):
+    average_grads = []
+    for index, single_grads in enumerate(zip(*tower_grads)):
+        with tf.device(devices[index % len(devices)]):
+            average_grads.append((_mean([g for g, _ in single_grads]), single_grads[0][1]))
+    return average_grads
+
+
+def ring_all_reduce(tensors, devices):
+    """
+    Sum tensors (one per device, same shape) with a ring all-reduce.
+    :return: list with the sum placed on each device, in devices order
+    """
+    n = len(tensors)
+    if n == 1:
+        return list(tensors)
+    shape = tensors[0].get_shape()
+    chunks = []
+    for tensor, device in zip(tensors, devices):
+        with tf.device(device):
+            flat = tf.reshape(tensor, [-1])
+            size = tf.size(flat)
+            padded = tf.pad(flat, [[0, (n - size % n) % n]])
+            chunks.append(tf.split(padded, n))
+
+    # Reduce-scatter: after n - 1 steps device i holds the full sum of chunk (i + 1) % n.
+    for step in range(n - 1):
+        updated = [list(c) for c in chunks]
+        for i in range(n):
+            source = (i - 1) % n
+            index = (i - step - 1) % n
+            with tf.device(devices[i]):
+                updated[i][index] = chunks[i][index] + chunks[source][index]
+        chunks = updated
+
+    # All-gather: pass the reduced chunks around the ring once more.
+    for step in range(n - 1):
+        updated = [list(c) for c in chunks]
+        for i in range(n):
+            source = (i - 1) % n
+            index = (i - step) % n
+            with tf.device(devices[i]):
+                updated[i][index] = tf.identity(chunks[source][index])
+        chunks = updated
+
+    results = []
+    for tensor, device, device_chunks in zip(tensors, devices, chunks):
+        with tf.device(device):
+            flat = tf.concat(device_chunks, 0)[:tf.size(tensor)]
+            results.append(tf.reshape(flat, tf.shape(tensor)))
+            results[-1].set_shape(shape)
+    return results
+
+
+def ring_gradients(tower_grads, devices):
+    """
+    Ring all-reduce of every gradient. Variables are shared by the towers and applied once, so the copy of
+    the first tower is used; the all-gather steps towards the other towers are pruned by the runtime.
+    """
+    average_grads = []
+    for single_grads in zip(*tower_grads):
+        grads = [g for g, _ in single_grads]
+        summed = ring_all_reduce(grads, devices)[0]
+        with tf.device(devices[0]):
+            average_grads.append((tf.multiply(summed, 1.0 / len(grads)), single_grads[0][1]))
+    return average_grads
+
+
+def aggregate_gradients(tower_grads, strategy, devices):
+    """
+    :param tower_grads: list (one per tower) of lists of (gradient, variable)
+    :param strategy: one of STRATEGIES
+    :param devices: tower devices, e.g. ['/gpu:0', '/gpu:1'], in tower order
+    :return: list of (averaged gradient, variable)
+    """
+    if strategy == CENTRAL:
+        return average_gradients(tower_grads)
+    if strategy == ROUND_ROBIN:
+        return round_robin_gradients(tower_grads, devices)
+    if strategy == RING:
+        return ring_gradients(tower_grads, devices)
+    raise ValueError('Unknown gradient aggregation strategy: %s (expected one of %s)'
+                     % (strategy, ', '.join(STRATEGIES)))
+
+
+def print_strategy(strategy):
+    print(AGGREGATION_TEMPLATE % strategy)
@@ -4,6 +4,7 @@ import time
 from datapreprocess import cifar10_input
 
 import tensorflow as tf
+from frameworks.tensorflow import mixed_precision, xla, loadgen, profiler, flops, inference as inference_bm
 import numpy as np
 import os
 import globalconfig
@@ -35,7 +36,14 @@ tf.app.flags.DEFINE_boolean('use_fp16', False,
 tf.app.flags.DEFINE_boolean('log_device_placement', False,
                             """Whether to log device placement.""")
 tf.app.flags.DEFINE_boolean('use_dataset', False, """True to use datasets""")
-tf.app.flags.DEFINE_boolean('data_format', 'NCHW', """NCHW for GPU and NHWC for CPU.""")
+tf.app.flags.DEFINE_string('xla', xla.OFF, """XLA JIT mode: off, global or scoped.""")
+tf.app.flags.DEFINE_string('data_format', '', """NCHW or NHWC, empty for NCHW on GPU and NHWC on CPU.""")
+tf.app.flags.DEFINE_boolean('inference', False, """Time the frozen forward-only graph instead of training.""")
+tf.app.flags.DEFINE_string('inference_batch_sizes', inference_bm.LATENCY_BATCH_SIZES,
+                           """Batch sizes of the inference latency percentiles.""")
+tf.app.flags.DEFINE_integer('inference_steps', inference_bm.DEFAULT_STEPS, """Timed runs per inference batch size.""")
+loadgen.define_flags()
+profiler.define_flags()
 
 data_format = 'NCHW'
 data_format_c = 'channels_first'
@@ -67,7 +75,7 @@ def _conv(inpOp, nIn, nOut, kH, kW, dH, dW, padType):
                                 kernel_initializer=kernel_initializer,
                                 use_bias=False)
         biases = tf.get_variable(
-            'biases', [nOut], tf.float32,
+            'biases', [nOut], mixed_precision.compute_dtype(FLAGS.use_fp16),
             tf.constant_initializer(0.0))
 
         bias = tf.reshape(tf.nn.bias_add(conv, biases, data_format=data_format),
@@ -101,10 +109,10 @@ def _affine(inpOp, nIn, nOut):
     with tf.name_scope(name) as scope:
         kernel = tf.get_variable(
             'weights', [nIn, nOut],
-            tf.float32,
+            mixed_precision.compute_dtype(FLAGS.use_fp16),
             tf.truncated_normal_initializer(stddev=1e-2))
         biases = tf.get_variable('biases', [nOut],
-                                 tf.float32,
+                                 mixed_precision.compute_dtype(FLAGS.use_fp16),
                                  tf.constant_initializer(0.1))
         logits = tf.matmul(inpOp, kernel) + biases
         return tf.nn.relu(logits, name=name)
@@ -136,6 +144,7 @@ def _avgpool(inpOp, kH, kW, dH, dW):
 
 
 def loss(logits, labels):
+    logits = tf.cast(logits, tf.float32)  # softmax in fp32 under --use_fp16 too
     cross_entropy = tf.nn.softmax_cross_entropy_with_logits(logits=logits,
                                                             labels=labels,
                                                             name='xentropy')
@@ -170,23 +179,35 @@ def inference(images):
     return affn1
 
 
-def train():
-    global parameters
-
-    # Change format to NCHW if that is the data format passed or CP
-    if FLAGS.data_format == 'NHWC' or FLAGS.device_id == -1:
+def select_data_format():
+    # Change format to NHWC if that is the data format passed, or on CPU unless a format was passed
+    if FLAGS.data_format == 'NHWC' or (not FLAGS.data_format and FLAGS.device_id == -1):
         global data_format, data_format_c
         data_format = 'NHWC'
         data_format_c = 'channels_last'
 
+
+def get_session_config(device_str):
     config = tf.ConfigProto(allow_soft_placement=True, log_device_placement=FLAGS.log_device_placement)
     config.intra_op_parallelism_threads = 1
     config.inter_op_parallelism_threads = 0
-    device_str = get_device_str(FLAGS.device_id)
+    mixed_precision.print_precision(FLAGS.use_fp16)
+    print('data_format: %s' % data_format)
     if device_str.find('cpu') >= 0:  # cpu version
         num_threads = os.getenv('OMP_NUM_THREADS', 1)
         print 'num_threads: ', num_threads
         config = tf.ConfigProto(allow_soft_placement=True, intra_op_parallelism_threads=int(num_threads))
+    xla.configure_session(config, FLAGS.xla)
+    xla.print_mode(FLAGS.xla)
+    return config
+
+
+def train():
+    global parameters
+
+    select_data_format()
+    device_str = get_device_str(FLAGS.device_id)
+    config = get_session_config(device_str)
     with tf.Graph().as_default(), tf.device(device_str), tf.Session(config=config) as sess:
         initalizer = None
         images = None
@@ -199,11 +220,15 @@ def train():
                 images, labels = cifar10_input.inputs(False, FLAGS.data_dir, FLAGS.batchSize, data_format=data_format)
 
         labels = tf.contrib.layers.one_hot_encoding(labels, 10)
-        logits = inference(images)
-        # Add a simple objective so we can calculate the backward pass.
-        loss_value = loss(logits, labels)
+        images = tf.cast(images, mixed_precision.compute_dtype(FLAGS.use_fp16))
+        with mixed_precision.model_variable_scope(FLAGS.use_fp16), xla.jit_scope(FLAGS.xla):
+            logits = inference(images)
+            # Add a simple objective so we can calculate the backward pass.
+            loss_value = loss(logits, labels)
         # Compute the gradient with respect to all the parameters.
-        grad = tf.train.MomentumOptimizer(FLAGS.learning_rate, 0.9).minimize(loss_value)
+        loss_scaler = mixed_precision.LossScaler(FLAGS.use_fp16)
+        grad = loss_scaler.minimize(tf.train.MomentumOptimizer(FLAGS.learning_rate, 0.9), loss_value)
+        flops.print_cost(tf.get_default_graph(), FLAGS.batchSize)
 
         # Create a saver.
         saver = tf.train.Saver(tf.global_variables())
@@ -222,16 +247,18 @@ def train():
         real_batch_size = FLAGS.batchSize
         num_batches_per_epoch = int((FLAGS.epoch_size + real_batch_size - 1) / real_batch_size)
         iterations = FLAGS.epochs * num_batches_per_epoch
-        average_batch_time = 0.0
+        step_timer = xla.StepTimer()
+        step_profiler = profiler.StepProfiler.from_flags()
 
         epochs_info = []
         average_loss = 0.0
         for step in xrange(iterations):
             start_time = time.time()
-            _, loss_v = sess.run([grad, loss_value])
+            _, loss_v = sess.run([grad, loss_value], **step_profiler.run_kwargs())
             duration = time.time() - start_time
             average_loss += loss_v
-            average_batch_time += float(duration)
+            if not step_profiler.end_step():
+                step_timer.add(duration)
             assert not np.isnan(loss_v), 'Model diverged with loss = NaN'
             if step % FLAGS.log_step == 0:
                 examples_per_sec = FLAGS.batchSize / duration
@@ -249,16 +276,42 @@ def train():
         if not FLAGS.use_dataset:
             coord.request_stop()
             coord.join(threads)
-        average_batch_time /= iterations
+        step_profiler.save(sess.graph)
+        average_batch_time = step_timer.average_step_time()
         summary = 'average_batch_time: ' + str(average_batch_time)
         print summary
+        step_timer.print_compile_time()
+        step_timer.print_step_times()
         print ('epoch_info: %s' % ','.join(epochs_info))
 
 
+def build_inference(batch_size):
+    shape = inference_bm.image_shape(batch_size, data_format, cifar10_input.IMAGE_SIZE)
+    images = tf.placeholder(tf.float32, shape, name='images')
+    with mixed_precision.model_variable_scope(FLAGS.use_fp16), xla.jit_scope(FLAGS.xla):
+        logits = inference(tf.cast(images, mixed_precision.compute_dtype(FLAGS.use_fp16)))
+    probabilities = tf.nn.softmax(tf.cast(logits, tf.float32))
+    return {images: np.random.rand(*shape).astype(np.float32)}, probabilities
+
+
+def run_inference():
+    select_data_format()
+    device_str = get_device_str(FLAGS.device_id)
+    config = get_session_config(device_str)
+    if FLAGS.loadgen:
+        loadgen.run_from_flags(build_inference, device_str, config)
+    else:
+        inference_bm.run(build_inference, FLAGS.batchSize, device_str, config,
+                         batch_sizes=FLAGS.inference_batch_sizes, steps=FLAGS.inference_steps)
+
+
 def main(_):
     os.environ['TF_SYNC_ON_FINISH'] = '0'
     os.environ['TF_ENABLE_WINOGRAD_NONFUSED'] = '1'
-    train()
+    if FLAGS.inference or FLAGS.loadgen:
+        run_inference()
+    else:
+        train()
 
 
 if __name__ == '__main__':
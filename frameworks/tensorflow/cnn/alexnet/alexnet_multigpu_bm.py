@@ -5,6 +5,7 @@ from datapreprocess import cifar10_input
 #import unpickle as cifar10_input
 
 import tensorflow as tf
+from frameworks.tensorflow import mixed_precision, allreduce, xla, profiler, flops
 import numpy as np
 import os
 
@@ -41,7 +42,11 @@ tf.app.flags.DEFINE_boolean('log_device_placement', True,
                             """Whether to log device placement.""")
 tf.app.flags.DEFINE_integer('num_gpus', 2, """How many GPUs to use.""")
 tf.app.flags.DEFINE_string('local_ps_device', 'GPU', """Local parameter server GPU if gpus are peered or CPU otherwise try both.""")
+tf.app.flags.DEFINE_string('gradient_aggregation', allreduce.CENTRAL,
+                           """How tower gradients are summed: central, round_robin or ring.""")
 tf.app.flags.DEFINE_boolean('use_dataset', False, """True to use datasets""")
+tf.app.flags.DEFINE_string('xla', xla.OFF, """XLA JIT mode: off, global or scoped.""")
+profiler.define_flags()
 
 TEST_SIZE = 10000
 
@@ -76,7 +81,7 @@ def _conv(inpOp, nIn, nOut, kH, kW, dH, dW, padType):
                         kernel_initializer=kernel_initializer,
                         use_bias=False)
         biases = tf.get_variable(
-                        'biases', [nOut], tf.float32,
+                        'biases', [nOut], mixed_precision.compute_dtype(FLAGS.use_fp16),
                         tf.constant_initializer(0.0))
 
         bias = tf.reshape(tf.nn.bias_add(conv, biases, data_format=data_format),
@@ -108,10 +113,10 @@ def _affine(inpOp, nIn, nOut):
     with tf.name_scope(name) as scope:
         kernel = tf.get_variable(
             'weights', [nIn, nOut],
-            tf.float32,
+            mixed_precision.compute_dtype(FLAGS.use_fp16),
             tf.truncated_normal_initializer(stddev=1e-2))
         biases = tf.get_variable('biases', [nOut],
-                                 tf.float32,
+                                 mixed_precision.compute_dtype(FLAGS.use_fp16),
                                  tf.constant_initializer(0.1))
         logits = tf.matmul(inpOp, kernel) + biases
         return tf.nn.relu(logits, name=name)
@@ -138,6 +143,7 @@ def _avgpool(inpOp, kH, kW, dH, dW):
         name=name)
 
 def loss_function(logits, labels):
+    logits = tf.cast(logits, tf.float32)  # softmax in fp32 under --use_fp16 too
     cross_entropy = tf.nn.softmax_cross_entropy_with_logits(logits=logits,
                                                             labels=labels,
                                                             name='xentropy')
@@ -167,35 +173,13 @@ def inference(images):
 
     return affn1
 
-def average_gradients(tower_grads):
-    """Calculate the average gradient for each shared variable across all towers.
-
-    Note that this function provides a synchronization point across all towers.
-
-    Args:
-      tower_grads: List of lists of (gradient, variable) tuples. The outer list
-        is over individual gradients. The inner list is over the gradient
-        calculation for each tower.
-    Returns:
-       List of pairs of (gradient, variable) where the gradient has been averaged
-       across all towers.
-    """
-    average_grads = []
-    for single_grads in zip(*tower_grads):
-        grads = [g for g, _ in single_grads]
-        grad = tf.add_n(grads)
-        grad = tf.multiply(grad, 1.0/len(grads))
-        v = single_grads[0][1]
-        grad_and_var = (grad, v)
-        average_grads.append(grad_and_var)
-    return average_grads
-
 
 def train():
     global parameters
     config = tf.ConfigProto(allow_soft_placement=True, log_device_placement=FLAGS.log_device_placement)
     config.intra_op_parallelism_threads = 1
     config.inter_op_parallelism_threads = 0
+    xla.configure_session(config, FLAGS.xla)
     with tf.Graph().as_default(), tf.device("/" + FLAGS.local_ps_device + ":0"):
         global_step = tf.get_variable('global_step', [], initializer=tf.constant_initializer(0), trainable=False)
 
@@ -211,6 +195,11 @@ def train():
             return
 
         optimizer = tf.train.MomentumOptimizer(FLAGS.learning_rate, 0.9)
+        loss_scaler = mixed_precision.LossScaler(FLAGS.use_fp16)
+        mixed_precision.print_precision(FLAGS.use_fp16)
+        allreduce.print_strategy(FLAGS.gradient_aggregation)
+        print('data_format: %s' % data_format)
+        xla.print_mode(FLAGS.xla)
 
         def assign_to_device(device, ps_device=FLAGS.local_ps_device):
             worker_device = device
@@ -248,19 +237,25 @@ def train():
                     _init_global_variables()
                     with tf.device('/cpu:0'):
                         if not FLAGS.use_dataset:
-                            images, labels = cifar10_input.inputs(False, FLAGS.data_dir, FLAGS.batch_size)
-                    with tf.variable_scope(tf.get_variable_scope(), reuse=reuse_variables):    
-                        logits = inference(images)
-                    loss = loss_function(logits, tf.contrib.layers.one_hot_encoding(labels, 10))
+                            # One queue per tower, they share the budget.
+                            images, labels = cifar10_input.inputs(
+                                False, FLAGS.data_dir, FLAGS.batch_size,
+                                memory_budget_mb=FLAGS.input_memory_budget_mb // FLAGS.num_gpus)
+                    with mixed_precision.model_variable_scope(FLAGS.use_fp16, reuse=reuse_variables), \
+                            xla.jit_scope(FLAGS.xla):
+                        logits = inference(tf.cast(images, mixed_precision.compute_dtype(FLAGS.use_fp16)))
+                        loss = loss_function(logits, tf.contrib.layers.one_hot_encoding(labels, 10))
                     reuse_variables = True
 
                     average_loss_tensor.append(loss)
-                    grads = optimizer.compute_gradients(loss)
+                    grads = loss_scaler.compute_gradients(optimizer, loss)
                     tower_grads.append(grads)
 
-        grads = average_gradients(tower_grads)
-        apply_gradient_op = optimizer.apply_gradients(grads, global_step=global_step)
+        tower_devices = ['/gpu:%s' % device_ids[i] for i in range(FLAGS.num_gpus)]
+        grads = allreduce.aggregate_gradients(tower_grads, FLAGS.gradient_aggregation, tower_devices)
+        apply_gradient_op = loss_scaler.apply_gradients(optimizer, grads, global_step=global_step)
         train_op = apply_gradient_op
+        flops.print_cost(tf.get_default_graph(), FLAGS.batch_size)
         average_op = tf.reduce_mean(average_loss_tensor)
 
         # Create a saver.
@@ -280,16 +275,18 @@ def train():
         real_batch_size = FLAGS.batch_size * FLAGS.num_gpus
         num_batches_per_epoch = int((FLAGS.epoch_size + real_batch_size - 1)/ real_batch_size)
         iterations = FLAGS.epochs * num_batches_per_epoch 
-        average_batch_time = 0.0
+        step_timer = xla.StepTimer()
+        step_profiler = profiler.StepProfiler.from_flags()
         epochs_info = []
 
         step = 0
         average_loss = 0.0
         for step in xrange(iterations):
             start_time = time.time()
-            _, loss_v = sess.run([train_op, average_op])
+            _, loss_v = sess.run([train_op, average_op], **step_profiler.run_kwargs())
             duration = time.time() - start_time
-            average_batch_time += float(duration)
+            if not step_profiler.end_step():
+                step_timer.add(duration)
 
             assert not np.isnan(loss_v), 'Model diverged with loss = NaN'
             average_loss += loss_v
@@ -313,8 +310,11 @@ def train():
             coord.request_stop()
             coord.join(threads)
 
-        average_batch_time /= iterations
+        step_profiler.save(sess.graph)
+        average_batch_time = step_timer.average_step_time()
         print 'average_batch_time: ', average_batch_time
+        step_timer.print_compile_time()
+        step_timer.print_step_times()
         print ('epoch_info: %s' % ','.join(epochs_info))
 
 
@@ -6,6 +6,7 @@ import tensorflow.python.platform
 import tensorflow as tf
 import argparse
 import os
+from frameworks.tensorflow import xla, profiler, flops
 
 FLAGS = tf.app.flags.FLAGS
 
@@ -17,7 +18,7 @@ pool_counter = 1
 affine_counter = 1
 
 
-def set_parameters(epochs, minibatch, iterations, device_id):
+def set_parameters(epochs, minibatch, iterations, device_id, xla_mode=xla.OFF, profile_steps=0, profile_dir='.'):
     """
     iterations means the number of iterations in each epoch
     """
@@ -34,6 +35,8 @@ def set_parameters(epochs, minibatch, iterations, device_id):
                                """The data format for Convnet operations.
                                Can be either NHWC or NCHW.
                                """)
+    tf.app.flags.DEFINE_string('xla', xla_mode, """XLA JIT mode: off, global or scoped.""")
+    profiler.define_flags(profile_steps, profile_dir)
     global device_str
     if int(device_id) >= 0:
         device_str = '/gpu:%d' % int(device_id)
@@ -143,21 +146,33 @@ def time_tensorflow_run(session, target, info_string):
     if not isinstance(target, list):
         target = [target]
     target_op = tf.group(*target)
+    flops.print_cost(session.graph, FLAGS.batch_size)
+    step_timer = xla.StepTimer()
+    step_profiler = profiler.StepProfiler.from_flags()
+    num_steps = 0  # timed steps, traced ones are left out
     for i in xrange(FLAGS.num_batches + num_steps_burn_in):
         start_time = time.time()
-        _ = session.run(target_op)
+        _ = session.run(target_op, **step_profiler.run_kwargs())
         duration = time.time() - start_time
+        if step_profiler.end_step():
+            continue
+        step_timer.add(duration)
         if i > num_steps_burn_in:
             if not i % 10:
                 print ('%s: step %d, duration = %.3f' %
                        (datetime.now(), i - num_steps_burn_in, duration))
             total_duration += duration
             total_duration_squared += duration * duration
-    mn = total_duration / FLAGS.num_batches
-    vr = total_duration_squared / FLAGS.num_batches - mn * mn
-    sd = math.sqrt(vr)
+            num_steps += 1
+    step_profiler.save(session.graph)
+    num_steps = max(num_steps, 1)
+    mn = total_duration / num_steps
+    vr = total_duration_squared / num_steps - mn * mn
+    sd = math.sqrt(max(vr, 0.0))
     print ('fake %s: %s across %d steps, %.3f +/- %.3f sec / batch' %
-           (datetime.now(), info_string, FLAGS.num_batches, mn, sd))
+           (datetime.now(), info_string, num_steps, mn, sd))
+    step_timer.print_compile_time()
+    step_timer.print_step_times()
 
 
 def run_benchmark():
@@ -167,6 +182,8 @@ def run_benchmark():
         num_threads = os.getenv('OMP_NUM_THREADS', 1)
         print 'num_threads: ', num_threads
         config = tf.ConfigProto(allow_soft_placement=True, intra_op_parallelism_threads=int(num_threads))
+    xla.configure_session(config, FLAGS.xla)
+    xla.print_mode(FLAGS.xla)
     with tf.Graph().as_default(), tf.device(device_str):
         # Generate some dummy images.
         image_size = 224
@@ -187,7 +204,8 @@ def run_benchmark():
 
         # Build a Graph that computes the logits predictions from the
         # inference model.
-        last_layer = inference(images)
+        with xla.jit_scope(FLAGS.xla):
+            last_layer = inference(images)
 
         # Build an initialization operation.
         init = tf.global_variables_initializer()
@@ -212,7 +230,8 @@ def run_benchmark():
 
         if run_forward_backward:
             # Add a simple objective so we can calculate the backward pass.
-            objective = loss(last_layer, labels)
+            with xla.jit_scope(FLAGS.xla):
+                objective = loss(last_layer, labels)
             # Compute the gradient with respect to all the parameters.
             grad = tf.train.GradientDescentOptimizer(0.01).minimize(objective)
             # grad = tf.gradients(objective, parameters)
@@ -234,6 +253,9 @@ if __name__ == '__main__':
     parser.add_argument("-s", "--epoch_size", help="epoch size(dataset size)", type=int, default=50000)
     # parser.add_argument("-i", "--iterations", help="iterations", type=int, default=2)
     parser.add_argument("-d", "--deviceid", help="specified device id", type=int, default=0)
+    parser.add_argument("-x", "--xla", help="XLA JIT mode: off, global or scoped", type=str, default=xla.OFF)
+    parser.add_argument("-p", "--profile_steps", help="steady-state steps to trace, 0 for none", type=int, default=0)
+    parser.add_argument("--profile_dir", help="directory for the traces and the op table", type=str, default='.')
     args = parser.parse_args()
 
     epochs = args.epochs
@@ -241,6 +263,6 @@ if __name__ == '__main__':
     # iterations = args.iterations
     iterations = int(args.epochs * args.epoch_size / args.minibatch)
     device_id = args.deviceid
-    set_parameters(epochs, minibatch, iterations, device_id)
+    set_parameters(epochs, minibatch, iterations, device_id, args.xla, args.profile_steps, args.profile_dir)
 
     tf.app.run()
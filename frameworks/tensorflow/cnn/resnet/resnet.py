@@ -89,6 +89,7 @@ def inference_small_config(x, c):
 
 
 def loss(logits, labels):
+    logits = tf.cast(logits, tf.float32)  # softmax and weight decay stay in fp32 under fp16 compute
     cross_entropy = tf.nn.softmax_cross_entropy_with_logits(logits=logits,
                                                             labels=labels,
                                                             name='xentropy')
@@ -182,18 +183,21 @@ def bn(x, c):
 
     if c['use_bias']:
         bias = _get_variable('bias', params_shape,
-                             initializer=tf.zeros_initializer())
+                             initializer=tf.zeros_initializer(),
+                             dtype=x.dtype.base_dtype)
         return x + bias
 
     batch_norm_config = {'decay': 0.9, 'epsilon': 1e-5, 'scale': True,
                          'center': True}
 
-    x = tf.contrib.layers.batch_norm(x,
+    # Batch statistics are kept in fp32, fp16 activations are normalized in fp32 and cast back.
+    compute_dtype = x.dtype.base_dtype
+    x = tf.contrib.layers.batch_norm(tf.cast(x, tf.float32),
                                      is_training=c['is_training'],
                                      fused=True,
                                      data_format=DATA_FORMAT,
                                      **batch_norm_config)
-    return x
+    return tf.cast(x, compute_dtype)
 
 
 def fc(x, c):
@@ -204,11 +208,13 @@ def fc(x, c):
     weights = _get_variable('weights',
                             shape=[num_units_in, num_units_out],
                             initializer=weights_initializer,
-                            weight_decay=FC_WEIGHT_DECAY)
+                            weight_decay=FC_WEIGHT_DECAY,
+                            dtype=x.dtype.base_dtype)
     biases = _get_variable('biases',
                            shape=[num_units_out],
                            initializer=tf.zeros_initializer(),
-                           weight_decay=FC_WEIGHT_DECAY)
+                           weight_decay=FC_WEIGHT_DECAY,
+                           dtype=x.dtype.base_dtype)
     x = tf.nn.xw_plus_b(x, weights, biases)
     return x
 
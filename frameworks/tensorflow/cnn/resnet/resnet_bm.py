@@ -7,6 +7,7 @@ import tensorflow as tf
 import numpy as np
 import os
 from frameworks.tensorflow.cnn.resnet.resnet import inference_small, loss
+from frameworks.tensorflow import mixed_precision, xla, inference, loadgen, profiler, flops
 
 EPOCH_SIZE = globalconfig.RESNET_EPOCH_SIZE
 
@@ -36,14 +37,23 @@ tf.app.flags.DEFINE_boolean('use_fp16', False,
 tf.app.flags.DEFINE_boolean('log_device_placement', False,
                             """Whether to log device placement.""")
 tf.app.flags.DEFINE_boolean('use_dataset', False, """True to use datasets""")
-tf.app.flags.DEFINE_string('data_format', 'NCHW', """NCHW for GPU and NHWC for CPU.""")
+tf.app.flags.DEFINE_string('xla', xla.OFF, """XLA JIT mode: off, global or scoped.""")
+tf.app.flags.DEFINE_string('data_format', '', """NCHW or NHWC, empty for NCHW on GPU and NHWC on CPU.""")
+tf.app.flags.DEFINE_boolean('inference', False, """Time the frozen forward-only graph instead of training.""")
+tf.app.flags.DEFINE_string('inference_batch_sizes', inference.LATENCY_BATCH_SIZES,
+                           """Batch sizes of the inference latency percentiles.""")
+tf.app.flags.DEFINE_integer('inference_steps', inference.DEFAULT_STEPS, """Timed runs per inference batch size.""")
+loadgen.define_flags()
+profiler.define_flags()
 
 TEST_SIZE = 10000
 
 
-def train():
-    global parameters
-    data_format = FLAGS.data_format
+def get_session_config():
+    """
+    :return: (device_str, tf.ConfigProto, data_format)
+    """
+    data_format = FLAGS.data_format or 'NCHW'
     config = tf.ConfigProto(allow_soft_placement=True, log_device_placement=FLAGS.log_device_placement)
     # config.gpu_options.force_gpu_compatible = 1
     device_id = FLAGS.device_id
@@ -56,9 +66,18 @@ def train():
         device_str = '/cpu:0'
         num_threads = os.getenv('OMP_NUM_THREADS', 1)
         config = tf.ConfigProto(allow_soft_placement=True, intra_op_parallelism_threads=int(num_threads))
-        # Default format for CPU.  When using MKL NCHW might be better but that has not been proven.
-        data_format = 'NHWC'
-    print('Using data format:{}'.format(data_format))
+        # Default format for CPU.  When using MKL NCHW might be better, an explicit --data_format is kept.
+        data_format = FLAGS.data_format or 'NHWC'
+    print('data_format: {}'.format(data_format))
+    mixed_precision.print_precision(FLAGS.use_fp16)
+    xla.configure_session(config, FLAGS.xla)
+    xla.print_mode(FLAGS.xla)
+    return device_str, config, data_format
+
+
+def train():
+    global parameters
+    device_str, config, data_format = get_session_config()
     with tf.Graph().as_default(), tf.device(device_str), tf.Session(config=config) as sess:
         initalizer = None
         images = None
@@ -72,13 +91,17 @@ def train():
             else:
                 images, labels = cifar10_input.inputs(False, FLAGS.data_dir, FLAGS.batch_size, data_format=data_format)
             labels = tf.contrib.layers.one_hot_encoding(labels, 10)
-        logits = inference_small(images, is_training=True, num_blocks=9, data_format=data_format)
-        # Add a simple objective so we can calculate the backward pass.
-        loss_value = loss(logits, labels)
+        images = tf.cast(images, mixed_precision.compute_dtype(FLAGS.use_fp16))
+        with mixed_precision.model_variable_scope(FLAGS.use_fp16), xla.jit_scope(FLAGS.xla):
+            logits = inference_small(images, is_training=True, num_blocks=9, data_format=data_format)
+            # Add a simple objective so we can calculate the backward pass.
+            loss_value = loss(logits, labels)
         # Compute the gradient with respect to all the parameters.
+        loss_scaler = mixed_precision.LossScaler(FLAGS.use_fp16)
         update_ops = tf.get_collection(tf.GraphKeys.UPDATE_OPS)
         with tf.control_dependencies(update_ops):
-            grad = tf.train.MomentumOptimizer(FLAGS.learning_rate, 0.9).minimize(loss_value)
+            grad = loss_scaler.minimize(tf.train.MomentumOptimizer(FLAGS.learning_rate, 0.9), loss_value)
+        flops.print_cost(tf.get_default_graph(), FLAGS.batch_size)
 
         # Create a saver.
         saver = tf.train.Saver(tf.global_variables())
@@ -98,15 +121,17 @@ def train():
         real_batch_size = FLAGS.batch_size
         num_batches_per_epoch = int((FLAGS.epoch_size + real_batch_size - 1) / real_batch_size)
         iterations = FLAGS.epochs * num_batches_per_epoch
-        average_batch_time = 0.0
+        step_timer = xla.StepTimer()
+        step_profiler = profiler.StepProfiler.from_flags()
 
         epochs_info = []
         average_loss = 0.0
         for step in xrange(iterations):
             start_time = time.time()
-            _, loss_v = sess.run([grad, loss_value])
+            _, loss_v = sess.run([grad, loss_value], **step_profiler.run_kwargs())
             duration = time.time() - start_time
-            average_batch_time += float(duration)
+            if not step_profiler.end_step():
+                step_timer.add(duration)
             average_loss += loss_v
             assert not np.isnan(loss_v), 'Model diverged with loss = NaN'
             if step % FLAGS.log_step == 0:
@@ -125,15 +150,40 @@ def train():
         if not FLAGS.use_dataset:
             coord.request_stop()
             coord.join(threads)
-        average_batch_time /= iterations
+        step_profiler.save(sess.graph)
+        average_batch_time = step_timer.average_step_time()
         print 'average_batch_time: ', average_batch_time
+        step_timer.print_compile_time()
+        step_timer.print_step_times()
         print ('epoch_info: %s' % ','.join(epochs_info))
 
 
+def run_inference():
+    device_str, config, data_format = get_session_config()
+
+    def build(batch_size):
+        shape = inference.image_shape(batch_size, data_format, cifar10_input.IMAGE_SIZE)
+        images = tf.placeholder(tf.float32, shape, name='images')
+        with mixed_precision.model_variable_scope(FLAGS.use_fp16), xla.jit_scope(FLAGS.xla):
+            logits = inference_small(tf.cast(images, mixed_precision.compute_dtype(FLAGS.use_fp16)),
+                                     is_training=False, num_blocks=9, data_format=data_format)
+        probabilities = tf.nn.softmax(tf.cast(logits, tf.float32))
+        return {images: np.random.rand(*shape).astype(np.float32)}, probabilities
+
+    if FLAGS.loadgen:
+        loadgen.run_from_flags(build, device_str, config)
+    else:
+        inference.run(build, FLAGS.batch_size, device_str, config,
+                      batch_sizes=FLAGS.inference_batch_sizes, steps=FLAGS.inference_steps)
+
+
 def main(_):
     os.environ['TF_ENABLE_WINOGRAD_NONFUSED'] = '1'
     os.environ['TF_SYNC_ON_FINISH'] = '0'
-    train()
+    if FLAGS.inference or FLAGS.loadgen:
+        run_inference()
+    else:
+        train()
 
 
 if __name__ == '__main__':
@@ -10,6 +10,7 @@ import os
 import operator
 # from resnet import inference, loss
 from frameworks.tensorflow.cnn.resnet.resnet import inference_small, loss
+from frameworks.tensorflow import mixed_precision, allreduce, xla, profiler, flops
 from globalconfig import CIFAR10_DATA_DIR, RESNET_EPOCH_SIZE
 
 FLAGS = tf.app.flags.FLAGS
@@ -33,42 +34,23 @@ tf.app.flags.DEFINE_integer('num_gpus', 2, """How many GPUs to use.""")
 # on the P100 via the DGX-1 CPU is the better choice.  
 tf.app.flags.DEFINE_string('local_ps_device', 'CPU',
                            """Local parameter server GPU if gpus are peered or CPU otherwise try both.""")
+tf.app.flags.DEFINE_string('gradient_aggregation', allreduce.CENTRAL,
+                           """How tower gradients are summed: central, round_robin or ring.""")
 tf.app.flags.DEFINE_boolean('use_dataset', False, """True to use datasets""")
+tf.app.flags.DEFINE_string('xla', xla.OFF, """XLA JIT mode: off, global or scoped.""")
+profiler.define_flags()
 tf.app.flags.DEFINE_string('data_format', 'NCHW', """NCHW for GPU and NHWC for CPU.""")
 
 TEST_SIZE = 10000
 
 
-def average_gradients(tower_grads):
-    """Calculate the average gradient for each shared variable across all towers.
-
-    Note that this function provides a synchronization point across all towers.
-
-    Args:
-      tower_grads: List of lists of (gradient, variable) tuples. The outer list
-        is over individual gradients. The inner list is over the gradient
-        calculation for each tower.
-    Returns:
-       List of pairs of (gradient, variable) where the gradient has been averaged
-       across all towers.
-    """
-    average_grads = []
-    for single_grads in zip(*tower_grads):
-        grads = [g for g, _ in single_grads]
-        grad = tf.add_n(grads)
-        grad = tf.multiply(grad, 1.0 / len(grads))
-        v = single_grads[0][1]
-        grad_and_var = (grad, v)
-        average_grads.append(grad_and_var)
-    return average_grads
-
-
 def train():
     global parameters
     config = tf.ConfigProto(allow_soft_placement=True, log_device_placement=FLAGS.log_device_placement)
     config.allow_soft_placement = True
     config.intra_op_parallelism_threads = 1
     config.inter_op_parallelism_threads = 0
+    xla.configure_session(config, FLAGS.xla)
 
     with tf.Graph().as_default(), tf.device("/" + FLAGS.local_ps_device):
         global_step = tf.get_variable('global_step', [], initializer=tf.constant_initializer(0), trainable=False)
@@ -85,6 +67,11 @@ def train():
 
         # optimizer = tf.train.GradientDescentOptimizer(lr)
         optimizer = tf.train.MomentumOptimizer(FLAGS.learning_rate, 0.9)
+        loss_scaler = mixed_precision.LossScaler(FLAGS.use_fp16)
+        mixed_precision.print_precision(FLAGS.use_fp16)
+        allreduce.print_strategy(FLAGS.gradient_aggregation)
+        print('data_format: %s' % FLAGS.data_format)
+        xla.print_mode(FLAGS.xla)
 
         def assign_to_device(device, ps_device=FLAGS.local_ps_device):
             worker_device = device
@@ -125,14 +112,18 @@ def train():
                 with tf.name_scope('%s_%s' % ('TOWER', device_ids[i])) as n_scope:
                     with tf.device('/cpu:0'):
                         if not FLAGS.use_dataset:
-                            images, labels = cifar10_input.inputs(False, FLAGS.data_dir, FLAGS.batch_size,
-                                                                  data_format=FLAGS.data_format)
-                    with tf.variable_scope(tf.get_variable_scope(), reuse=reuse_variables):
-                        logits = inference_small(images, is_training=True, num_blocks=9, data_format=FLAGS.data_format)
+                            # One queue per tower, they share the budget.
+                            images, labels = cifar10_input.inputs(
+                                False, FLAGS.data_dir, FLAGS.batch_size, data_format=FLAGS.data_format,
+                                memory_budget_mb=FLAGS.input_memory_budget_mb // FLAGS.num_gpus)
                     hot_labels = tf.contrib.layers.one_hot_encoding(labels, 10)
-                    tower_loss = loss(logits, hot_labels)
+                    with mixed_precision.model_variable_scope(FLAGS.use_fp16, reuse=reuse_variables), \
+                            xla.jit_scope(FLAGS.xla):
+                        logits = inference_small(tf.cast(images, mixed_precision.compute_dtype(FLAGS.use_fp16)),
+                                                 is_training=True, num_blocks=9, data_format=FLAGS.data_format)
+                        tower_loss = loss(logits, hot_labels)
                     losses.append(tower_loss)
-                    grads = optimizer.compute_gradients(tower_loss)
+                    grads = loss_scaler.compute_gradients(optimizer, tower_loss)
                     tower_grads.append(grads)
                     reuse_variables = True
 
@@ -140,9 +131,11 @@ def train():
         with tf.control_dependencies(update_ops):
             # Average losses accross towers (GPUs)
             total_loss = tf.reduce_mean(losses, 0)
-            grads = average_gradients(tower_grads)
-            apply_gradient_op = optimizer.apply_gradients(grads, global_step=global_step)
+            tower_devices = ['/gpu:%s' % device_ids[i] for i in range(FLAGS.num_gpus)]
+            grads = allreduce.aggregate_gradients(tower_grads, FLAGS.gradient_aggregation, tower_devices)
+            apply_gradient_op = loss_scaler.apply_gradients(optimizer, grads, global_step=global_step)
         train_op = apply_gradient_op
+        flops.print_cost(tf.get_default_graph(), FLAGS.batch_size)
 
         # Create a saver.
         saver = tf.train.Saver(tf.global_variables())
@@ -163,17 +156,19 @@ def train():
         real_batch_size = FLAGS.batch_size * FLAGS.num_gpus
         num_batches_per_epoch = int((FLAGS.epoch_size + real_batch_size - 1) / real_batch_size)
         iterations = FLAGS.epochs * num_batches_per_epoch
-        average_batch_time = 0.0
+        step_timer = xla.StepTimer()
+        step_profiler = profiler.StepProfiler.from_flags()
         epochs_info = []
 
         step = 0
         average_loss = 0.0
         for step in six.moves.xrange(iterations):
             start_time = time.time()
-            _, loss_v = sess.run([train_op, total_loss])
+            _, loss_v = sess.run([train_op, total_loss], **step_profiler.run_kwargs())
             duration = time.time() - start_time
             average_loss += loss_v
-            average_batch_time += float(duration)
+            if not step_profiler.end_step():
+                step_timer.add(duration)
             assert not np.isnan(loss_v), 'Model diverged with loss = NaN'
             if step % FLAGS.log_step == 0:
                 examples_per_sec = FLAGS.batch_size / duration
@@ -191,8 +186,11 @@ def train():
         if not FLAGS.use_dataset:
             coord.request_stop()
             coord.join(threads)
-        average_batch_time /= iterations
+        step_profiler.save(sess.graph)
+        average_batch_time = step_timer.average_step_time()
         print('average_batch_time: %s' % average_batch_time)
+        step_timer.print_compile_time()
+        step_timer.print_step_times()
         print ('epoch_info: %s' % ','.join(epochs_info))
 
 
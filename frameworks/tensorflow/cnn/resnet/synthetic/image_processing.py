@@ -26,9 +26,13 @@
  -- Data processing:
  parse_example_proto: Parses an Example proto containing a training example
    of an image.
+ parse_packed_example: Parses an Example proto holding the JPEG bytes themselves.
+ packed_batch_inputs: Streams packed shards with parallel interleave.
 
  -- Image decoding:
  decode_jpeg: Decode a JPEG encoded string into a 3-D float32 Tensor.
+ cached_decode_jpeg: Same, but decoded and resized images are kept in a
+   memory or memory-mapped cache across epochs.
 
  -- Image preprocessing:
  image_preprocessing: Decode and preprocess one image for evaluation or training
@@ -40,8 +44,12 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import numpy as np
 import tensorflow as tf
 
+from datapreprocess import image_cache
+from datapreprocess.pipeline_budget import size_pipeline, PIPELINE_MEMORY_TEMPLATE, MB, DEFAULT_BUDGET_MB
+
 FLAGS = tf.app.flags.FLAGS
 
 tf.app.flags.DEFINE_integer('num_preprocess_threads', 4,
@@ -51,21 +59,58 @@ tf.app.flags.DEFINE_integer('num_readers', 4,
                             """Number of parallel readers during train.""")
 
 # Images are preprocessed asynchronously using multiple threads specifed by
-# --num_preprocss_threads and the resulting processed images are stored in a
-# random shuffling queue. The shuffling queue dequeues --batch_size images
-# for processing on a given Inception tower. A larger shuffling queue guarantees
-# better mixing across examples within a batch and results in slightly higher
-# predictive performance in a trained model. Empirically,
-# --input_queue_memory_factor=16 works well. A value of 16 implies a queue size
-# of 1024*16 images. Assuming RGB 299x299 images, this implies a queue size of
-# 16GB. If the machine is memory limited, then decrease this factor to
-# decrease the CPU memory footprint, accordingly.
+# --num_preprocss_threads. Raw examples wait in a shuffle buffer and
+# preprocessed batches in a prefetch buffer. Both are sized from
+# --input_memory_budget_mb and the per-example byte sizes (see
+# datapreprocess/pipeline_budget.py), and the resulting estimate is printed
+# to the log, so a node no longer swaps silently during real-data runs.
 tf.app.flags.DEFINE_integer(
-    'input_queue_memory_factor', 16,
-    """Size of the queue of preprocessed images. """
-    """Default is ideal but try smaller values, e.g. """
-    """4, 2 or 1, if host memory is constrained. See """
-    """comments in code for more details.""")
+    'input_memory_budget_mb', DEFAULT_BUDGET_MB,
+    """Host RAM the shuffle and prefetch buffers may use.""")
+
+tf.app.flags.DEFINE_string('decoded_cache', '',
+                           """Cache decoded images across epochs: '' (off), """
+                           """'memory' (RAM, bounded by --decoded_cache_mb) """
+                           """or 'mmap' (local file --decoded_cache_path).""")
+tf.app.flags.DEFINE_integer('decoded_cache_mb', 4096,
+                            """Byte budget of the in-memory decoded image cache.""")
+tf.app.flags.DEFINE_string('decoded_cache_path', '/tmp/imagenet_decoded.cache',
+                           """Local file backing the memory-mapped decoded image cache.""")
+tf.app.flags.DEFINE_integer('cache_image_size', 256,
+                            """Decoded images are resized to this square size before """
+                            """being cached. Distortions run on the cached image.""")
+
+
+def preprocessed_image_bytes():
+    return FLAGS.input_size * FLAGS.input_size * 3 * 4
+
+
+def budget_pipeline(example_bytes, batch_size, num_preprocess_threads, max_shuffle_examples=None):
+    """Size the shuffle and prefetch buffers from --input_memory_budget_mb and log the estimate."""
+    sizes = size_pipeline(FLAGS.input_memory_budget_mb * MB, example_bytes, preprocessed_image_bytes(),
+                          batch_size, num_preprocess_threads, max_shuffle_examples=max_shuffle_examples)
+    print(PIPELINE_MEMORY_TEMPLATE % sizes.memory_bytes)
+    print('shuffle buffer: %d examples, prefetch: %d batches' % (sizes.shuffle_examples, sizes.prefetch_batches))
+    return sizes
+
+
+def make_decoded_cache(num_images, source_files=()):
+    """Create the decoded image cache selected by --decoded_cache, or None.
+
+  Args:
+    num_images: number of images, cache keys are their indexes.
+    source_files: files the images and their order are read from (manifest
+      or shards); the mmap cache is reset when any of them changes.
+  """
+    if not FLAGS.decoded_cache:
+        return None
+    if FLAGS.decoded_cache == 'memory':
+        return image_cache.MemoryImageCache(FLAGS.decoded_cache_mb * 1024 * 1024)
+    if FLAGS.decoded_cache == 'mmap':
+        return image_cache.MmapImageCache(FLAGS.decoded_cache_path, num_images,
+                                          FLAGS.cache_image_size, FLAGS.cache_image_size,
+                                          source=image_cache.source_identity(source_files))
+    raise ValueError('Unknown decoded_cache: %s' % FLAGS.decoded_cache)
 
 
 def inputs(dataset, batch_size=None, num_preprocess_threads=None):
@@ -108,11 +153,11 @@ def decode_jpeg(image_buffer, scope=None):
 
   Args:
     image_buffer: scalar string Tensor.
-    scope: Optional scope for op_scope.
+    scope: Optional scope for name_scope.
   Returns:
     3-D float Tensor with values ranging from [0, 1).
   """
-    with tf.op_scope([image_buffer], scope, 'decode_jpeg'):
+    with tf.name_scope(scope, 'decode_jpeg', [image_buffer]):
         # Decode the string as an RGB JPEG.
         # Note that the resulting image contains an unknown height and width
         # that is set dynamically by decode_jpeg. In other words, the height
@@ -126,6 +171,47 @@ def decode_jpeg(image_buffer, scope=None):
         return image
 
 
+def cached_decode_jpeg(image_buffer, key, cache, scope=None):
+    """Decode a JPEG string through a decoded image cache.
+
+  On a miss the image is decoded, resized to --cache_image_size and stored;
+  on a hit the stored uint8 pixels are used and no JPEG decoding happens.
+
+  Args:
+    image_buffer: scalar string Tensor.
+    key: scalar integer Tensor, index of the image in the manifest.
+    cache: MemoryImageCache or MmapImageCache.
+    scope: Optional scope for name_scope.
+  Returns:
+    3-D float Tensor with values ranging from [0, 1).
+  """
+    size = FLAGS.cache_image_size
+    with tf.name_scope(scope, 'cached_decode_jpeg', [image_buffer, key]):
+        def _lookup(k):
+            image = cache.get(int(k))
+            if image is None:
+                return False, np.zeros((size, size, 3), dtype=np.uint8)
+            return True, np.asarray(image)
+
+        def _store(k, image):
+            # The input buffer belongs to TensorFlow, keep a copy.
+            cache.put(int(k), np.array(image, dtype=np.uint8, copy=True))
+            return image
+
+        def _decode_and_store():
+            image = tf.image.decode_jpeg(image_buffer, channels=3)
+            image = tf.saturate_cast(tf.image.resize_images(image, [size, size]), tf.uint8)
+            stored = tf.py_func(_store, [key, image], tf.uint8, stateful=True)
+            stored.set_shape([size, size, 3])
+            return stored
+
+        hit, cached = tf.py_func(_lookup, [key], [tf.bool, tf.uint8], stateful=True)
+        hit.set_shape([])
+        cached.set_shape([size, size, 3])
+        image = tf.cond(hit, lambda: cached, _decode_and_store)
+        return tf.image.convert_image_dtype(image, dtype=tf.float32)
+
+
 def distort_color(image, thread_id=0, scope=None):
     """Distort the color of the image.
 
@@ -137,11 +223,11 @@ def distort_color(image, thread_id=0, scope=None):
   Args:
     image: Tensor containing single image.
     thread_id: preprocessing thread ID.
-    scope: Optional scope for op_scope.
+    scope: Optional scope for name_scope.
   Returns:
     color-distorted image
   """
-    with tf.op_scope([image], scope, 'distort_color'):
+    with tf.name_scope(scope, 'distort_color', [image]):
         color_ordering = thread_id % 2
 
         if color_ordering == 0:
@@ -160,7 +246,7 @@ def distort_color(image, thread_id=0, scope=None):
         return image
 
 
-def distort_image(image, height, width, bbox, thread_id=0, scope=None):
+def distort_image(image, height, width, bbox, thread_id=0, scope=None, add_summaries=True):
     """Distort one image for training a network.
 
   Distorting images provides a useful technique for augmenting the data
@@ -175,11 +261,12 @@ def distort_image(image, height, width, bbox, thread_id=0, scope=None):
       where each coordinate is [0, 1) and the coordinates are arranged
       as [ymin, xmin, ymax, xmax].
     thread_id: integer indicating the preprocessing thread.
-    scope: Optional scope for op_scope.
+    scope: Optional scope for name_scope.
+    add_summaries: boolean, False inside Dataset functions where summaries are not supported.
   Returns:
     3-D float Tensor of distorted image used for training.
   """
-    with tf.op_scope([image, height, width, bbox], scope, 'distort_image'):
+    with tf.name_scope(scope, 'distort_image', [image, height, width, bbox]):
 
         # NOTE(ry) I unceremoniously removed all the bounding box code.
         # Original here: https://github.com/tensorflow/models/blob/148a15fb043dacdd1595eb4c5267705fbd362c6a/inception/inception/image_processing.py
@@ -191,13 +278,13 @@ def distort_image(image, height, width, bbox, thread_id=0, scope=None):
         # fashion based on the thread number.
         # Note that ResizeMethod contains 4 enumerated resizing methods.
         resize_method = thread_id % 4
-        distorted_image = tf.image.resize_images(distorted_image, height,
-                                                 width, resize_method)
+        distorted_image = tf.image.resize_images(distorted_image, [height, width],
+                                                 resize_method)
         # Restore the shape since the dynamic slice based upon the bbox_size loses
         # the third dimension.
         distorted_image.set_shape([height, width, 3])
-        if not thread_id:
-            tf.image_summary('cropped_resized_image',
+        if not thread_id and add_summaries:
+            tf.summary.image('cropped_resized_image',
                              tf.expand_dims(distorted_image, 0))
 
         # Randomly flip the image horizontally.
@@ -206,8 +293,8 @@ def distort_image(image, height, width, bbox, thread_id=0, scope=None):
         # Randomly distort the colors.
         distorted_image = distort_color(distorted_image, thread_id)
 
-        if not thread_id:
-            tf.image_summary('final_distorted_image',
+        if not thread_id and add_summaries:
+            tf.summary.image('final_distorted_image',
                              tf.expand_dims(distorted_image, 0))
         return distorted_image
 
@@ -219,11 +306,11 @@ def eval_image(image, height, width, scope=None):
     image: 3-D float Tensor
     height: integer
     width: integer
-    scope: Optional scope for op_scope.
+    scope: Optional scope for name_scope.
   Returns:
     3-D float Tensor of prepared image.
   """
-    with tf.op_scope([image, height, width], scope, 'eval_image'):
+    with tf.name_scope(scope, 'eval_image', [image, height, width]):
         # Crop the central region of the image with an area containing 87.5% of
         # the original image.
         image = tf.image.central_crop(image, central_fraction=0.875)
@@ -236,7 +323,7 @@ def eval_image(image, height, width, scope=None):
         return image
 
 
-def image_preprocessing(image_buffer, bbox, train, thread_id=0):
+def image_preprocessing(image_buffer, bbox, train, thread_id=0, add_summaries=True, cache=None, cache_key=None):
     """Decode and preprocess one image for evaluation or training.
 
   Args:
@@ -246,6 +333,9 @@ def image_preprocessing(image_buffer, bbox, train, thread_id=0):
       [ymin, xmin, ymax, xmax].
     train: boolean
     thread_id: integer indicating preprocessing thread
+    add_summaries: boolean, whether to add image summaries
+    cache: optional decoded image cache, see make_decoded_cache
+    cache_key: integer Tensor identifying the image in the cache
 
   Returns:
     3-D float Tensor containing an appropriately scaled image
@@ -256,18 +346,21 @@ def image_preprocessing(image_buffer, bbox, train, thread_id=0):
     if bbox is None:
         raise ValueError('Please supply a bounding box.')
 
-    image = decode_jpeg(image_buffer)
+    if cache is not None:
+        image = cached_decode_jpeg(image_buffer, cache_key, cache)
+    else:
+        image = decode_jpeg(image_buffer)
     height = FLAGS.input_size
     width = FLAGS.input_size
 
     if train:
-        image = distort_image(image, height, width, bbox, thread_id)
+        image = distort_image(image, height, width, bbox, thread_id, add_summaries=add_summaries)
     else:
         image = eval_image(image, height, width)
 
     # Finally, rescale to [-1,1] instead of [0, 1)
-    image = tf.sub(image, 0.5)
-    image = tf.mul(image, 2.0)
+    image = tf.subtract(image, 0.5)
+    image = tf.multiply(image, 2.0)
     return image
 
 
@@ -331,7 +424,7 @@ def parse_example_proto(example_serialized):
     ymax = tf.expand_dims(features['image/object/bbox/ymax'].values, 0)
 
     # Note that we impose an ordering of (y, x) just to make life difficult.
-    bbox = tf.concat(0, [ymin, xmin, ymax, xmax])
+    bbox = tf.concat([ymin, xmin, ymax, xmax], 0)
 
     # Force the variable number of bounding boxes into the shape
     # [1, num_boxes, coords].
@@ -341,6 +434,94 @@ def parse_example_proto(example_serialized):
     return features['image/filename'], label, bbox, features['image/class/text']
 
 
+def parse_packed_example(example_serialized):
+    """Parses an Example proto written by datapreprocess/imagenet_tfrecord.py.
+
+  Unlike the protos handled by parse_example_proto, these carry the JPEG bytes
+  in image/encoded, so no second read of the image file is needed.
+
+  Args:
+    example_serialized: scalar Tensor tf.string containing a serialized
+      Example protocol buffer.
+
+  Returns:
+    image_buffer: Tensor tf.string containing the encoded JPEG.
+    label: Tensor tf.int32 containing the label.
+    index: Tensor tf.int64 containing the manifest index of the image.
+  """
+    feature_map = {
+        'image/encoded': tf.FixedLenFeature([], dtype=tf.string, default_value=''),
+        'image/class/label': tf.FixedLenFeature([], dtype=tf.int64, default_value=-1),
+        'image/index': tf.FixedLenFeature([], dtype=tf.int64, default_value=-1),
+    }
+    features = tf.parse_single_example(example_serialized, feature_map)
+    label = tf.cast(features['image/class/label'], dtype=tf.int32)
+    return features['image/encoded'], label, features['image/index']
+
+
+def packed_batch_inputs(dataset,
+                        batch_size,
+                        train,
+                        num_preprocess_threads=None,
+                        num_readers=1):
+    """Contruct batches of images from shards that embed the JPEG bytes.
+
+  The shards are read num_readers at a time with a parallel interleave so that
+  reading is sequential within each file, and decoding plus preprocessing run
+  on num_preprocess_threads threads.
+
+  Args:
+    dataset: instance of a packed Dataset class (see imagenet_tfrecord.py).
+    batch_size: integer
+    train: boolean
+    num_preprocess_threads: integer, total number of preprocessing threads
+    num_readers: integer, number of shards read in parallel
+
+  Returns:
+    images: 4-D float Tensor of a batch of images
+    labels: 1-D integer Tensor of [batch_size].
+
+  Raises:
+    ValueError: if data is not found
+  """
+    with tf.name_scope('packed_batch_processing'):
+        data_files = dataset.data_files()
+        if not data_files:
+            raise ValueError('No data files found for this dataset')
+        if num_preprocess_threads is None:
+            num_preprocess_threads = FLAGS.num_preprocess_threads
+        if num_readers is None:
+            num_readers = FLAGS.num_readers
+
+        files = tf.data.Dataset.from_tensor_slices(tf.constant(data_files))
+        if train:
+            files = files.shuffle(len(data_files)).repeat()
+        records = files.apply(tf.contrib.data.parallel_interleave(
+            lambda f: tf.data.TFRecordDataset(f, buffer_size=8 * 1024 * 1024),
+            cycle_length=num_readers,
+            sloppy=train))
+        sizes = budget_pipeline(dataset.average_example_bytes(), batch_size, num_preprocess_threads,
+                                max_shuffle_examples=dataset.num_examples())
+        if train:
+            records = records.shuffle(buffer_size=sizes.shuffle_examples)
+
+        cache = make_decoded_cache(dataset.num_examples(), data_files) if FLAGS.decoded_cache else None
+
+        def _parse_and_preprocess(example_serialized):
+            image_buffer, label, index = parse_packed_example(example_serialized)
+            image = image_preprocessing(image_buffer, [], train, add_summaries=False,
+                                        cache=cache, cache_key=index)
+            return image, label
+
+        images_and_labels = records.map(_parse_and_preprocess,
+                                        num_parallel_calls=num_preprocess_threads)
+        batches = images_and_labels.batch(batch_size).prefetch(sizes.prefetch_batches)
+        images, labels = batches.make_one_shot_iterator().get_next()
+
+        images = tf.reshape(images, shape=[batch_size, FLAGS.input_size, FLAGS.input_size, 3])
+        return images, tf.reshape(labels, [batch_size])
+
+
 def batch_inputs(dataset,
                  batch_size,
                  train,
@@ -363,6 +544,11 @@ def batch_inputs(dataset,
   Raises:
     ValueError: if data is not found
   """
+    if getattr(dataset, 'packed', False):
+        return packed_batch_inputs(dataset, batch_size, train,
+                                   num_preprocess_threads=num_preprocess_threads,
+                                   num_readers=num_readers)
+
     with tf.name_scope('batch_processing'):
         data_files = dataset.data_files()
         if data_files is None:
@@ -389,22 +575,19 @@ def batch_inputs(dataset,
         if num_readers < 1:
             raise ValueError('Please make num_readers at least 1')
 
-        # Approximate number of examples per shard.
-        examples_per_shard = 1024
-        # Size the random shuffle queue to balance between good global
-        # mixing (more examples) and memory use (fewer examples).
-        # 1 image uses 299*299*3*4 bytes = 1MB
-        # The default input_queue_memory_factor is 16 implying a shuffling queue
-        # size: examples_per_shard * 16 * 1MB = 17.6GB
-        min_queue_examples = examples_per_shard * FLAGS.input_queue_memory_factor
+        # The examples queue only holds file paths, the decoded images wait in
+        # the batch_join queue below.
+        example_bytes = len(FLAGS.data_dir) + 64
+        sizes = budget_pipeline(example_bytes, batch_size, num_preprocess_threads,
+                                max_shuffle_examples=16 * 1024 if train else 1024)
         if train:
             examples_queue = tf.RandomShuffleQueue(
-                capacity=min_queue_examples + 3 * batch_size,
-                min_after_dequeue=min_queue_examples,
+                capacity=sizes.shuffle_examples + 3 * batch_size,
+                min_after_dequeue=sizes.shuffle_examples,
                 dtypes=[tf.string])
         else:
             examples_queue = tf.FIFOQueue(
-                capacity=examples_per_shard + 3 * batch_size,
+                capacity=sizes.shuffle_examples + 3 * batch_size,
                 dtypes=[tf.string])
 
         reader = tf.TFRecordReader()
@@ -430,7 +613,7 @@ def batch_inputs(dataset,
         images, label_index_batch = tf.train.batch_join(
             images_and_labels,
             batch_size=batch_size,
-            capacity=2 * num_preprocess_threads * batch_size)
+            capacity=sizes.prefetch_batches * batch_size)
 
         # Reshape images into these desired dimensions.
         height = FLAGS.image_size
@@ -441,6 +624,6 @@ def batch_inputs(dataset,
         images = tf.reshape(images, shape=[batch_size, height, width, depth])
 
         # Display the training images in the visualizer.
-        tf.image_summary('images', images)
+        tf.summary.image('images', images)
 
         return images, tf.reshape(label_index_batch, [batch_size])
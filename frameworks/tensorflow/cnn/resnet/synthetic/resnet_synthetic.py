@@ -11,47 +11,48 @@ import numpy as np
 
 from synset import *
 import argparse
-from image_processing import image_preprocessing
+from image_processing import image_preprocessing, batch_inputs, make_decoded_cache, budget_pipeline
+from datapreprocess import imagenet_manifest
+from datapreprocess.imagenet_tfrecord import PackedImageNetData
+from frameworks.tensorflow import xla
 
 FLAGS = tf.app.flags.FLAGS
 tf.app.flags.DEFINE_string('data_dir', '/home/ryan/data/ILSVRC2012/ILSVRC2012_img_train',
                            'imagenet dir')
+tf.app.flags.DEFINE_integer('manifest_workers', 16,
+                            'number of class directories scanned in parallel when building the file manifest')
+tf.app.flags.DEFINE_boolean('use_real_data', False,
+                            'train on the images of data_dir instead of synthetic tensors')
+tf.app.flags.DEFINE_string('tfrecord_dir', '',
+                           'directory of shards packed by datapreprocess/imagenet_tfrecord.py. '
+                           'When set, real data is streamed from the shards instead of one file per image')
 
 
-def file_list(data_dir):
-    dir_txt = data_dir + ".txt"
-    filenames = []
-    with open(dir_txt, 'r') as f:
-        for line in f:
-            if line[0] == '.': continue
-            line = line.rstrip()
-            fn = os.path.join(data_dir, line)
-            filenames.append(fn)
-    return filenames
-
+def label_map():
+    return dict((label_name, entry["index"]) for label_name, entry in synset_map.items())
 
-def load_data(data_dir):
-    data = []
-    i = 0
 
-    print "listing files in", data_dir
+def load_manifest(data_dir):
+    print "loading manifest of", data_dir
     start_time = time.time()
-    files = file_list(data_dir)
+    manifest = imagenet_manifest.load_manifest(data_dir, label_map=label_map(),
+                                               num_workers=FLAGS.manifest_workers)
     duration = time.time() - start_time
-    print "took %f sec" % duration
+    print "took %f sec for %d files" % (duration, len(manifest))
+    return manifest
 
-    for img_fn in files:
-        ext = os.path.splitext(img_fn)[1]
-        if ext != '.JPEG': continue
 
-        label_name = re.search(r'(n\d+)', img_fn).group(1)
-        fn = os.path.join(data_dir, img_fn)
+def file_list(data_dir):
+    return load_manifest(data_dir).filenames()
 
-        label_index = synset_map[label_name]["index"]
 
+def load_data(data_dir):
+    manifest = load_manifest(data_dir)
+    data = []
+    for fn, label_index in zip(manifest.filenames(), manifest.labels.tolist()):
         data.append({
             "filename": fn,
-            "label_name": label_name,
+            "label_name": synset[label_index].split(' ', 1)[0],
             "label_index": label_index,
             "desc": synset[label_index],
         })
@@ -60,12 +61,19 @@ def load_data(data_dir):
 
 
 def distorted_inputs():
-    data = load_data(FLAGS.data_dir)
+    if FLAGS.tfrecord_dir:
+        return batch_inputs(PackedImageNetData(FLAGS.tfrecord_dir), FLAGS.batch_size, train=True,
+                            num_readers=FLAGS.num_readers)
+
+    manifest = load_manifest(FLAGS.data_dir)
 
-    filenames = [d['filename'] for d in data]
-    label_indexes = [d['label_index'] for d in data]
+    filenames = manifest.filenames()
+    label_indexes = manifest.labels.astype(np.int32)
+    indexes = np.arange(len(manifest), dtype=np.int64)
+    cache = make_decoded_cache(len(manifest), [manifest.manifest_path])
 
-    filename, label_index = tf.train.slice_input_producer([filenames, label_indexes], shuffle=True)
+    filename, label_index, index = tf.train.slice_input_producer([filenames, label_indexes, indexes],
+                                                                 shuffle=True)
 
     num_preprocess_threads = 4
     images_and_labels = []
@@ -74,13 +82,16 @@ def distorted_inputs():
 
         bbox = []
         train = True
-        image = image_preprocessing(image_buffer, bbox, train, thread_id)
+        image = image_preprocessing(image_buffer, bbox, train, thread_id, cache=cache, cache_key=index)
         images_and_labels.append([image, label_index])
 
+    # slice_input_producer already shuffles the whole file list, only the prefetch queue needs a budget.
+    sizes = budget_pipeline(len(filenames[0]) if filenames else 1, FLAGS.batch_size, num_preprocess_threads,
+                            max_shuffle_examples=FLAGS.batch_size)
     images, label_index_batch = tf.train.batch_join(
         images_and_labels,
         batch_size=FLAGS.batch_size,
-        capacity=2 * num_preprocess_threads * FLAGS.batch_size)
+        capacity=sizes.prefetch_batches * FLAGS.batch_size)
 
     height = FLAGS.input_size
     width = FLAGS.input_size
@@ -98,19 +109,22 @@ def main(_):
         image_size = 224
         # image_shape = [FLAGS.batch_size, image_size + 3, image_size + 3, 3]
         with tf.device('/cpu:0'):
-            image_shape = [FLAGS.batch_size, image_size, image_size, 3]
-
-            labels = tf.Variable(tf.ones([FLAGS.batch_size],
-                                         dtype=tf.int32))
-            images = tf.Variable(tf.random_normal(image_shape,
-                                                  dtype=tf.float32,
-                                                  stddev=1e-1))
-        # images, labels = distorted_inputs()
-
-        logits = inference(images,
-                           num_classes=1000,
-                           is_training=True,
-                           bottleneck=True)  # use default: resnet-50
+            if FLAGS.use_real_data:
+                images, labels = distorted_inputs()
+            else:
+                image_shape = [FLAGS.batch_size, image_size, image_size, 3]
+
+                labels = tf.Variable(tf.ones([FLAGS.batch_size],
+                                             dtype=tf.int32))
+                images = tf.Variable(tf.random_normal(image_shape,
+                                                      dtype=tf.float32,
+                                                      stddev=1e-1))
+
+        with xla.jit_scope(FLAGS.xla):
+            logits = inference(images,
+                               num_classes=1000,
+                               is_training=True,
+                               bottleneck=True)  # use default: resnet-50
         # num_blocks=[2, 2, 2, 2])
 
         train(True, logits, images, labels)
@@ -123,13 +137,16 @@ if __name__ == '__main__':
     parser.add_argument("-s", "--epoch_size", help="epoch size(dataset size)", type=int, default=50000)
     # parser.add_argument("-i", "--iterations", help="iterations", type=int, default=2)
     parser.add_argument("-d", "--deviceid", help="specified device id", type=int, default=0)
-    args = parser.parse_args()
+    parser.add_argument("-x", "--xla", help="XLA JIT mode: off, global or scoped", type=str, default=xla.OFF)
+    parser.add_argument("-p", "--profile_steps", help="steady-state steps to trace, 0 for none", type=int, default=0)
+    parser.add_argument("--profile_dir", help="directory for the traces and the op table", type=str, default='.')
+    args, _ = parser.parse_known_args()  # the rest are tf flags, e.g. --data_dir
 
     epochs = args.epochs
     minibatch = args.minibatch
     # iterations = args.iterations
     iterations = int(args.epochs * args.epoch_size / args.minibatch)
     device_id = args.deviceid
-    set_parameters(epochs, minibatch, iterations, device_id)
+    set_parameters(epochs, minibatch, iterations, device_id, args.xla, args.profile_steps, args.profile_dir)
 
     tf.app.run()
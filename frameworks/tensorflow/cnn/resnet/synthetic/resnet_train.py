@@ -1,6 +1,7 @@
 from frameworks.tensorflow.cnn.resnet.synthetic.resnet import *
 import tensorflow as tf
 import os
+from frameworks.tensorflow import xla, profiler, flops
 
 MOMENTUM = 0.9
 
@@ -22,6 +23,8 @@ def train(is_training, logits, images, labels):
         num_threads = os.getenv('OMP_NUM_THREADS', 1)
         print 'num_threads: ', num_threads
         config = tf.ConfigProto(allow_soft_placement=True, intra_op_parallelism_threads=int(num_threads))
+    xla.configure_session(config, FLAGS.xla)
+    xla.print_mode(FLAGS.xla)
     with tf.device(device_str):
         global_step = tf.get_variable('global_step', [],
                                       initializer=tf.constant_initializer(0),
@@ -65,6 +68,7 @@ def train(is_training, logits, images, labels):
         batchnorm_updates = tf.get_collection(UPDATE_OPS_COLLECTION)
         batchnorm_updates_op = tf.group(*batchnorm_updates)
         train_op = tf.group(apply_gradient_op, batchnorm_updates_op)
+        flops.print_cost(tf.get_default_graph(), FLAGS.batch_size)
 
         saver = tf.train.Saver(tf.global_variables())
 
@@ -86,7 +90,8 @@ def train(is_training, logits, images, labels):
             print "resume", latest
             saver.restore(sess, latest)
         
-        very_start = time.time()
+        step_timer = xla.StepTimer()
+        step_profiler = profiler.StepProfiler.from_flags()
         for x in xrange(FLAGS.max_steps + 1):
             start_time = time.time()
 
@@ -98,11 +103,13 @@ def train(is_training, logits, images, labels):
                 i.append(summary_op)
 
             # o = sess.run(i, { is_training: True })
-            o = sess.run(i)
+            o = sess.run(i, **step_profiler.run_kwargs())
 
             loss_value = o[1]
 
             duration = time.time() - start_time
+            if not step_profiler.end_step():
+                step_timer.add(duration)
 
             # assert not np.isnan(loss_value), 'Model diverged with loss = NaN'
             if np.isnan(loss_value):
@@ -128,12 +135,14 @@ def train(is_training, logits, images, labels):
                 # _, top1_error_value = sess.run([val_op, top1_error], options={ is_training: False })
                 _, top1_error_value = sess.run([val_op, top1_error])
                 print('Validation top1 error %.2f' % top1_error_value)
-        total_time = time.time() - very_start
-        ave_batch_time = total_time / FLAGS.max_steps
+        step_profiler.save(sess.graph)
+        ave_batch_time = step_timer.average_step_time()
         print('across %d steps, %.3f +/- %.3f sec / batch' % (FLAGS.max_steps, ave_batch_time, 0))
+        step_timer.print_compile_time()
+        step_timer.print_step_times()
 
 
-def set_parameters(epochs, minibatch, iterations, device_id):
+def set_parameters(epochs, minibatch, iterations, device_id, xla_mode=xla.OFF, profile_steps=0, profile_dir='.'):
     """
     iterations means the number of iterations in each epoch
     """
@@ -150,6 +159,8 @@ def set_parameters(epochs, minibatch, iterations, device_id):
 
     tf.app.flags.DEFINE_integer('batch_size', minibatch, "batch size")
     tf.app.flags.DEFINE_integer('max_steps', epochs * iterations, "max steps")
+    tf.app.flags.DEFINE_string('xla', xla_mode, "XLA JIT mode: off, global or scoped")
+    profiler.define_flags(profile_steps, profile_dir)
     global device_str
     if int(device_id) >= 0:
         device_str = '/gpu:%d' % int(device_id)
@@ -1,3 +1,3 @@
 #!/usr/bin/env bash
 
-python ${script_path} --epochs=${epochs} --epoch_size=${epoch_size} --minibatch=${batch_size} --deviceid=${deviceId} &> $logFile
\ No newline at end of file
+python ${script_path} --epochs=${epochs} --epoch_size=${epoch_size} --minibatch=${batch_size} --deviceid=${deviceId} --xla=${xla:-off} --profile_steps=${profile_steps:-0} ${profile_dir:+--profile_dir=$profile_dir} &> $logFile
\ No newline at end of file
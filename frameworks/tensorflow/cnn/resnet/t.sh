@@ -9,8 +9,15 @@ CUDA_VISIBLE_DEVICES=$deviceId python ${script_path} \
     --epoch_size=${epoch_size} \
     --learning_rate=${learning_rate} \
     --device_id=$deviceId \
-    --xla=True \
+    --xla=${xla:-off} \
+    --profile_steps=${profile_steps:-0} \
+    ${profile_dir:+--profile_dir=$profile_dir} \
     --use_datasets=True \
+    --use_fp16=${use_fp16:-False} \
+    --inference=${inference:-False} \
+    --loadgen=${loadgen:-False} \
+    ${loadgen_report:+--loadgen_report=$loadgen_report} \
+    ${data_format:+--data_format=$data_format} \
     &> $logFile
 end=`date +%s.%N`
 runtime=$( echo "$end - $start" | bc -l )
@@ -11,6 +11,12 @@ CUDA_VISIBLE_DEVICES=$deviceId python ${script_path} \
     --learning_rate=${learning_rate} \
     --device_ids=$deviceId \
     --num_gpus=${gpu_count} \
+    --use_fp16=${use_fp16:-False} \
+    --xla=${xla:-off} \
+    --profile_steps=${profile_steps:-0} \
+    ${profile_dir:+--profile_dir=$profile_dir} \
+    ${data_format:+--data_format=$data_format} \
+    --gradient_aggregation=${gradient_aggregation:-central} \
     &> $logFile
 end=`date +%s.%N`
 runtime=$( echo "$end - $start" | bc -l )
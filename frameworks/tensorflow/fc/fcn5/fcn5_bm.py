@@ -1,11 +1,12 @@
 import tensorflow as tf
 from frameworks.tensorflow.fc.fcn5 import models
+from frameworks.tensorflow import mixed_precision, xla, inference, loadgen, profiler, flops
 import time
 import os
 import numpy as np
 from datetime import datetime
-from tensorflow.examples.tutorials.mnist import input_data
 from globalconfig import MNIST_DATA_DIR, FCN_EPOCH_SIZE
+from datapreprocess import mnist_cache
 
 EPOCH_SIZE = FCN_EPOCH_SIZE
 FLAGS = tf.app.flags.FLAGS
@@ -24,7 +25,13 @@ tf.app.flags.DEFINE_boolean('log_device_placement', False, """Whether to log dev
 # It is faster than feed_dict 1 GPU and is much faster at 2,4 and 8 GPUs.
 tf.app.flags.DEFINE_boolean('use_dataset', False, """Whether to use datasets vs. feed_dict.""")
 tf.app.flags.DEFINE_integer('num_gpus', 1, """How many GPUs to use.""")
-tf.app.flags.DEFINE_boolean('xla', False, """True to use XLA, which has to be compiled in.""")
+tf.app.flags.DEFINE_string('xla', xla.OFF, """XLA JIT mode: off, global or scoped. XLA has to be compiled in.""")
+tf.app.flags.DEFINE_boolean('inference', False, """Time the frozen forward-only graph instead of training.""")
+tf.app.flags.DEFINE_string('inference_batch_sizes', inference.LATENCY_BATCH_SIZES,
+                           """Batch sizes of the inference latency percentiles.""")
+tf.app.flags.DEFINE_integer('inference_steps', inference.DEFAULT_STEPS, """Timed runs per inference batch size.""")
+loadgen.define_flags()
+profiler.define_flags()
 
 
 def createFakeData(count, featureDim, labelDim):
@@ -45,7 +52,7 @@ def getFakeMinibatch(minibatchSize, labelDim):
     return feat, lab
 
 
-mnist = input_data.read_data_sets(FLAGS.data_dir, one_hot=True)
+mnist = None  # loaded in main(), importing this module no longer touches the data
 
 
 def get_real_batch_data(batch_size, label_dim):
@@ -53,7 +60,10 @@ def get_real_batch_data(batch_size, label_dim):
     return batch_xs, batch_ys
 
 
-def train(model='fcn5'):
+def get_session_config():
+    """
+    :return: (device_str, tf.ConfigProto)
+    """
     config = tf.ConfigProto(log_device_placement=FLAGS.log_device_placement)
     # config.gpu_options.allow_growth=True
     device_id = FLAGS.device_id
@@ -68,10 +78,22 @@ def train(model='fcn5'):
         num_threads = os.getenv('OMP_NUM_THREADS', 1)
         config = tf.ConfigProto(allow_soft_placement=True, intra_op_parallelism_threads=int(num_threads))
 
-    if FLAGS.xla:
-        # Turns on XLA.  XLA is not included in the standard build.  For single GPU this shows ~5% improvement
-        config.graph_options.optimizer_options.global_jit_level = tf.OptimizerOptions.ON_1
+    # XLA is not included in the standard build.  For single GPU global JIT shows ~5% improvement
+    xla.configure_session(config, FLAGS.xla)
+
+    mixed_precision.print_precision(FLAGS.use_fp16)
+    xla.print_mode(FLAGS.xla)
+    return device_str, config
+
 
+def build_model(model_input, model='fcn5'):
+    if model == 'fcn5':
+        return models.model_fcn5(model_input)
+    return models.model_fcn8(model_input)
+
+
+def train(model='fcn5'):
+    device_str, config = get_session_config()
     with tf.Graph().as_default(), tf.device(device_str), tf.Session(config=config) as sess:
         feature_dim = models.feature_dim
         label_dim = models.label_dim
@@ -80,8 +102,10 @@ def train(model='fcn5'):
         iterator = None
         if FLAGS.use_dataset:
             with tf.device('/CPU:0'):
-                d_features = mnist.train.images
-                d_labels = mnist.train.labels
+                # Fed from the memory-mapped arrays when the iterator is initialized instead of being
+                # embedded into the graph as constants.
+                d_features = tf.placeholder(tf.float32, mnist.train.images.shape, name='dataset_images')
+                d_labels = tf.placeholder(tf.float32, mnist.train.labels.shape, name='dataset_labels')
                 dataset = tf.contrib.data.Dataset.from_tensor_slices((d_features, d_labels))
                 dataset = dataset.repeat()
                 dataset = dataset.shuffle(buffer_size=60000)
@@ -99,25 +123,28 @@ def train(model='fcn5'):
 
         logits = None
         loss = None
-        if model == 'fcn5':
-            logits = models.model_fcn5(images)
-        else:
-            logits = models.model_fcn8(images)
-        loss = models.loss(logits, labels)
+        with mixed_precision.model_variable_scope(FLAGS.use_fp16), xla.jit_scope(FLAGS.xla):
+            model_input = tf.cast(images, mixed_precision.compute_dtype(FLAGS.use_fp16))
+            logits = build_model(model_input, model)
+            loss = models.loss(logits, labels)
 
         predictionCorrectness = tf.equal(tf.argmax(logits, 1), tf.argmax(labels, 1))
         accuracy = tf.reduce_mean(tf.cast(predictionCorrectness, "float"))
 
-        optimizer = tf.train.MomentumOptimizer(FLAGS.learning_rate, 0.9).minimize(loss)
+        loss_scaler = mixed_precision.LossScaler(FLAGS.use_fp16)
+        optimizer = loss_scaler.minimize(tf.train.MomentumOptimizer(FLAGS.learning_rate, 0.9), loss)
+        flops.print_cost(tf.get_default_graph(), FLAGS.batch_size)
 
         init = tf.global_variables_initializer()
 
         sess.run(init)
         if FLAGS.use_dataset:
-            sess.run(iterator.initializer)
+            sess.run(iterator.initializer,
+                     feed_dict={d_features: mnist.train.images, d_labels: mnist.train.labels})
         batch_size_per_epoch = int((FLAGS.epoch_size + FLAGS.batch_size - 1) / FLAGS.batch_size)
         iterations = FLAGS.epochs * batch_size_per_epoch
-        average_batch_time = 0.0
+        step_timer = xla.StepTimer()
+        step_profiler = profiler.StepProfiler.from_flags()
         epochs_info = []
         average_loss = 0.0
         for step in range(iterations):
@@ -125,13 +152,15 @@ def train(model='fcn5'):
             imgs = None
             labs = None
             if FLAGS.use_dataset:
-                _, loss_value = sess.run([optimizer, loss])
+                _, loss_value = sess.run([optimizer, loss], **step_profiler.run_kwargs())
             else:
                 imgs, labs = get_real_batch_data(FLAGS.batch_size, 10)
-                _, loss_value = sess.run([optimizer, loss], feed_dict={images: imgs, labels: labs})
+                _, loss_value = sess.run([optimizer, loss], feed_dict={images: imgs, labels: labs},
+                                         **step_profiler.run_kwargs())
             duration = time.time() - start_time
             average_loss += loss_value
-            average_batch_time += float(duration)
+            if not step_profiler.end_step():
+                step_timer.add(duration)
             assert not np.isnan(loss_value), 'Model diverged with loss = NaN'
             if step % FLAGS.log_step == 0:
                 examples_per_sec = FLAGS.batch_size / duration
@@ -145,16 +174,42 @@ def train(model='fcn5'):
                 epochs_info.append(
                     '%d:%g:%s' % (step / (FLAGS.eval_step * batch_size_per_epoch), accuracy_value, average_loss))
                 average_loss = 0.0
-        average_batch_time /= iterations
+        step_profiler.save(sess.graph)
+        average_batch_time = step_timer.average_step_time()
         print 'average_batch_time: ', average_batch_time
+        step_timer.print_compile_time()
+        step_timer.print_step_times()
         print('epoch_info: %s' % ','.join(epochs_info))
         accuracy_value = accuracy.eval(feed_dict={images: mnist.test.images, labels: mnist.test.labels})
         print("Final test accuracy %g" % accuracy_value)
 
 
+def run_inference(model='fcn5'):
+    device_str, config = get_session_config()
+
+    def build(batch_size):
+        shape = [batch_size, models.feature_dim]
+        images = tf.placeholder(tf.float32, shape, name='images')
+        with mixed_precision.model_variable_scope(FLAGS.use_fp16), xla.jit_scope(FLAGS.xla):
+            logits = build_model(tf.cast(images, mixed_precision.compute_dtype(FLAGS.use_fp16)), model)
+        probabilities = tf.nn.softmax(tf.cast(logits, tf.float32))
+        return {images: np.random.rand(*shape).astype(np.float32)}, probabilities
+
+    if FLAGS.loadgen:
+        loadgen.run_from_flags(build, device_str, config)
+    else:
+        inference.run(build, FLAGS.batch_size, device_str, config,
+                      batch_sizes=FLAGS.inference_batch_sizes, steps=FLAGS.inference_steps)
+
+
 def main(argv=None):
     os.environ['TF_SYNC_ON_FINISH'] = '0'
     os.environ['TF_ENABLE_WINOGRAD_NONFUSED'] = '1'
+    if FLAGS.inference or FLAGS.loadgen:
+        run_inference(model='fcn5')
+        return
+    global mnist
+    mnist = mnist_cache.read_data_sets(FLAGS.data_dir)
     train(model='fcn5')
 
 
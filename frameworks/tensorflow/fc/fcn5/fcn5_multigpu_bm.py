@@ -4,9 +4,10 @@ import tensorflow as tf
 import time
 import numpy as np
 from datetime import datetime
-from tensorflow.examples.tutorials.mnist import input_data
 from frameworks.tensorflow.fc.fcn5 import models
+from frameworks.tensorflow import mixed_precision, allreduce, xla, profiler, flops
 from globalconfig import MNIST_DATA_DIR, FCN_EPOCH_SIZE
+from datapreprocess import mnist_cache
 
 FLAGS = tf.app.flags.FLAGS
 # Basic model parameters.
@@ -29,10 +30,13 @@ tf.app.flags.DEFINE_boolean('log_device_placement', True,
 tf.app.flags.DEFINE_integer('num_gpus', 2, """How many GPUs to use.""")
 tf.app.flags.DEFINE_string('local_ps_device', 'GPU',
                            """Local parameter server GPU if gpus are peered or CPU otherwise try both.""")
+tf.app.flags.DEFINE_string('gradient_aggregation', allreduce.CENTRAL,
+                           """How tower gradients are summed: central, round_robin or ring.""")
 tf.app.flags.DEFINE_boolean('use_dataset', False,
                             """Whether to use datasets vs. feed_dict.""")
-tf.app.flags.DEFINE_boolean('xla', False,
-                            """True to use XLA, which has to be compiled in.""")
+tf.app.flags.DEFINE_string('xla', xla.OFF,
+                           """XLA JIT mode: off, global or scoped. XLA has to be compiled in.""")
+profiler.define_flags()
 
 EPOCH_SIZE = 60000
 TEST_SIZE = 10000
@@ -56,7 +60,7 @@ def getFakeMinibatch(minibatchSize, labelDim):
     return feat, lab
 
 
-mnist = input_data.read_data_sets(FLAGS.data_dir, one_hot=True)
+mnist = None  # loaded in main(), importing this module no longer touches the data
 
 
 def get_real_batch_data(batch_size, label_dim):
@@ -64,36 +68,11 @@ def get_real_batch_data(batch_size, label_dim):
     return batch_xs, batch_ys
 
 
-def average_gradients(tower_grads):
-    """Calculate the average gradient for each shared variable across all towers.
-
-    Note that this function provides a synchronization point across all towers.
-
-    Args:
-      tower_grads: List of lists of (gradient, variable) tuples. The outer list
-        is over individual gradients. The inner list is over the gradient
-        calculation for each tower.
-    Returns:
-       List of pairs of (gradient, variable) where the gradient has been averaged
-       across all towers.
-    """
-    average_grads = []
-    for single_grads in zip(*tower_grads):
-        grads = [g for g, _ in single_grads]
-        grad = tf.add_n(grads)
-        grad = tf.multiply(grad, 1.0 / len(grads))
-        v = single_grads[0][1]
-        grad_and_var = (grad, v)
-        average_grads.append(grad_and_var)
-    return average_grads
-
-
 def train(model='fcn5'):
     config = tf.ConfigProto(allow_soft_placement=True, log_device_placement=FLAGS.log_device_placement)
 
-    if FLAGS.xla:
-        # Turns on XLA.  XLA is not included in the standard build.  For single GPU this shows ~5% improvement
-        config.graph_options.optimizer_options.global_jit_level = tf.OptimizerOptions.ON_1
+    # XLA is not included in the standard build.  For single GPU global JIT shows ~5% improvement
+    xla.configure_session(config, FLAGS.xla)
 
     with tf.Graph().as_default(), tf.device("/" + FLAGS.local_ps_device + ":0"):
         global_step = tf.get_variable('global_step', [], initializer=tf.constant_initializer(0), trainable=False)
@@ -106,6 +85,10 @@ def train(model='fcn5'):
 
         # optimizer = tf.train.GradientDescentOptimizer(lr)
         optimizer = tf.train.MomentumOptimizer(FLAGS.learning_rate, 0.9)
+        loss_scaler = mixed_precision.LossScaler(FLAGS.use_fp16)
+        mixed_precision.print_precision(FLAGS.use_fp16)
+        allreduce.print_strategy(FLAGS.gradient_aggregation)
+        xla.print_mode(FLAGS.xla)
 
         def assign_to_device(device, ps_device=FLAGS.local_ps_device):
             worker_device = device
@@ -131,8 +114,10 @@ def train(model='fcn5'):
         labels = None
         if FLAGS.use_dataset:
             with tf.device('/CPU:0'):
-                d_features = mnist.train.images
-                d_labels = mnist.train.labels
+                # Fed from the memory-mapped arrays when the iterator is initialized instead of being
+                # embedded into the graph as constants.
+                d_features = tf.placeholder(tf.float32, mnist.train.images.shape, name='dataset_images')
+                d_labels = tf.placeholder(tf.float32, mnist.train.labels.shape, name='dataset_labels')
                 dataset = tf.contrib.data.Dataset.from_tensor_slices((d_features, d_labels))
                 dataset = dataset.shuffle(buffer_size=60000)
                 dataset = dataset.repeat()
@@ -160,22 +145,25 @@ def train(model='fcn5'):
                         images = tf.placeholder(tf.float32, [None, feature_dim], name='images')
                         labels = tf.placeholder(tf.int64, [None, label_dim], name='labels')
                         feed_vars.append((images, labels))
-                    with tf.variable_scope(tf.get_variable_scope(), reuse=reuse_variables):
-                        logits = models.model_fcn5(images)
+                    with mixed_precision.model_variable_scope(FLAGS.use_fp16, reuse=reuse_variables), \
+                            xla.jit_scope(FLAGS.xla):
+                        logits = models.model_fcn5(tf.cast(images, mixed_precision.compute_dtype(FLAGS.use_fp16)))
+                        loss = models.loss(logits, labels)
                     if i == 0:
                         # Prediction only on GPU:0
                         predictionCorrectness = tf.equal(tf.argmax(logits, 1), tf.argmax(labels, 1))
                         accuracy = tf.reduce_mean(tf.cast(predictionCorrectness, "float"))
-                    loss = models.loss(logits, labels)
                     reuse_variables = True
                     average_loss_tensor.append(loss)
-                    grads = optimizer.compute_gradients(loss)
+                    grads = loss_scaler.compute_gradients(optimizer, loss)
                     tower_grads.append(grads)
 
-        grads = average_gradients(tower_grads)
-        apply_gradient_op = optimizer.apply_gradients(grads, global_step=global_step)
+        tower_devices = ['/gpu:%s' % device_ids[i] for i in range(FLAGS.num_gpus)]
+        grads = allreduce.aggregate_gradients(tower_grads, FLAGS.gradient_aggregation, tower_devices)
+        apply_gradient_op = loss_scaler.apply_gradients(optimizer, grads, global_step=global_step)
 
         train_op = apply_gradient_op
+        flops.print_cost(tf.get_default_graph(), FLAGS.batch_size)
         average_op = tf.reduce_mean(average_loss_tensor)
         saver = tf.train.Saver(tf.global_variables())
 
@@ -183,12 +171,14 @@ def train(model='fcn5'):
         sess = tf.Session(config=config)
         sess.run(init)
         if FLAGS.use_dataset:
-            sess.run(iterator.initializer)
+            sess.run(iterator.initializer,
+                     feed_dict={d_features: mnist.train.images, d_labels: mnist.train.labels})
 
         real_batch_size = FLAGS.batch_size * FLAGS.num_gpus
         num_batches_per_epoch = int((FLAGS.epoch_size + real_batch_size - 1) / real_batch_size)
         iterations = FLAGS.epochs * num_batches_per_epoch
-        average_batch_time = 0.0
+        step_timer = xla.StepTimer()
+        step_profiler = profiler.StepProfiler.from_flags()
         epochs_info = []
 
         step = 0
@@ -201,9 +191,10 @@ def train(model='fcn5'):
                 for i in range(FLAGS.num_gpus):
                     feed_dict[feed_vars[i][0]] = imgs[i * FLAGS.batch_size:(i + 1) * FLAGS.batch_size]
                     feed_dict[feed_vars[i][1]] = labs[i * FLAGS.batch_size:(i + 1) * FLAGS.batch_size]
-            _, loss_value = sess.run([train_op, average_op], feed_dict=feed_dict)
+            _, loss_value = sess.run([train_op, average_op], feed_dict=feed_dict, **step_profiler.run_kwargs())
             duration = time.time() - start_time
-            average_batch_time += float(duration)
+            if not step_profiler.end_step():
+                step_timer.add(duration)
             average_loss += loss_value
 
             assert not np.isnan(loss_value), 'Model diverged with loss = NaN'
@@ -230,8 +221,11 @@ def train(model='fcn5'):
         checkpoint_path = os.path.join(FLAGS.train_dir, 'model.ckpt')
         saver.save(sess, checkpoint_path, global_step=step)
 
-        average_batch_time /= iterations
+        step_profiler.save(sess.graph)
+        average_batch_time = step_timer.average_step_time()
         print 'average_batch_time: ', average_batch_time
+        step_timer.print_compile_time()
+        step_timer.print_step_times()
         print('epoch_info: %s' % ','.join(epochs_info))
         accuracy_value = accuracy.eval(session=sess, feed_dict=feed_dict)
         print("Final test accuracy %g" % accuracy_value)
@@ -240,6 +234,8 @@ def train(model='fcn5'):
 def main(argv=None):
     os.environ['TF_SYNC_ON_FINISH'] = '0'
     os.environ['TF_ENABLE_WINOGRAD_NONFUSED'] = '1'
+    global mnist
+    mnist = mnist_cache.read_data_sets(FLAGS.data_dir)
     train(model='fcn5')
 
 
@@ -7,15 +7,15 @@ hidden_layer_dim = 2048
 num_minibatch = 100
 
 
-def get_variable(name, shape, is_bias=False):
+def get_variable(name, shape, is_bias=False, dtype=tf.float32):
     if is_bias:
-        return tf.get_variable(name, shape, initializer=tf.constant_initializer(0.1))
-    return tf.get_variable(name, shape, initializer=tf.truncated_normal_initializer(stddev=0.1))
+        return tf.get_variable(name, shape, dtype=dtype, initializer=tf.constant_initializer(0.1))
+    return tf.get_variable(name, shape, dtype=dtype, initializer=tf.truncated_normal_initializer(stddev=0.1))
 
 
 def sigmoid_DNN_layer(layer_idx, input, input_dim, output_dim):
-    W = get_variable("W" + str(layer_idx), [input_dim, output_dim])
-    B = get_variable("B" + str(layer_idx), [output_dim], is_bias=True)
+    W = get_variable("W" + str(layer_idx), [input_dim, output_dim], dtype=input.dtype)
+    B = get_variable("B" + str(layer_idx), [output_dim], is_bias=True, dtype=input.dtype)
     return tf.nn.sigmoid(tf.nn.xw_plus_b(input, W, B))
 
 
@@ -24,8 +24,8 @@ def model_fcn5(features):
     HL1 = sigmoid_DNN_layer(1, HL0, 2048, 4096)
     HL2 = sigmoid_DNN_layer(2, HL1, 4096, 1024)
 
-    outputLayerW = get_variable("W5", [1024, label_dim])
-    outputLayerB = get_variable("B5", [label_dim], is_bias=True)
+    outputLayerW = get_variable("W5", [1024, label_dim], dtype=features.dtype)
+    outputLayerB = get_variable("B5", [label_dim], is_bias=True, dtype=features.dtype)
     outputLayer = tf.nn.xw_plus_b(HL2, outputLayerW, outputLayerB)
     # outputLayer = tf.nn.softmax(tf.nn.xw_plus_b(HL2, outputLayerW, outputLayerB))
     return outputLayer
@@ -39,13 +39,14 @@ def model_fcn8(features):
     HL4 = sigmoid_DNN_layer(4, HL3, hidden_layer_dim, hidden_layer_dim)
     HL5 = sigmoid_DNN_layer(5, HL4, hidden_layer_dim, hidden_layer_dim)
 
-    outputLayerW = get_variable("W8", [hidden_layer_dim, label_dim])
-    outputLayerB = get_variable("B8", [label_dim])
+    outputLayerW = get_variable("W8", [hidden_layer_dim, label_dim], dtype=features.dtype)
+    outputLayerB = get_variable("B8", [label_dim], dtype=features.dtype)
     outputLayer = tf.nn.xw_plus_b(HL5, outputLayerW, outputLayerB)
     return outputLayer
 
 
 def loss(logits, labels):
+    logits = tf.cast(logits, tf.float32)
     labels = tf.to_int64(labels)
     cross_entropy = tf.nn.softmax_cross_entropy_with_logits(logits=logits, labels=labels)
     loss = tf.reduce_mean(cross_entropy, name='cross_entropy_mean')
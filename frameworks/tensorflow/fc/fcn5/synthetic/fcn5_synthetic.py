@@ -5,6 +5,7 @@ import tensorflow as tf
 # import ffn
 import argparse
 
+from frameworks.tensorflow import xla, profiler, flops
 from frameworks.tensorflow.fc.fcn5.synthetic.ffn import *
 
 device_str = ''
@@ -33,6 +34,9 @@ if __name__ == '__main__':
     parser.add_argument("-b", "--minibatch", help="minibatch size", type=int, default=128)
     # parser.add_argument("-i", "--iterations", help="iterations", type=int, default=2)
     parser.add_argument("-d", "--deviceid", help="specified device id", type=int, default=0)
+    parser.add_argument("-x", "--xla", help="XLA JIT mode: off, global or scoped", type=str, default=xla.OFF)
+    parser.add_argument("-p", "--profile_steps", help="steady-state steps to trace, 0 for none", type=int, default=0)
+    parser.add_argument("--profile_dir", help="directory for the traces and the op table", type=str, default='.')
     args = parser.parse_args()
 
     epochs = args.epochs
@@ -57,10 +61,14 @@ if __name__ == '__main__':
         num_threads = os.getenv('OMP_NUM_THREADS', 1)
         print 'num_threads: ', num_threads
         config = tf.ConfigProto(allow_soft_placement=True, intra_op_parallelism_threads=int(num_threads))
+    xla.configure_session(config, args.xla)
+    xla.print_mode(args.xla)
 
     with tf.device(device_str):
-        crossEntropy, accuracy = getLossAndAccuracyForSubBatch(features, labels)
+        with xla.jit_scope(args.xla):
+            crossEntropy, accuracy = getLossAndAccuracyForSubBatch(features, labels)
         trainStep = tf.train.GradientDescentOptimizer(0.01).minimize(crossEntropy)
+        flops.print_cost(tf.get_default_graph(), minibatchSize)
 
         # Train
         # sess = tf.Session(config=tf.ConfigProto(log_device_placement=FLAGS.logDevicePlacement, allow_soft_placement=True))
@@ -69,20 +77,30 @@ if __name__ == '__main__':
         sess.run(init)
 
         perMinibatchTime = []
+        step_timer = xla.StepTimer()
+        step_profiler = profiler.StepProfiler(args.profile_steps, output_dir=args.profile_dir)
         for i in range(numMinibatches):
             if (FLAGS.noInputFeed == False):
                 minibatchFeatures, minibatchLabels = getFakeMinibatch(minibatchSize)
 
             startTime = time.time()
             if (FLAGS.noInputFeed):
-                sess.run([trainStep, accuracy])
+                sess.run([trainStep, accuracy], **step_profiler.run_kwargs())
             else:
-                sess.run([trainStep, accuracy], feed_dict={features: minibatchFeatures, labels: minibatchLabels})
+                sess.run([trainStep, accuracy], feed_dict={features: minibatchFeatures, labels: minibatchLabels},
+                         **step_profiler.run_kwargs())
 
             currMinibatchDuration = time.time() - startTime
+            if step_profiler.end_step():
+                continue
             perMinibatchTime.append(currMinibatchDuration)
+            step_timer.add(currMinibatchDuration)
 
-        printTrainingStats(1, minibatchSize, perMinibatchTime)
+        step_profiler.save(sess.graph)
+        # The first minibatch includes graph optimisation and XLA compilation, it is reported separately.
+        printTrainingStats(1, minibatchSize, perMinibatchTime[1:] or perMinibatchTime)
+        step_timer.print_compile_time()
+        step_timer.print_step_times()
 
         program_end_time = time.time()
         # print('Program finished, Total seconds: %s' % (program_end_time - program_start_time))
@@ -9,6 +9,13 @@ CUDA_VISIBLE_DEVICES=$deviceId python ${script_path} \
  --epoch_size=${epoch_size} \
  --learning_rate=${learning_rate} \
  --device_id=$deviceId \
+ --use_fp16=${use_fp16:-False} \
+ --xla=${xla:-off} \
+ --profile_steps=${profile_steps:-0} \
+ ${profile_dir:+--profile_dir=$profile_dir} \
+ --inference=${inference:-False} \
+ --loadgen=${loadgen:-False} \
+ ${loadgen_report:+--loadgen_report=$loadgen_report} \
  &> $logFile
 end=`date +%s.%N`
 runtime=$( echo "$end - $start" | bc -l )
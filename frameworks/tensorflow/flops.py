@@ -0,0 +1,236 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+""" flops.py: Analytic FLOPs, parameters and activation bytes of a built training graph.
+
+The cost is read off the static op shapes of the graph, nothing is run. Convolutions, matrix products and the fused
+LSTM kernels count 2 FLOPs per multiply-add, element-wise ops, pooling and normalization a few FLOPs per element
+(see _PER_ELEMENT); data movement (reshape, transpose, concat, casts, queues, ...) is free. An unknown first
+dimension is taken as the batch size, ops with other unknown dimensions are left out and reported. The memory
+traffic of a step is the bytes every op with FLOPs reads and writes, as if nothing stayed in cache between ops,
+the usual count for placing a model on a roofline (see device_specs.roofline).
+
+The graph is split into the forward pass and the backward pass: the ops in a 'gradients' name scope and every op
+that consumes their results (gradient aggregation, loss scaling, the optimizer update) are backward. Ops inside a
+while loop (tf.nn.dynamic_rnn) run once per iteration, the caller passes the trip count as loop_iterations.
+
+Build the training model first and call print_cost before anything else (an evaluation model, the saver) is added
+to the graph. The numbers are for one step of the whole graph, i.e. all towers of a multi-GPU model.
+"""
+
+import re
+from collections import namedtuple
+
+import tensorflow as tf
+
+FORWARD_TEMPLATE = 'flops_forward: %d'
+BACKWARD_TEMPLATE = 'flops_backward: %d'
+PARAMETERS_TEMPLATE = 'parameters: %d'
+PARAMETER_BYTES_TEMPLATE = 'parameter_bytes: %d'
+ACTIVATION_BYTES_TEMPLATE = 'activation_bytes: %d'
+MEMORY_BYTES_TEMPLATE = 'memory_bytes: %d'
+
+GRADIENT_SCOPE = re.compile(r'(^|/)gradients(_\d+)?/')
+
+Cost = namedtuple('Cost', ['forward_flops', 'backward_flops', 'parameters', 'parameter_bytes', 'activation_bytes',
+                           'memory_bytes', 'unknown_ops'])
+
+# FLOPs per element of the first output.
+_PER_ELEMENT = {
+    'Add': 1, 'AddV2': 1, 'Sub': 1, 'Mul': 1, 'RealDiv': 1, 'Div': 1, 'Maximum': 1, 'Minimum': 1, 'Neg': 1,
+    'Square': 1, 'SquaredDifference': 2, 'Sqrt': 1, 'Rsqrt': 1, 'Reciprocal': 1, 'Exp': 1, 'Log': 1, 'Pow': 1,
+    'Relu': 1, 'ReluGrad': 1, 'Relu6': 1, 'Relu6Grad': 1, 'Elu': 1, 'EluGrad': 1,
+    'Sigmoid': 4, 'SigmoidGrad': 3, 'Tanh': 4, 'TanhGrad': 3,
+    'BiasAdd': 1, 'Softmax': 5, 'LogSoftmax': 5, 'LRN': 6, 'LRNGrad': 12,
+    'FusedBatchNorm': 5, 'FusedBatchNormV2': 5, 'FusedBatchNormGrad': 10, 'FusedBatchNormGradV2': 10,
+    'ApplyGradientDescent': 2, 'ApplyMomentum': 4,
+}
+
+# FLOPs per element of the first input.
+_PER_INPUT_ELEMENT = {
+    'BiasAddGrad': 1, 'Sum': 1, 'Mean': 1, 'Max': 1, 'ArgMax': 1, 'L2Loss': 2,
+    'SoftmaxCrossEntropyWithLogits': 6, 'SparseSoftmaxCrossEntropyWithLogits': 6,
+}
+
+# Gates of a CudnnRNN cell per rnn_mode.
+_CUDNN_GATES = {'lstm': 4, 'gru': 3, 'rnn_relu': 1, 'rnn_tanh': 1}
+
+
+def _dims(tensor, batch_size):
+    """Static shape of tensor as a list of ints, an unknown first dimension taken as batch_size. None if unknown."""
+    shape = tensor.get_shape()
+    if shape.ndims is None:
+        return None
+    dims = shape.as_list()
+    if dims and dims[0] is None:
+        dims[0] = batch_size
+    if any(d is None for d in dims):
+        return None
+    return dims
+
+
+def _elements(dims):
+    count = 1
+    for d in dims:
+        count *= d
+    return count
+
+
+def _attr(op, name, default=None):
+    try:
+        return op.get_attr(name)
+    except ValueError:
+        return default
+
+
+def _tensor_bytes(tensors, batch_size):
+    """Bytes of the tensors of known shape and numeric dtype."""
+    total = 0
+    for tensor in tensors:
+        dims = _dims(tensor, batch_size)
+        if dims is not None and (tensor.dtype.is_floating or tensor.dtype.is_integer):
+            total += _elements(dims) * tensor.dtype.size
+    return total
+
+
+def _conv_backprop(out_backprop, filter_dims):
+    kh, kw, cin, _ = filter_dims
+    return 2 * _elements(out_backprop) * kh * kw * cin
+
+
+def _lstm_step(batch, input_size, cell_size, gates=4):
+    return 2 * batch * (input_size + cell_size) * gates * cell_size + 10 * batch * cell_size
+
+
+def _op_flops(op, batch_size):
+    """FLOPs of one run of op, None if its shapes are not known."""
+    t = op.type
+    if t in _PER_ELEMENT:
+        out = _dims(op.outputs[0], batch_size) if op.outputs else _dims(op.inputs[0], batch_size)
+        return out and _PER_ELEMENT[t] * _elements(out)
+    if t in _PER_INPUT_ELEMENT:
+        x = _dims(op.inputs[0], batch_size)
+        return x and _PER_INPUT_ELEMENT[t] * _elements(x)
+    if t == 'AddN':
+        out = _dims(op.outputs[0], batch_size)
+        return out and (len(op.inputs) - 1) * _elements(out)
+    if t == 'Conv2D':
+        out, w = _dims(op.outputs[0], batch_size), _dims(op.inputs[1], batch_size)
+        return out and w and 2 * _elements(out) * w[0] * w[1] * w[2]
+    if t == 'Conv2DBackpropInput':
+        grad, w = _dims(op.inputs[2], batch_size), _dims(op.inputs[1], batch_size)
+        return grad and w and _conv_backprop(grad, w)
+    if t == 'Conv2DBackpropFilter':
+        grad, w = _dims(op.inputs[2], batch_size), _dims(op.outputs[0], batch_size)
+        return grad and w and _conv_backprop(grad, w)
+    if t in ('MatMul', 'BatchMatMul'):
+        out, a = _dims(op.outputs[0], batch_size), _dims(op.inputs[0], batch_size)
+        transposed = _attr(op, 'transpose_a', False) or _attr(op, 'adj_x', False)
+        return out and a and 2 * _elements(out) * (a[-2] if transposed else a[-1])
+    if t in ('MaxPool', 'AvgPool'):
+        out = _dims(op.outputs[0], batch_size)
+        return out and _elements(out) * _elements(_attr(op, 'ksize'))
+    if t in ('MaxPoolGrad', 'AvgPoolGrad'):
+        grad = _dims(op.inputs[-1], batch_size)
+        return grad and _elements(grad) * _elements(_attr(op, 'ksize'))
+    if t in ('LSTMBlockCell', 'LSTMBlockCellGrad'):
+        x, h = _dims(op.inputs[0], batch_size), _dims(op.inputs[2], batch_size)
+        flops = x and h and _lstm_step(x[0], x[1], h[1])
+        return flops and (2 * flops if t.endswith('Grad') else flops)
+    if t in ('BlockLSTM', 'BlockLSTMGrad'):
+        x, h = _dims(op.inputs[1], batch_size), _dims(op.inputs[3], batch_size)
+        flops = x and h and x[0] * _lstm_step(x[1], x[2], h[1])
+        return flops and (2 * flops if t.endswith('Grad') else flops)
+    if t in ('CudnnRNN', 'CudnnRNNV2', 'CudnnRNNBackprop', 'CudnnRNNBackpropV2'):
+        x, h = _dims(op.inputs[0], batch_size), _dims(op.inputs[1], batch_size)
+        if not (x and h):
+            return None
+        gates = _CUDNN_GATES.get(_attr(op, 'rnn_mode', 'lstm'), 4)
+        num_layers, batch, units = h
+        flops = sum(x[0] * _lstm_step(batch, x[2] if layer == 0 else units, units, gates)
+                    for layer in range(num_layers))
+        return 2 * flops if 'Backprop' in t else flops
+    return 0
+
+
+def _loop_multiplier(op, loop_iterations):
+    context = op._get_control_flow_context()
+    while context is not None:
+        if getattr(context, 'IsWhileContext', lambda: False)():
+            return loop_iterations
+        context = getattr(context, 'outer_context', None)
+    return 1
+
+
+def _backward_ops(graph):
+    """The ops in a gradients scope and all ops downstream of them."""
+    backward = set()
+    pending = [op for op in graph.get_operations() if GRADIENT_SCOPE.search(op.name)]
+    while pending:
+        op = pending.pop()
+        if op in backward:
+            continue
+        backward.add(op)
+        for output in op.outputs:
+            pending.extend(output.consumers())
+    return backward
+
+
+def graph_cost(graph, batch_size, loop_iterations=1):
+    """
+    Cost of one step of graph.
+    :param batch_size: substituted for unknown first dimensions (placeholders of the fcn5 model)
+    :param loop_iterations: trip count of the while loops in the graph
+    :return: Cost, unknown_ops maps the op types left out for unknown shapes to their count
+    """
+    backward = _backward_ops(graph)
+    forward_flops = 0
+    backward_flops = 0
+    activation_bytes = 0
+    memory_bytes = 0
+    unknown_ops = {}
+    for op in graph.get_operations():
+        flops = _op_flops(op, batch_size)
+        if flops is None:
+            unknown_ops[op.type] = unknown_ops.get(op.type, 0) + 1
+            continue
+        if not flops:
+            continue
+        multiplier = _loop_multiplier(op, loop_iterations)
+        flops *= multiplier
+        memory_bytes += (_tensor_bytes(op.inputs, batch_size) + _tensor_bytes(op.outputs, batch_size)) * multiplier
+        if op in backward:
+            backward_flops += flops
+            continue
+        forward_flops += flops
+        # What a compute op of the forward pass outputs is what the backward pass may keep alive.
+        for output in op.outputs:
+            dims = _dims(output, batch_size)
+            if dims is not None and output.dtype.is_floating:
+                activation_bytes += _elements(dims) * output.dtype.size * multiplier
+
+    parameters = 0
+    parameter_bytes = 0
+    for variable in graph.get_collection(tf.GraphKeys.TRAINABLE_VARIABLES):
+        dims = _dims(variable, batch_size)
+        if dims is None:
+            continue
+        parameters += _elements(dims)
+        parameter_bytes += _elements(dims) * variable.dtype.base_dtype.size
+    return Cost(forward_flops, backward_flops, parameters, parameter_bytes, activation_bytes, memory_bytes,
+                unknown_ops)
+
+
+def print_cost(graph, batch_size, loop_iterations=1):
+    """Print the cost of one step of graph (see graph_cost) in the form the harness extracts."""
+    cost = graph_cost(graph, batch_size, loop_iterations)
+    print(FORWARD_TEMPLATE % cost.forward_flops)
+    print(BACKWARD_TEMPLATE % cost.backward_flops)
+    print(PARAMETERS_TEMPLATE % cost.parameters)
+    print(PARAMETER_BYTES_TEMPLATE % cost.parameter_bytes)
+    print(ACTIVATION_BYTES_TEMPLATE % cost.activation_bytes)
+    print(MEMORY_BYTES_TEMPLATE % cost.memory_bytes)
+    if cost.unknown_ops:
+        print('flops: left out for unknown shapes: %s'
+              % ', '.join('%s x%d' % item for item in sorted(cost.unknown_ops.items())))
+    return cost
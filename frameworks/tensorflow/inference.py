@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+""" inference.py: Forward-only throughput and latency of a frozen model graph.
+
+For every batch size the model is built in a graph of its own, its randomly initialized variables are folded into
+constants and the frozen GraphDef is imported into a fresh graph, the way a serving process loads it. The timed
+runs therefore contain neither variables nor an optimizer or input pipeline: random host arrays are fed and the
+output is fetched back to the host on every run.
+
+The first run of a batch size is kept out of the statistics (it pays for graph optimisation, autotuning and the
+XLA compilation), a few more warm-up runs follow before the timed ones. Throughput is measured at the batch size
+of the test, latency percentiles at small serving batch sizes.
+"""
+
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from frameworks.tensorflow import xla
+
+LATENCY_BATCH_SIZES = '1,8,32'
+PERCENTILES = (50, 90, 99)
+DEFAULT_STEPS = 100
+DEFAULT_WARMUP_STEPS = 10
+THROUGHPUT_TEMPLATE = 'inference_throughput: %.1f'  # examples per second
+LATENCY_TEMPLATE = 'inference_latency_ms: batch=%d p50=%.3f p90=%.3f p99=%.3f'
+
+
+def parse_batch_sizes(value):
+    """'1,8,32' -> [1, 8, 32]"""
+    return [int(b) for b in str(value).split(',') if b.strip()]
+
+
+def image_shape(batch_size, data_format, image_size, channels=3):
+    if data_format == 'NHWC':
+        return [batch_size, image_size, image_size, channels]
+    return [batch_size, channels, image_size, image_size]
+
+
+def freeze(build_fn, batch_size, device_str):
+    """
+    Build the model for batch_size, initialize it and fold its variables into constants.
+    :param build_fn: build_fn(batch_size) -> (feeds, output), called in a new graph on device_str. feeds maps the
+        input placeholders to numpy arrays to feed, output is the tensor a request fetches
+    :return: (frozen GraphDef, {input tensor name: array}, output tensor name)
+    """
+    with tf.Graph().as_default() as graph:
+        with tf.device(device_str):
+            feeds, output = build_fn(batch_size)
+        with tf.Session(graph=graph, config=tf.ConfigProto(allow_soft_placement=True)) as sess:
+            sess.run(tf.global_variables_initializer())
+            graph_def = tf.graph_util.convert_variables_to_constants(sess, graph.as_graph_def(), [output.op.name])
+    return graph_def, dict((placeholder.name, value) for placeholder, value in feeds.items()), output.name
+
+
+def time_runs(graph_def, feed_values, output_name, config, steps=DEFAULT_STEPS, warmup_steps=DEFAULT_WARMUP_STEPS):
+    """
+    Run a frozen graph 1 + warmup_steps + steps times.
+    :param config: tf.ConfigProto of the session, global XLA JIT is set on it by the caller
+    :return: (seconds of the first run, list of seconds of the timed runs)
+    """
+    with tf.Graph().as_default() as graph:
+        tf.import_graph_def(graph_def, name='')
+        output = graph.get_tensor_by_name(output_name)
+        feed_dict = dict((graph.get_tensor_by_name(name), value) for name, value in feed_values.items())
+        with tf.Session(graph=graph, config=config) as sess:
+            start_time = time.time()
+            sess.run(output, feed_dict=feed_dict)
+            first_run_time = time.time() - start_time
+            for _ in range(warmup_steps):
+                sess.run(output, feed_dict=feed_dict)
+            durations = []
+            for _ in range(steps):
+                start_time = time.time()
+                sess.run(output, feed_dict=feed_dict)
+                durations.append(time.time() - start_time)
+    return first_run_time, durations
+
+
+def latency_percentiles(durations):
+    """PERCENTILES of durations (seconds) in milliseconds."""
+    return [np.percentile(durations, p) * 1000.0 for p in PERCENTILES]
+
+
+def run(build_fn, throughput_batch_size, device_str, config, batch_sizes=LATENCY_BATCH_SIZES, steps=DEFAULT_STEPS,
+        warmup_steps=DEFAULT_WARMUP_STEPS):
+    """
+    Print the inference throughput at throughput_batch_size and the latency percentiles at batch_sizes.
+    :param build_fn: see freeze()
+    :param batch_sizes: comma separated batch sizes of the latency percentiles
+    """
+    batch_sizes = parse_batch_sizes(batch_sizes)
+    results = {}
+    for batch_size in sorted(set(batch_sizes + [throughput_batch_size])):
+        graph_def, feed_values, output_name = freeze(build_fn, batch_size, device_str)
+        results[batch_size] = time_runs(graph_def, feed_values, output_name, config, steps, warmup_steps)
+        print('inference batch %d: %.3f ms median' % (batch_size, np.median(results[batch_size][1]) * 1000.0))
+
+    first_run_time, durations = results[throughput_batch_size]
+    average_run_time = sum(durations) / len(durations)
+    print(THROUGHPUT_TEMPLATE % (throughput_batch_size / average_run_time))
+    print(xla.COMPILE_TIME_TEMPLATE % max(0.0, first_run_time - average_run_time))
+    for batch_size in batch_sizes:
+        print(LATENCY_TEMPLATE % tuple([batch_size] + latency_percentiles(results[batch_size][1])))
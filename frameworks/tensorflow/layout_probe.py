@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+""" layout_probe.py: Pick the faster data_format (NCHW or NHWC) of a CNN on the device it will run on.
+
+The single-device training script of the network is run for a handful of steps in each layout and the one with
+the lower average_batch_time wins. Multi-GPU rows are probed on their first device with the batch of one tower.
+Winners are cached in a json file keyed by the machine fingerprint (hardware, driver, CUDA, cuDNN and TensorFlow
+versions, see fingerprint.py), the device, network, per-tower batch size, precision and XLA mode, so a layout is
+only probed once per machine configuration.
+A layout whose probe fails (e.g. NCHW on a CPU build without MKL) simply drops out of the comparison.
+"""
+
+import os
+import json
+import time
+import shutil
+import logging
+
+from globalconfig import CNN, DataFormat, BENCHMARK_CACHE_DIR
+from extract_info import extract_info_tensorflow
+import fingerprint
+
+logger = logging.getLogger(__name__ if __name__ != '__main__' else os.path.splitext(os.path.basename(__file__))[0])
+logger.setLevel(logging.DEBUG)
+
+LAYOUTS = (DataFormat.nchw, DataFormat.nhwc)
+CACHE_FILE = os.path.join(BENCHMARK_CACHE_DIR, 'layout_probe.json')
+DEFAULT_PROBE_STEPS = 50
+
+
+def supports(network, gpu_count):
+    """Whether the scripts of network honour --data_format. alexnet_multigpu_bm.py pads in NCHW only."""
+    return network == CNN.resnet or (network == CNN.alexnet and int(gpu_count) == 1)
+
+
+def hardware_key(dev_id):
+    first_id = str(dev_id).split(',')[0]
+    return '%s:%s' % (fingerprint.current(), 'cpu' if first_id == '-1' else 'gpu%s' % first_id)
+
+
+def cache_key(dev_id, network, batch_size, precision, xla_mode='off'):
+    return '|'.join([hardware_key(dev_id), network, str(batch_size), str(precision), str(xla_mode)])
+
+
+def load_cache(cache_file=CACHE_FILE):
+    if not os.path.isfile(cache_file):
+        return {}
+    try:
+        with open(cache_file, 'r') as f:
+            return json.load(f)
+    except ValueError:
+        logger.warning('Ignoring corrupt layout cache: %s' % cache_file)
+        return {}
+
+
+def save_cache(cache, cache_file=CACHE_FILE):
+    cache_dir = os.path.dirname(cache_file)
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    tmp_file = cache_file + '.tmp'
+    with open(tmp_file, 'w') as f:
+        json.dump(cache, f, indent=2, sort_keys=True)
+    os.rename(tmp_file, cache_file)
+
+
+def probe_layout(shell_script, envs, layout, log_dir, probe_steps=DEFAULT_PROBE_STEPS):
+    """
+    Run shell_script for probe_steps steps in layout.
+    :param shell_script: single-device t.sh of the network
+    :param envs: environment variables of the real run, overridden for the probe
+    :return: average batch time in seconds, None if the run failed
+    """
+    probe_dir = os.path.join(log_dir, 'layout-probe-%s' % layout)
+    if not os.path.isdir(probe_dir):
+        os.makedirs(probe_dir)
+    probe_log = os.path.join(probe_dir, 'training.log')
+    probe_envs = dict(envs)
+    probe_envs.update({
+        'epochs': 1,
+        'epoch_size': int(envs['batch_size']) * probe_steps,
+        'train_dir': os.path.join(probe_dir, 'train-dir-%s' % str(int(time.time()))),
+        'logFile': probe_log,
+        'data_format': layout,
+        'profile_steps': 0,
+    })
+    envs_str = ' '.join(['%s=%s' % (k, v) for k, v in probe_envs.items()])
+    cmd = '%s bash %s' % (envs_str, shell_script)
+    logger.debug('[Layout probe] Executing shell: %s' % cmd)
+    try:
+        if os.system(cmd) != 0:
+            logger.warning('[Layout probe] %s failed, see %s' % (layout, probe_log))
+            return None
+        average_batch_time = extract_info_tensorflow(probe_log)
+    finally:
+        if os.path.isdir(probe_envs['train_dir']):
+            shutil.rmtree(probe_envs['train_dir'])
+    if average_batch_time <= 0:
+        logger.warning('[Layout probe] No timing found for %s in %s' % (layout, probe_log))
+        return None
+    return average_batch_time
+
+
+def choose_layout(tool_path, network, envs, dev_id, batch_size, precision, log_dir, gpu_count=1,
+                  probe_steps=DEFAULT_PROBE_STEPS, cache_file=CACHE_FILE):
+    """
+    Cached or freshly probed fastest layout of network on the first device of dev_id.
+    :param tool_path: directory of the network scripts
+    :param envs: environment variables of the real run (see tensorflowbm.run)
+    :param batch_size: global batch size of the run, tm.sh splits it between gpu_count towers
+    :return: DataFormat.nchw or DataFormat.nhwc, None if no layout could be probed
+    """
+    # The probe runs one tower on one device, with the batch each tower of the real run gets.
+    tower_batch_size = max(1, int(batch_size) // int(gpu_count))
+    key = cache_key(dev_id, network, tower_batch_size, precision, envs.get('xla', 'off'))
+    cache = load_cache(cache_file)
+    if key in cache:
+        logger.info('[Layout probe] Cached %s for %s' % (cache[key]['data_format'], key))
+        return cache[key]['data_format']
+
+    first_id = str(dev_id).split(',')[0]
+    single_envs = dict(envs)
+    single_envs.update({
+        'CUDA_VISIBLE_DEVICE': first_id,
+        'deviceId': first_id,
+        'script_path': os.path.join(tool_path, '%s_bm.py' % network),
+        'batch_size': tower_batch_size,
+    })
+    timings = {}
+    for layout in LAYOUTS:
+        average_batch_time = probe_layout(os.path.join(tool_path, 't.sh'), single_envs, layout, log_dir,
+                                          probe_steps)
+        if average_batch_time is not None:
+            timings[layout] = average_batch_time
+    if not timings:
+        logger.error('[Layout probe] No layout could be probed for %s' % key)
+        return None
+    winner = min(timings, key=timings.get)
+    logger.info('[Layout probe] %s wins for %s: %s' % (winner, key, timings))
+    cache[key] = {'data_format': winner, 'timings': timings, 'probe_steps': probe_steps}
+    save_cache(cache, cache_file)
+    return winner
@@ -0,0 +1,322 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+""" loadgen.py: Serving-style load on a frozen forward-only model from concurrent client threads.
+
+One tf.Session holds the frozen graph (see inference.freeze) of every allowed batch size. A request is a single
+example. Without dynamic batching a client runs its request alone in the batch 1 graph. With dynamic batching the
+requests are queued and a batcher thread runs up to max_batch_size of them together, waiting at most max_delay for
+a batch to fill and padding it to the next allowed batch size.
+
+  * closed loop  K clients each send their next request as soon as the previous one is answered.
+  * open loop    requests arrive as a Poisson process at a target QPS and are sent by K client threads. Latency
+                 counts from the scheduled arrival, so the time a request waits for a free client is included.
+
+Every load point is measured for a fixed duration after a warm-up and gives the achieved throughput and latency
+percentiles. A sweep over concurrencies and target QPS values is the latency-vs-throughput curve; by default the
+open-loop targets are fractions of the closed-loop peak throughput.
+"""
+
+import csv
+import time
+import Queue
+import random
+import threading
+from collections import namedtuple
+
+import numpy as np
+import tensorflow as tf
+
+from frameworks.tensorflow import inference
+
+CLOSED = 'closed'
+OPEN = 'open'
+PERCENTILES = (50, 90, 99, 99.9)
+OPEN_LOOP_LOAD_FACTORS = (0.25, 0.5, 0.75, 0.9, 1.0)
+POINT_TEMPLATE = 'loadgen: loop=%s concurrency=%d target_qps=%s throughput=%.1f mean_batch_size=%.2f ' \
+                 'p50=%.3f p90=%.3f p99=%.3f p999=%.3f'
+
+LoadPoint = namedtuple('LoadPoint', ['loop', 'concurrency', 'target_qps', 'requests', 'throughput', 'mean_batch_size',
+                                     'p50_ms', 'p90_ms', 'p99_ms', 'p999_ms'])
+
+
+def define_flags():
+    """Define the --loadgen* flags of a benchmark script."""
+    flags = tf.app.flags
+    flags.DEFINE_boolean('loadgen', False, """Drive the frozen model from concurrent clients, see loadgen.py.""")
+    flags.DEFINE_string('loadgen_concurrency', '1,2,4,8,16', """Client threads of the closed-loop points.""")
+    flags.DEFINE_string('loadgen_qps', '', """Target QPS of the open-loop points, empty for fractions of the peak.""")
+    flags.DEFINE_integer('loadgen_clients', 16, """Client threads sending the open-loop arrivals.""")
+    flags.DEFINE_float('loadgen_duration', 10.0, """Measured seconds per load point.""")
+    flags.DEFINE_float('loadgen_warmup', 2.0, """Seconds of load before every measurement.""")
+    flags.DEFINE_integer('loadgen_max_batch_size', 1, """Batch up to this many requests, 1 disables batching.""")
+    flags.DEFINE_float('loadgen_max_delay_ms', 2.0, """Longest wait for a dynamic batch to fill.""")
+    flags.DEFINE_string('loadgen_report', '', """CSV file to write the latency-vs-throughput curve to.""")
+
+
+def allowed_batch_sizes(max_batch_size):
+    """1, the powers of two below max_batch_size and max_batch_size."""
+    batch_sizes = [1]
+    while batch_sizes[-1] * 2 < max_batch_size:
+        batch_sizes.append(batch_sizes[-1] * 2)
+    if max_batch_size > 1:
+        batch_sizes.append(max_batch_size)
+    return batch_sizes
+
+
+class Model(object):
+    """The frozen graphs of batch_sizes in one session, run() may be called from any thread."""
+
+    def __init__(self, build_fn, batch_sizes, device_str, config):
+        self.batch_sizes = sorted(batch_sizes)
+        self.example = None  # random inputs of one request
+        self._inputs = {}
+        self._outputs = {}
+        self.graph = tf.Graph()
+        with self.graph.as_default():
+            for batch_size in self.batch_sizes:
+                graph_def, feed_values, output_name = inference.freeze(build_fn, batch_size, device_str)
+                scope = 'batch_%d' % batch_size
+                tf.import_graph_def(graph_def, name=scope)
+                names = sorted(feed_values)
+                self._inputs[batch_size] = [self.graph.get_tensor_by_name('%s/%s' % (scope, n)) for n in names]
+                self._outputs[batch_size] = self.graph.get_tensor_by_name('%s/%s' % (scope, output_name))
+                if batch_size == 1:
+                    self.example = [feed_values[n] for n in names]
+        self.session = tf.Session(graph=self.graph, config=config)
+        # The first run of every graph pays for optimisation, autotuning and XLA compilation.
+        for batch_size in self.batch_sizes:
+            self.run([self.example] * batch_size)
+
+    def run(self, examples):
+        """
+        Run requests together in the smallest graph they fit, padded with copies of the last one.
+        :param examples: list of requests, each a list of input arrays with a leading batch dimension of 1
+        :return: list of the outputs of the requests
+        """
+        count = len(examples)
+        batch_size = [b for b in self.batch_sizes if b >= count][0]
+        padded = examples + [examples[-1]] * (batch_size - count)
+        feed_dict = dict((tensor, np.concatenate([e[i] for e in padded]))
+                         for i, tensor in enumerate(self._inputs[batch_size]))
+        output = self.session.run(self._outputs[batch_size], feed_dict=feed_dict)
+        # Batch-major outputs, e.g. [batch_size * num_steps, vocab_size] of the lstm.
+        return np.array_split(output, batch_size)[:count]
+
+    def close(self):
+        self.session.close()
+
+
+class Request(object):
+
+    def __init__(self, example, arrival_time):
+        self.example = example
+        self.arrival_time = arrival_time
+        self.finish_time = None
+        self.batch_size = None
+        self.done = threading.Event()
+
+    def finish(self, batch_size):
+        self.finish_time = time.time()
+        self.batch_size = batch_size
+        self.done.set()
+
+    def latency(self):
+        return self.finish_time - self.arrival_time
+
+
+class DirectExecutor(object):
+    """Runs every request alone in the thread that submits it."""
+
+    def __init__(self, model):
+        self.model = model
+
+    def submit(self, request):
+        self.model.run([request.example])
+        request.finish(1)
+
+    def stop(self):
+        pass
+
+
+class BatchingExecutor(object):
+    """Queues requests and runs up to max_batch_size of them at once, waiting at most max_delay seconds."""
+
+    def __init__(self, model, max_batch_size, max_delay):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self._queue = Queue.Queue()
+        self._thread = threading.Thread(target=self._loop, name='batcher')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def submit(self, request):
+        self._queue.put(request)
+
+    def stop(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _loop(self):
+        stopping = False
+        while not stopping:
+            request = self._queue.get()
+            if request is None:
+                return
+            batch = [request]
+            deadline = time.time() + self.max_delay
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - time.time()
+                if timeout <= 0:
+                    break
+                try:
+                    request = self._queue.get(timeout=timeout)
+                except Queue.Empty:
+                    break
+                if request is None:
+                    stopping = True
+                    break
+                batch.append(request)
+            self.model.run([r.example for r in batch])
+            for r in batch:
+                r.finish(len(batch))
+
+
+def summarize(loop, concurrency, target_qps, requests, elapsed):
+    """LoadPoint of the requests measured over elapsed seconds."""
+    if not requests:
+        return LoadPoint(loop, concurrency, target_qps, 0, 0.0, 0.0, *([float('nan')] * len(PERCENTILES)))
+    latencies = [r.latency() for r in requests]
+    percentiles = [np.percentile(latencies, p) * 1000.0 for p in PERCENTILES]
+    mean_batch_size = sum(r.batch_size for r in requests) / float(len(requests))
+    return LoadPoint(loop, concurrency, target_qps, len(requests), len(requests) / elapsed, mean_batch_size,
+                     *percentiles)
+
+
+def closed_loop(executor, example, concurrency, duration, warmup):
+    """concurrency clients sending back-to-back requests, measured for duration seconds after warmup seconds."""
+    measured = []
+    measure_start = time.time() + warmup
+    stop_time = measure_start + duration
+
+    def client():
+        while True:
+            now = time.time()
+            if now >= stop_time:
+                return
+            request = Request(example, now)
+            executor.submit(request)
+            request.done.wait()
+            if now >= measure_start:
+                measured.append(request)
+
+    threads = [threading.Thread(target=client, name='client-%d' % i) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return summarize(CLOSED, concurrency, '-', measured, duration)
+
+
+def open_loop(executor, example, target_qps, clients, duration, warmup, seed=None):
+    """
+    Poisson arrivals at target_qps sent by clients threads, measured for duration seconds after warmup seconds.
+    Arrivals stop at the end of the measurement, the throughput counts until the backlog is served.
+    """
+    pending = Queue.Queue()
+    generator = random.Random(seed)
+
+    def client():
+        while True:
+            request = pending.get()
+            if request is None:
+                return
+            executor.submit(request)
+            request.done.wait()
+
+    threads = [threading.Thread(target=client, name='client-%d' % i) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    measure_start = time.time() + warmup
+    stop_time = measure_start + duration
+    arrival_time = time.time()
+    measured = []
+    while True:
+        arrival_time += generator.expovariate(target_qps)
+        if arrival_time >= stop_time:
+            break
+        delay = arrival_time - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        request = Request(example, arrival_time)
+        if arrival_time >= measure_start:
+            measured.append(request)
+        pending.put(request)
+    for _ in threads:
+        pending.put(None)
+    for thread in threads:
+        thread.join()
+    elapsed = max([duration] + [r.finish_time - measure_start for r in measured])
+    return summarize(OPEN, clients, '%.1f' % target_qps, measured, elapsed)
+
+
+def print_point(point):
+    print(POINT_TEMPLATE % (point.loop, point.concurrency, point.target_qps, point.throughput, point.mean_batch_size,
+                            point.p50_ms, point.p90_ms, point.p99_ms, point.p999_ms))
+
+
+def sweep(model, concurrencies, qps_values=None, clients=16, duration=10.0, warmup=2.0, max_batch_size=1,
+          max_delay=0.002):
+    """
+    Closed-loop points at concurrencies, then open-loop points at qps_values.
+    :param qps_values: target QPS values, None for OPEN_LOOP_LOAD_FACTORS of the closed-loop peak throughput
+    :return: list of LoadPoint
+    """
+    if max_batch_size > 1:
+        executor = BatchingExecutor(model, max_batch_size, max_delay)
+    else:
+        executor = DirectExecutor(model)
+    points = []
+    try:
+        for concurrency in concurrencies:
+            points.append(closed_loop(executor, model.example, concurrency, duration, warmup))
+            print_point(points[-1])
+        if qps_values is None:
+            peak = max([p.throughput for p in points] + [0.0])
+            qps_values = [peak * factor for factor in OPEN_LOOP_LOAD_FACTORS if peak * factor > 0]
+        for qps in qps_values:
+            points.append(open_loop(executor, model.example, qps, clients, duration, warmup))
+            print_point(points[-1])
+    finally:
+        executor.stop()
+    return points
+
+
+def write_curve(points, curve_file):
+    with open(curve_file, 'wb') as f:
+        writer = csv.writer(f)
+        writer.writerow(LoadPoint._fields)
+        for point in points:
+            writer.writerow(['%.3f' % v if isinstance(v, float) else v for v in point])
+
+
+def run_from_flags(build_fn, device_str, config):
+    """Sweep the model built by build_fn (see inference.freeze) as configured by the --loadgen* flags."""
+    FLAGS = tf.app.flags.FLAGS
+    max_batch_size = max(1, FLAGS.loadgen_max_batch_size)
+    model = Model(build_fn, allowed_batch_sizes(max_batch_size), device_str, config)
+    try:
+        points = sweep(model,
+                       inference.parse_batch_sizes(FLAGS.loadgen_concurrency),
+                       qps_values=[float(q) for q in FLAGS.loadgen_qps.split(',') if q.strip()] or None,
+                       clients=FLAGS.loadgen_clients,
+                       duration=FLAGS.loadgen_duration,
+                       warmup=FLAGS.loadgen_warmup,
+                       max_batch_size=max_batch_size,
+                       max_delay=FLAGS.loadgen_max_delay_ms / 1000.0)
+    finally:
+        model.close()
+    if FLAGS.loadgen_report:
+        write_curve(points, FLAGS.loadgen_report)
+    return points
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+""" mixed_precision.py: fp16 compute with fp32 master weights and dynamic loss scaling.
+
+Models build their layers in compute_dtype(use_fp16) inside model_variable_scope(use_fp16). The custom getter
+of that scope stores every trainable variable in fp32 and hands the layers an fp16 cast of it, so gradients
+flow back into the fp32 copies. LossScaler multiplies the loss before differentiation, divides the gradients
+afterwards and skips the update (halving the scale) whenever a gradient overflowed.
+"""
+
+import tensorflow as tf
+
+PRECISION_TEMPLATE = 'precision: %s'
+
+
+def precision_name(use_fp16):
+    return 'fp16' if use_fp16 else 'fp32'
+
+
+def compute_dtype(use_fp16):
+    return tf.float16 if use_fp16 else tf.float32
+
+
+def float32_variable_storage_getter(getter, name, shape=None, dtype=None, initializer=None, regularizer=None,
+                                    trainable=True, *args, **kwargs):
+    """Custom getter creating trainable variables in fp32 and returning them cast to the requested dtype."""
+    storage_dtype = tf.float32 if trainable else dtype
+    variable = getter(name, shape, dtype=storage_dtype, initializer=initializer, regularizer=regularizer,
+                      trainable=trainable, *args, **kwargs)
+    if trainable and dtype != tf.float32:
+        variable = tf.cast(variable, dtype)
+    return variable
+
+
+def model_variable_scope(use_fp16, reuse=None):
+    """Re-enter the current variable scope with fp32 variable storage when use_fp16 is set."""
+    custom_getter = float32_variable_storage_getter if use_fp16 else None
+    return tf.variable_scope(tf.get_variable_scope(), reuse=reuse, custom_getter=custom_getter)
+
+
+def print_precision(use_fp16):
+    print(PRECISION_TEMPLATE % precision_name(use_fp16))
+
+
+def _scale_gradient(grad, factor):
+    if grad is None:
+        return None
+    if isinstance(grad, tf.IndexedSlices):
+        return tf.IndexedSlices(grad.values * factor, grad.indices, grad.dense_shape)
+    return grad * factor
+
+
+def _gradient_values(grad):
+    return grad.values if isinstance(grad, tf.IndexedSlices) else grad
+
+
+class LossScaler(object):
+    """
+    Dynamic loss scaling. Disabled instances pass everything through unchanged, so the fp32 path builds the
+    same graph as before.
+    :param enabled: usually the use_fp16 flag
+    :param initial_scale: starting loss scale
+    :param increment_period: number of consecutive finite steps after which the scale grows
+    :param multiplier: factor applied when the scale grows or shrinks
+    """
+
+    def __init__(self, enabled, initial_scale=2.0 ** 15, increment_period=2000, multiplier=2.0):
+        self.enabled = enabled
+        self._increment_period = increment_period
+        self._multiplier = multiplier
+        self.loss_scale = None
+        if enabled:
+            self.loss_scale = tf.Variable(initial_scale, dtype=tf.float32, trainable=False, name='loss_scale')
+            self._good_steps = tf.Variable(0, dtype=tf.int32, trainable=False, name='loss_scale_good_steps')
+
+    def scale_loss(self, loss):
+        if not self.enabled:
+            return loss
+        return tf.cast(loss, tf.float32) * self.loss_scale
+
+    def gradients(self, loss, var_list):
+        """tf.gradients of loss with respect to var_list, computed on the scaled loss and unscaled again."""
+        grads = tf.gradients(self.scale_loss(loss), var_list)
+        if not self.enabled:
+            return grads
+        return [_scale_gradient(g, 1.0 / self.loss_scale) for g in grads]
+
+    def compute_gradients(self, optimizer, loss, var_list=None):
+        """optimizer.compute_gradients on the scaled loss, returning unscaled (gradient, variable) pairs."""
+        grads_and_vars = optimizer.compute_gradients(self.scale_loss(loss), var_list=var_list)
+        if not self.enabled:
+            return grads_and_vars
+        return [(_scale_gradient(g, 1.0 / self.loss_scale), v) for g, v in grads_and_vars]
+
+    def apply_gradients(self, optimizer, grads_and_vars, global_step=None):
+        """Apply the gradients only if all of them are finite, then adjust the loss scale."""
+        grads_and_vars = list(grads_and_vars)
+        if not self.enabled:
+            return optimizer.apply_gradients(grads_and_vars, global_step=global_step)
+        finite = tf.reduce_all([tf.reduce_all(tf.is_finite(_gradient_values(g)))
+                                for g, _ in grads_and_vars if g is not None])
+        apply_op = tf.cond(finite,
+                           lambda: tf.group(optimizer.apply_gradients(grads_and_vars, global_step=global_step)),
+                           tf.no_op)
+        return tf.group(apply_op, self._update_scale(finite))
+
+    def minimize(self, optimizer, loss, global_step=None, var_list=None):
+        return self.apply_gradients(optimizer, self.compute_gradients(optimizer, loss, var_list=var_list),
+                                    global_step=global_step)
+
+    def _update_scale(self, finite):
+        def _grow():
+            good_steps = self._good_steps + 1
+            return tf.cond(good_steps >= self._increment_period,
+                           lambda: tf.group(self.loss_scale.assign(self.loss_scale * self._multiplier),
+                                            self._good_steps.assign(0)),
+                           lambda: tf.group(self._good_steps.assign(good_steps)))
+
+        def _shrink():
+            return tf.group(self.loss_scale.assign(tf.maximum(self.loss_scale / self._multiplier, 1.0)),
+                            self._good_steps.assign(0))
+
+        return tf.cond(finite, _grow, _shrink)
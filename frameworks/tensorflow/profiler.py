@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+""" profiler.py: Per-op timeline of a few steady-state training steps.
+
+StepProfiler traces num_steps consecutive steps from start_step on with FULL_TRACE run options. The RunMetadata of
+every traced step is written as a Chrome trace (load timeline-step-<N>.json in chrome://tracing) and the node stats
+of all traced steps are aggregated per op type and device into op-profile.csv: count, total and mean time, share of
+the device's traced time and the bytes of the op outputs.
+
+Tracing slows a step down, so the scripts keep traced steps out of their step timing:
+
+    run_kwargs = profiler.run_kwargs()
+    sess.run(train_op, **run_kwargs)
+    if not profiler.end_step():
+        step_timer.add(duration)
+"""
+
+import os
+import csv
+
+import tensorflow as tf
+from tensorflow.python.client import timeline
+
+DEFAULT_START_STEP = 20
+TIMELINE_FILE_TEMPLATE = 'timeline-step-%d.json'
+OP_PROFILE_FILE = 'op-profile.csv'
+OP_PROFILE_FIELDS = ['op_type', 'device', 'count', 'total_ms', 'mean_us', 'percent', 'output_bytes']
+TOP_OPS = 10
+
+
+def define_flags(num_steps=0, output_dir='.'):
+    """Define the --profile* flags of a benchmark script."""
+    tf.app.flags.DEFINE_integer('profile_steps', num_steps, """Steady-state steps to trace, 0 for none.""")
+    tf.app.flags.DEFINE_integer('profile_start_step', DEFAULT_START_STEP, """First traced step.""")
+    tf.app.flags.DEFINE_string('profile_dir', output_dir, """Directory for the traces and the op table.""")
+
+
+def _op_type(node_stats, graph=None):
+    name = node_stats.node_name
+    if ':' in name:  # GPU stream entries are named <op name>:<op type>
+        return name.split(':')[-1]
+    if graph is not None:
+        try:
+            return graph.get_operation_by_name(name).type
+        except (KeyError, ValueError):
+            pass
+    label = node_stats.timeline_label  # <op name> = <op type>(<inputs>)
+    if ' = ' in label:
+        return label.split(' = ', 1)[1].split('(', 1)[0]
+    return name
+
+
+def _output_bytes(node_stats):
+    return sum(output.tensor_description.allocation_description.requested_bytes for output in node_stats.output)
+
+
+class StepProfiler(object):
+    """Traces num_steps steps from start_step on, counting the steps itself (see end_step)."""
+
+    def __init__(self, num_steps=0, start_step=DEFAULT_START_STEP, output_dir='.'):
+        self.num_steps = num_steps
+        self.start_step = start_step
+        self.output_dir = output_dir
+        self._step = 0
+        self._run_metadata = None
+        self._traced = []  # (step, RunMetadata)
+
+    @classmethod
+    def from_flags(cls):
+        FLAGS = tf.app.flags.FLAGS
+        return cls(FLAGS.profile_steps, FLAGS.profile_start_step, FLAGS.profile_dir)
+
+    def tracing(self):
+        """Whether the next step is traced."""
+        return self.start_step <= self._step < self.start_step + self.num_steps
+
+    def run_kwargs(self):
+        """Keyword arguments of session.run for the next step, empty if it is not traced."""
+        if not self.tracing():
+            return {}
+        self._run_metadata = tf.RunMetadata()
+        return {'options': tf.RunOptions(trace_level=tf.RunOptions.FULL_TRACE), 'run_metadata': self._run_metadata}
+
+    def end_step(self):
+        """Count the step. :return: True if it was traced and must be kept out of the timing"""
+        traced = self._run_metadata is not None
+        if traced:
+            self._traced.append((self._step, self._run_metadata))
+            self._run_metadata = None
+        self._step += 1
+        return traced
+
+    def op_table(self, graph=None):
+        """Rows of OP_PROFILE_FIELDS over all traced steps, the most expensive first."""
+        totals = {}
+        device_micros = {}
+        for _, run_metadata in self._traced:
+            for dev_stats in run_metadata.step_stats.dev_stats:
+                for node_stats in dev_stats.node_stats:
+                    entry = totals.setdefault((_op_type(node_stats, graph), dev_stats.device), [0, 0, 0])
+                    entry[0] += 1
+                    entry[1] += node_stats.all_end_rel_micros
+                    entry[2] += _output_bytes(node_stats)
+                    device_micros[dev_stats.device] = device_micros.get(dev_stats.device, 0) + \
+                        node_stats.all_end_rel_micros
+        rows = []
+        for (op_type, device), (count, micros, output_bytes) in sorted(totals.items(), key=lambda t: -t[1][1]):
+            rows.append({
+                'op_type': op_type,
+                'device': device,
+                'count': count,
+                'total_ms': '%.3f' % (micros / 1000.0),
+                'mean_us': '%.1f' % (micros / float(count)),
+                'percent': '%.1f' % (100.0 * micros / (device_micros[device] or 1)),
+                'output_bytes': output_bytes,
+            })
+        return rows
+
+    def save(self, graph=None):
+        """Write the Chrome traces and the op table to output_dir and print the top ops."""
+        if not self.num_steps:
+            return
+        if not self._traced:
+            print('profile: nothing traced, the run ended before step %d' % self.start_step)
+            return
+        if not os.path.isdir(self.output_dir):
+            os.makedirs(self.output_dir)
+        for step, run_metadata in self._traced:
+            trace = timeline.Timeline(run_metadata.step_stats, graph=graph)
+            with open(os.path.join(self.output_dir, TIMELINE_FILE_TEMPLATE % step), 'w') as f:
+                f.write(trace.generate_chrome_trace_format(show_memory=True))
+        rows = self.op_table(graph)
+        with open(os.path.join(self.output_dir, OP_PROFILE_FILE), 'wb') as f:
+            writer = csv.DictWriter(f, OP_PROFILE_FIELDS)
+            writer.writeheader()
+            writer.writerows(rows)
+        print('profile: traced steps %s, excluded from the step time, written to %s'
+              % (','.join(str(step) for step, _ in self._traced), self.output_dir))
+        for row in rows[:TOP_OPS]:
+            print('profile: %(op_type)s on %(device)s: %(count)d runs, %(total_ms)s ms (%(percent)s%%)' % row)
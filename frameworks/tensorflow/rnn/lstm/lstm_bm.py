@@ -63,6 +63,8 @@ import numpy as np
 import tensorflow as tf
 
 import reader
+import lstm_layers
+from frameworks.tensorflow import mixed_precision, xla, inference, loadgen, profiler, flops
 
 flags = tf.flags
 logging = tf.logging
@@ -79,6 +81,16 @@ flags.DEFINE_integer("seqlen", 32, "len of sample")
 flags.DEFINE_string("device", '0', "select device id")
 flags.DEFINE_integer("iters", 1000, "iterations for profiling")
 flags.DEFINE_integer("max_max_epoch", 20, "max epochs for training")
+flags.DEFINE_boolean("use_fp16", False, "fp16 compute with fp32 master weights and dynamic loss scaling")
+flags.DEFINE_string("xla", xla.OFF, "XLA JIT mode: off, global or scoped")
+flags.DEFINE_string("lstm_impl", lstm_layers.UNROLLED,
+                    "LSTM implementation: unrolled, dynamic, block or cudnn (block on CPU)")
+flags.DEFINE_boolean("inference", False, "time forward-only inference of a frozen graph instead of training")
+flags.DEFINE_string("inference_batch_sizes", inference.LATENCY_BATCH_SIZES,
+                    "batch sizes of the inference latency percentiles")
+flags.DEFINE_integer("inference_steps", inference.DEFAULT_STEPS, "timed runs per inference batch size")
+loadgen.define_flags()
+profiler.define_flags()
 
 FLAGS = flags.FLAGS
 
@@ -91,62 +103,39 @@ class PTBModel(object):
     self.num_steps = num_steps = config.num_steps
     size = config.hidden_size
     vocab_size = config.vocab_size
+    dtype = mixed_precision.compute_dtype(config.use_fp16)
 
     self._input_data = tf.placeholder(tf.int32, [batch_size, num_steps])
     self._targets = tf.placeholder(tf.int32, [batch_size, num_steps])
 
     # Slightly better results can be obtained with forget gate biases
     # initialized to 1 but the hyperparameters of the model would need to be
-    # different than reported in the paper.
-    #lstm_cell = tf.nn.rnn_cell.BasicLSTMCell(size, forget_bias=0.0)
-    lstm_cell = tf.contrib.rnn.BasicLSTMCell(size, forget_bias=0.0)
-    if is_training and config.keep_prob < 1:
-      lstm_cell = tf.nn.rnn_cell.DropoutWrapper(
-          lstm_cell, output_keep_prob=config.keep_prob)
-    cell = tf.contrib.rnn.MultiRNNCell([lstm_cell] * config.num_layers)
-    
+    # different than reported in the paper. All implementations use forget_bias=0.0.
+
     # print config
     print("batch_size: ", config.batch_size)
     print("num_steps: ", config.num_steps)
     print("hidden_size: ", config.hidden_size)
     print("num_layers: ", config.num_layers)
 
-    self._initial_state = cell.zero_state(batch_size, tf.float32)
-
-    with tf.device("/cpu:0"):
-      embedding = tf.get_variable("embedding", [vocab_size, size])
-      inputs = tf.nn.embedding_lookup(embedding, self._input_data)
+    inputs = lstm_layers.embedding_lookup(config.lstm_impl, self._input_data, vocab_size, size, dtype)
 
     if is_training and config.keep_prob < 1:
       inputs = tf.nn.dropout(inputs, config.keep_prob)
 
-    # Simplified version of tensorflow.models.rnn.rnn.py's rnn().
-    # This builds an unrolled LSTM for tutorial purposes only.
-    # In general, use the rnn() or state_saving_rnn() from rnn.py.
-    #
-    # The alternative version of the code below is:
-    #
-    # from tensorflow.models.rnn import rnn
-    # inputs = [tf.squeeze(input_, [1])
-    #           for input_ in tf.split(1, num_steps, inputs)]
-    # outputs, state = rnn.rnn(cell, inputs, initial_state=self._initial_state)
-    outputs = []
-    state = self._initial_state
-    with tf.variable_scope("RNN"):
-      for time_step in range(num_steps):
-        if time_step > 0: tf.get_variable_scope().reuse_variables()
-        (cell_output, state) = cell(inputs[:, time_step, :], state)
-        outputs.append(cell_output)
-
-    output = tf.reshape(tf.concat(axis=1, values=outputs), [-1, size])
-    softmax_w = tf.get_variable("softmax_w", [size, vocab_size])
-    softmax_b = tf.get_variable("softmax_b", [vocab_size])
-    logits = tf.matmul(output, softmax_w) + softmax_b
-    #loss = tf.nn.seq2seq.sequence_loss_by_example(
-    loss = tf.contrib.legacy_seq2seq.sequence_loss_by_example(
-        [logits],
-        [tf.reshape(self._targets, [-1])],
-        [tf.ones([batch_size * num_steps])])
+    # See lstm_layers.py for the unrolled, dynamic_rnn and fused implementations.
+    with xla.jit_scope(config.xla):
+      output, self._initial_state, state = lstm_layers.build(
+          config.lstm_impl, inputs, batch_size, config.num_layers, size, config.keep_prob, is_training, dtype)
+
+      softmax_w = tf.get_variable("softmax_w", [size, vocab_size], dtype=dtype)
+      softmax_b = tf.get_variable("softmax_b", [vocab_size], dtype=dtype)
+      self._logits = logits = tf.cast(tf.matmul(output, softmax_w) + softmax_b, tf.float32)
+      #loss = tf.nn.seq2seq.sequence_loss_by_example(
+      loss = tf.contrib.legacy_seq2seq.sequence_loss_by_example(
+          [logits],
+          [tf.reshape(self._targets, [-1])],
+          [tf.ones([batch_size * num_steps])])
     self._cost = cost = tf.reduce_sum(loss) / batch_size
     self._final_state = state
 
@@ -155,10 +144,11 @@ class PTBModel(object):
 
     self._lr = tf.Variable(0.0, trainable=False)
     tvars = tf.trainable_variables()
-    grads, _ = tf.clip_by_global_norm(tf.gradients(cost, tvars),
+    loss_scaler = mixed_precision.LossScaler(config.use_fp16)
+    grads, _ = tf.clip_by_global_norm(loss_scaler.gradients(cost, tvars),
                                       config.max_grad_norm)
     optimizer = tf.train.GradientDescentOptimizer(self.lr)
-    self._train_op = optimizer.apply_gradients(zip(grads, tvars))
+    self._train_op = loss_scaler.apply_gradients(optimizer, zip(grads, tvars))
 
 
   def assign_lr(self, session, lr_value):
@@ -176,6 +166,10 @@ class PTBModel(object):
   def initial_state(self):
     return self._initial_state
 
+  @property
+  def logits(self):
+    return self._logits
+
   @property
   def cost(self):
     return self._cost
@@ -265,8 +259,11 @@ class TestConfig(object):
   iters = 1000
 
 
-def run_epoch(session, m, data, eval_op, verbose=False):
-  """Runs the model on the given data."""
+def run_epoch(session, m, data, eval_op, verbose=False, step_timer=None, step_profiler=None):
+  """Runs the model on the given data, adding every step duration to step_timer if given.
+
+  Steps traced by step_profiler are left out of step_timer.
+  """
   epoch_size = ((len(data) // m.batch_size) - 1) // m.num_steps
   start_time = time.time()
   costs = 0.0
@@ -276,10 +273,16 @@ def run_epoch(session, m, data, eval_op, verbose=False):
   step = 0
   for step, (x, y) in enumerate(reader.ptb_iterator(data, m.batch_size,
                                                     m.num_steps)):
+    step_start_time = time.time()
+    run_kwargs = step_profiler.run_kwargs() if step_profiler is not None else {}
     cost, state, _ = session.run([m.cost, m.final_state, eval_op],
                                  {m.input_data: x,
                                   m.targets: y,
-                                  m.initial_state: state})
+                                  m.initial_state: state},
+                                 **run_kwargs)
+    traced = step_profiler is not None and step_profiler.end_step()
+    if step_timer is not None and not traced:
+      step_timer.add(time.time() - step_start_time)
     costs += cost
     iters += m.num_steps
 
@@ -316,10 +319,57 @@ def get_config():
   config.device = FLAGS.device
   config.iters = FLAGS.iters
   config.max_max_epoch = FLAGS.max_max_epoch
+  config.use_fp16 = FLAGS.use_fp16
+  config.xla = FLAGS.xla
+  config.lstm_impl = lstm_layers.resolve_impl(FLAGS.lstm_impl, FLAGS.device == '-1')
   return config
 
 
+def get_session_config(config):
+  """Returns (device string, tf.ConfigProto) of the session."""
+  if config.device == '-1':
+    tf_dev = '/cpu:0'
+  else:
+    tf_dev = '/gpu:' + config.device
+
+  print(tf_dev)
+  mixed_precision.print_precision(FLAGS.use_fp16)
+  tconfig = tf.ConfigProto(allow_soft_placement=True)
+  if tf_dev.find('cpu') >= 0: # cpu version
+    num_threads = os.getenv('OMP_NUM_THREADS', 1)
+    tconfig = tf.ConfigProto(allow_soft_placement=True, intra_op_parallelism_threads=int(num_threads))
+  xla.configure_session(tconfig, FLAGS.xla)
+  xla.print_mode(FLAGS.xla)
+  lstm_layers.print_impl(config.lstm_impl)
+  return tf_dev, tconfig
+
+
+def run_inference():
+  """Next-word distributions of random num_steps long sequences, see inference.py."""
+  config = get_config()
+  tf_dev, tconfig = get_session_config(config)
+
+  def build(batch_size):
+    model_config = get_config()
+    model_config.batch_size = batch_size
+    initializer = tf.random_uniform_initializer(-model_config.init_scale, model_config.init_scale)
+    with tf.variable_scope("model", initializer=initializer), \
+        mixed_precision.model_variable_scope(FLAGS.use_fp16):
+      m = PTBModel(is_training=False, config=model_config)
+    words = np.random.randint(0, model_config.vocab_size, size=[batch_size, model_config.num_steps])
+    return {m.input_data: words.astype(np.int32)}, tf.nn.softmax(m.logits)
+
+  if FLAGS.loadgen:
+    loadgen.run_from_flags(build, tf_dev, tconfig)
+  else:
+    inference.run(build, config.batch_size, tf_dev, tconfig,
+                  batch_sizes=FLAGS.inference_batch_sizes, steps=FLAGS.inference_steps)
+
+
 def main(_):
+  if FLAGS.inference or FLAGS.loadgen:
+    run_inference()
+    return
   if not FLAGS.data_path:
     raise ValueError("Must set --data_path to PTB data directory")
 
@@ -331,28 +381,25 @@ def main(_):
   eval_config.batch_size = 1
   eval_config.num_steps = 1
 
-  if config.device == '-1':
-    tf_dev = '/cpu:0'
-  else:
-    tf_dev = '/gpu:' + config.device
-
-  print(tf_dev)
-  tconfig = tf.ConfigProto(allow_soft_placement=True)
-  if tf_dev.find('cpu') >= 0: # cpu version
-    num_threads = os.getenv('OMP_NUM_THREADS', 1)
-    tconfig = tf.ConfigProto(allow_soft_placement=True, intra_op_parallelism_threads=int(num_threads))
+  tf_dev, tconfig = get_session_config(config)
   with tf.Graph().as_default(), tf.device(tf_dev), tf.Session(config=tconfig) as session:
     initializer = tf.random_uniform_initializer(-config.init_scale,
                                                 config.init_scale)
-    with tf.variable_scope("model", reuse=None, initializer=initializer):
+    with tf.variable_scope("model", reuse=None, initializer=initializer), \
+        mixed_precision.model_variable_scope(FLAGS.use_fp16):
       m = PTBModel(is_training=True, config=config)
-    with tf.variable_scope("model", reuse=True, initializer=initializer):
+    # Before mtest joins the graph, the while loop of the dynamic impl runs num_steps times.
+    flops.print_cost(tf.get_default_graph(), config.batch_size, loop_iterations=config.num_steps)
+    with tf.variable_scope("model", reuse=True, initializer=initializer), \
+        mixed_precision.model_variable_scope(FLAGS.use_fp16):
        #mvalid = PTBModel(is_training=False, config=config)
        mtest = PTBModel(is_training=False, config=eval_config)
 
     tf.global_variables_initializer().run()
 
-    total_average_batch_time = 0.0
+    # Steady-state step time of all training epochs, the first step is reported as compile time.
+    step_timer = xla.StepTimer()
+    step_profiler = profiler.StepProfiler.from_flags()
 
     epochs_info = []
     for i in range(config.max_max_epoch):
@@ -361,15 +408,18 @@ def main(_):
       m.assign_lr(session, config.learning_rate)
 
       print("Epoch: %d Learning rate: %.3f" % (i + 1, session.run(m.lr)))
-      train_perplexity, average_batch_time = run_epoch(session, m, train_data, m.train_op, verbose=True)
-      total_average_batch_time += average_batch_time
+      train_perplexity, average_batch_time = run_epoch(session, m, train_data, m.train_op, verbose=True,
+                                                       step_timer=step_timer, step_profiler=step_profiler)
       print("Epoch: %d Train Perplexity: %.3f" % (i + 1, train_perplexity))
       if i % 2 == 0:
          epochs_info.append('%d:_:%.3f'%(i, train_perplexity)) 
 #      valid_perplexity = run_epoch(session, mvalid, valid_data, tf.no_op())
 #      print("Epoch: %d Valid Perplexity: %.3f" % (i + 1, valid_perplexity))
 
-    print("average_batch_time: %.6f" % (total_average_batch_time/int(config.max_max_epoch)))
+    step_profiler.save(session.graph)
+    print("average_batch_time: %.6f" % step_timer.average_step_time())
+    step_timer.print_compile_time()
+    step_timer.print_step_times()
     print('epoch_info:'+','.join(epochs_info))
 
     test_perplexity, test_average_batch_time = run_epoch(session, mtest, test_data, tf.no_op())
@@ -0,0 +1,130 @@
+"""LSTM implementations of the PTB benchmark.
+
+  * unrolled  num_steps calls of a MultiRNNCell of BasicLSTMCells in a Python loop (the original benchmark).
+  * dynamic   the same cells driven by tf.nn.dynamic_rnn, one while loop instead of num_steps copies.
+  * block     one LSTMBlockFusedCell per layer, the whole sequence in a single kernel.
+  * cudnn     all layers in one CudnnLSTM kernel. It has no CPU kernel, so CPU runs fall back to block.
+
+The unrolled baseline keeps the embedding on the host like it always did, the other implementations place it
+next to the recurrent kernels.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import tensorflow as tf
+
+UNROLLED = 'unrolled'
+DYNAMIC = 'dynamic'
+BLOCK = 'block'
+CUDNN = 'cudnn'
+IMPLS = (UNROLLED, DYNAMIC, BLOCK, CUDNN)
+IMPL_TEMPLATE = 'lstm_impl: %s'
+
+
+def resolve_impl(impl, on_cpu):
+  """The implementation that will actually run, cudnn falls back to block on CPU."""
+  if impl not in IMPLS:
+    raise ValueError('Unknown LSTM implementation: %s (expected one of %s)' % (impl, ', '.join(IMPLS)))
+  if impl == CUDNN and on_cpu:
+    print('cudnn LSTM has no CPU kernel, falling back to %s' % BLOCK)
+    return BLOCK
+  return impl
+
+
+def print_impl(impl):
+  print(IMPL_TEMPLATE % impl)
+
+
+def embedding_lookup(impl, ids, vocab_size, size, dtype):
+  def _lookup():
+    embedding = tf.get_variable("embedding", [vocab_size, size], dtype=dtype)
+    return tf.nn.embedding_lookup(embedding, ids)
+
+  if impl == UNROLLED:
+    with tf.device("/cpu:0"):
+      return _lookup()
+  return _lookup()
+
+
+def _multi_cell(num_layers, size, keep_prob, is_training):
+  # One cell object per layer, [cell] * num_layers would make the layers share their weights.
+  cells = []
+  for _ in range(num_layers):
+    cell = tf.contrib.rnn.BasicLSTMCell(size, forget_bias=0.0)
+    if is_training and keep_prob < 1:
+      cell = tf.contrib.rnn.DropoutWrapper(cell, output_keep_prob=keep_prob)
+    cells.append(cell)
+  return tf.contrib.rnn.MultiRNNCell(cells)
+
+
+def _unrolled(inputs, batch_size, num_layers, size, keep_prob, is_training, dtype):
+  cell = _multi_cell(num_layers, size, keep_prob, is_training)
+  initial_state = cell.zero_state(batch_size, dtype)
+  outputs = []
+  state = initial_state
+  with tf.variable_scope("RNN"):
+    for time_step in range(inputs.get_shape()[1].value):
+      if time_step > 0: tf.get_variable_scope().reuse_variables()
+      (cell_output, state) = cell(inputs[:, time_step, :], state)
+      outputs.append(cell_output)
+  return tf.reshape(tf.concat(axis=1, values=outputs), [-1, size]), initial_state, state
+
+
+def _dynamic(inputs, batch_size, num_layers, size, keep_prob, is_training, dtype):
+  cell = _multi_cell(num_layers, size, keep_prob, is_training)
+  initial_state = cell.zero_state(batch_size, dtype)
+  outputs, state = tf.nn.dynamic_rnn(cell, inputs, initial_state=initial_state, scope="RNN")
+  return tf.reshape(outputs, [-1, size]), initial_state, state
+
+
+def _block(inputs, batch_size, num_layers, size, keep_prob, is_training, dtype):
+  # Time-major [num_steps, batch_size, size] in and out of the fused kernels.
+  outputs = tf.transpose(inputs, [1, 0, 2])
+  initial_state = []
+  final_state = []
+  for layer in range(num_layers):
+    c = tf.zeros([batch_size, size], dtype=dtype)
+    h = tf.zeros([batch_size, size], dtype=dtype)
+    initial_state.append(tf.contrib.rnn.LSTMStateTuple(c, h))
+    cell = tf.contrib.rnn.LSTMBlockFusedCell(size, forget_bias=0.0)
+    outputs, (c, h) = cell(outputs, initial_state=(c, h), dtype=dtype, scope="RNN/layer_%d" % layer)
+    final_state.append(tf.contrib.rnn.LSTMStateTuple(c, h))
+    if is_training and keep_prob < 1:
+      outputs = tf.nn.dropout(outputs, keep_prob)
+  outputs = tf.transpose(outputs, [1, 0, 2])
+  return tf.reshape(outputs, [-1, size]), tuple(initial_state), tuple(final_state)
+
+
+def _cudnn(inputs, batch_size, num_layers, size, keep_prob, is_training, dtype):
+  h = tf.zeros([num_layers, batch_size, size], dtype=dtype)
+  c = tf.zeros([num_layers, batch_size, size], dtype=dtype)
+  # CudnnLSTM drops out between layers only, the last layer's output is dropped out below like the cells do.
+  dropout = 1.0 - keep_prob if is_training else 0.0
+  lstm = tf.contrib.cudnn_rnn.CudnnLSTM(num_layers, size, dropout=dropout, dtype=dtype)
+  outputs, (final_h, final_c) = lstm(tf.transpose(inputs, [1, 0, 2]), initial_state=(h, c),
+                                     training=is_training, scope="RNN")
+  if is_training and keep_prob < 1:
+    outputs = tf.nn.dropout(outputs, keep_prob)
+  outputs = tf.transpose(outputs, [1, 0, 2])
+  return tf.reshape(outputs, [-1, size]), (h, c), (final_h, final_c)
+
+
+_BUILDERS = {
+    UNROLLED: _unrolled,
+    DYNAMIC: _dynamic,
+    BLOCK: _block,
+    CUDNN: _cudnn,
+}
+
+
+def build(impl, inputs, batch_size, num_layers, size, keep_prob, is_training, dtype):
+  """Run a num_layers LSTM of size units over inputs.
+
+  Args:
+    inputs: [batch_size, num_steps, size] embedded words.
+  Returns:
+    (output, initial_state, final_state), output being [batch_size * num_steps, size] in batch-major order.
+    The states are nested tuples of tensors whose structure depends on impl, initial_state can be fed.
+  """
+  return _BUILDERS[impl](inputs, batch_size, num_layers, size, keep_prob, is_training, dtype)
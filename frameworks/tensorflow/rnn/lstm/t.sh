@@ -1,7 +1,7 @@
 #!/usr/bin/env bash
 
 start=`date +%s.%N`
-CUDA_VISIBLE_DEVICES=$deviceId python ${script_path} --batchsize=$batch_size --max_max_epoch=$epochs --device=$deviceId &> $logFile
+CUDA_VISIBLE_DEVICES=$deviceId python ${script_path} --batchsize=$batch_size --max_max_epoch=$epochs --device=$deviceId --use_fp16=${use_fp16:-False} --xla=${xla:-off} --lstm_impl=${lstm_impl:-unrolled} --profile_steps=${profile_steps:-0} ${profile_dir:+--profile_dir=$profile_dir} --inference=${inference:-False} --loadgen=${loadgen:-False} ${loadgen_report:+--loadgen_report=$loadgen_report} &> $logFile
 end=`date +%s.%N`
 runtime=$( echo "$end - $start" | bc -l )
 echo "finished with execute time: ${runtime}"
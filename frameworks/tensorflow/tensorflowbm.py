@@ -7,17 +7,27 @@ Created by gogleyin on 3/22/18.
 """
 
 import argparse
-import re
 import os
 import time
 import shutil
 import csv
 import subprocess
-from globalconfig import FCN, CNN, RNN, RESNET_EPOCH_SIZE, ALEXNET_EPOCH_SIZE, FCN_EPOCH_SIZE
-from nvidiasmi import GPUAccounting, GPUAccountingEntry
+from globalconfig import FCN, CNN, RNN, RESNET_EPOCH_SIZE, ALEXNET_EPOCH_SIZE, FCN_EPOCH_SIZE, Precision, \
+    GradientAggregation, DataFormat, Xla, LstmImpl, Mode
+from nvidiasmi import GPUAccounting, GPUAccountingEntry, GPUSampler
 from cpu import CpuLimiter, ALL_CPU_COUNT
 from benchmark import TestConfigEntry, Framework, NetworkType, Status, Synthetic, TestResultEntry
-from extract_info import extract_info_tensorflow, extract_info_tensorflow_synthetic
+from extract_info import extract_info_tensorflow, extract_info_tensorflow_synthetic, \
+    extract_info_tensorflow_input_memory, extract_info_tensorflow_precision, extract_info_tensorflow_data_format, \
+    extract_info_tensorflow_xla, extract_info_tensorflow_compile_time, extract_info_tensorflow_lstm_impl, \
+    extract_info_tensorflow_inference, extract_info_tensorflow_loadgen, extract_info_tensorflow_profiled_steps, \
+    extract_info_tensorflow_flops, extract_info_tensorflow_step_times, extract_info_tensorflow_accuracy, \
+    extract_info_tensorflow_memory_bytes, TensorflowLogParser
+from resultprocess.scaling import efficiency_of_new_row
+from resultprocess.resultstore import ResultStore, store_path_of
+import layout_probe
+import device_specs
+import fingerprint
 import logging
 logger = logging.getLogger(__name__ if __name__ != '__main__' else os.path.splitext(os.path.basename(__file__))[0])
 logger.setLevel(logging.DEBUG)
@@ -155,45 +165,39 @@ def evaluation_cnn(batch_size, network_name, tool_path, log_dir, train_dir, trai
     if eval_dir and os.path.isdir(eval_dir):
         shutil.rmtree(eval_dir)
 
-    with open(eval_log_path, 'r') as f:
-        content = f.read()
-        pattern = 'precision @ 1 = (\d+\.\d+)'
-        result = re.search(pattern, content)
-        if not result:
-            logger.error('Could not find accuracy info in cnn evaluation log: %s' % eval_log_path)
-            return 'err'
-        return result.group(1)
-
-
-def evaluation_fcn5(train_log_path):
-    with open(train_log_path, 'r') as f:
-        content = f.read()
-        pattern = 'Final test accuracy (\d+\.\d+)'
-        result = re.search(pattern, content)
-        if not result:
-            logger.error('Could not find accuracy info in fc5 train log: %s' % train_log_path)
-            return 'err'
-        return result.group(1)
-
-
-def evaluation_rnn(train_log_path):
-    with open(train_log_path, 'r') as f:
-        content = f.read()
-        pattern = 'Test Perplexity: (\d+\.\d+)'
-        result = re.search(pattern, content)
-        if not result:
-            logger.error('Could not find accuracy info in rnn train log: %s' % train_log_path)
-            return 'err'
-        return result.group(1)
-
-
-def evaluation(batch_size, network_name, tool_path, log_dir, train_dir, train_log_path):
+    accuracy = extract_info_tensorflow_accuracy(eval_log_path, 'eval_precision')
+    if accuracy is None:
+        logger.error('Could not find accuracy info in cnn evaluation log: %s' % eval_log_path)
+        return 'err'
+    return accuracy
+
+
+def evaluation_fcn5(train_log):
+    """:param train_log: path or TensorflowLogParser of the training log"""
+    accuracy = extract_info_tensorflow_accuracy(train_log, 'test_accuracy')
+    if accuracy is None:
+        logger.error('Could not find accuracy info in fc5 train log: %s' % getattr(train_log, 'filepath', train_log))
+        return 'err'
+    return accuracy
+
+
+def evaluation_rnn(train_log):
+    """:param train_log: path or TensorflowLogParser of the training log"""
+    perplexity = extract_info_tensorflow_accuracy(train_log, 'test_perplexity')
+    if perplexity is None:
+        logger.error('Could not find accuracy info in rnn train log: %s' % getattr(train_log, 'filepath', train_log))
+        return 'err'
+    return perplexity
+
+
+def evaluation(batch_size, network_name, tool_path, log_dir, train_dir, train_log_path, log_parser=None):
+    """:param log_parser: parsed TensorflowLogParser of train_log_path, to not read the log again"""
     if network_name == CNN.resnet or network_name == CNN.alexnet:
         return evaluation_cnn(batch_size, network_name, tool_path, log_dir, train_dir, train_log_path)
     elif network_name == FCN.fcn5:
-        return evaluation_fcn5(train_log_path)
+        return evaluation_fcn5(log_parser or train_log_path)
     elif network_name == RNN.lstm:
-        return evaluation_rnn(train_log_path)
+        return evaluation_rnn(log_parser or train_log_path)
     return 'err'
 
 
@@ -222,7 +226,9 @@ def parse_gpu_accounting_log(log_file):
 
 
 def run(log_dir, dev_id, net_type, network, gpu_count, learning_rate, cpu_count=1, cpu_count_for_gpu=0, batch_size=64,
-        num_epochs=10, epoch_size=None, synthetic=Synthetic.false, test_result_file=None):
+        num_epochs=10, epoch_size=None, synthetic=Synthetic.false, test_result_file=None, precision=Precision.fp32,
+        gradient_aggregation=GradientAggregation.central, data_format=DataFormat.auto, xla=Xla.off,
+        lstm_impl=LstmImpl.unrolled, mode=Mode.train, profile_steps=0, repeat=1):
     """
 
     :param log_dir:
@@ -238,11 +244,25 @@ def run(log_dir, dev_id, net_type, network, gpu_count, learning_rate, cpu_count=
     :param epoch_size:
     :param synthetic:
     :param test_result_file:
+    :param precision: Precision.fp32 or Precision.fp16 (fp16 compute with fp32 master weights)
+    :param gradient_aggregation: how multi-GPU scripts sum tower gradients, see allreduce.py
+    :param data_format: NCHW, NHWC, or auto to probe the faster one (see layout_probe.py)
+    :param xla: XLA JIT mode, Xla.off, Xla.global_jit or Xla.scoped (see xla.py)
+    :param lstm_impl: LSTM implementation of the lstm network (see rnn/lstm/lstm_layers.py)
+    :param mode: Mode.train, Mode.inference to time the frozen forward-only graph (see inference.py) or
+        Mode.loadgen to sweep it with concurrent clients (see loadgen.py). The forward-only modes run on the first
+        device of dev_id with random inputs.
+    :param profile_steps: number of steady-state training steps to trace into log_dir (see profiler.py)
+    :param repeat: which run of its config row this is, recorded in the result
     :return:
     """
     if cpu_count_for_gpu == 0:
         cpu_count_for_gpu = ALL_CPU_COUNT
     gpu_count = int(gpu_count)
+    if mode != Mode.train and (gpu_count > 1 or synthetic == Synthetic.true):
+        logger.warning('Inference runs on one device with random inputs, using device %s of %s and real scripts.'
+                       % (dev_id.split(',')[0], dev_id))
+        dev_id, gpu_count, synthetic = dev_id.split(',')[0], 1, Synthetic.false
     if not log_dir:
         logger.error('log_dir is None!')
         return
@@ -252,6 +272,8 @@ def run(log_dir, dev_id, net_type, network, gpu_count, learning_rate, cpu_count=
     log_path = os.path.join(log_dir, 'training.log')
     train_dir = os.path.join(log_dir, 'train-dir-%s' % str(int(time.time())))
     gpu_usage_csv = os.path.join(log_dir, 'gpu-accounting.csv')
+    gpu_timeline_csv = os.path.join(log_dir, 'gpu-timeline.csv')
+    loadgen_report = os.path.join(log_dir, 'loadgen-curve.csv')
 
     if os.path.isdir(train_dir):
         shutil.rmtree(train_dir)
@@ -281,11 +303,22 @@ def run(log_dir, dev_id, net_type, network, gpu_count, learning_rate, cpu_count=
         'train_dir': train_dir,
         'learning_rate': learning_rate,
         'logFile': log_path,
+        'use_fp16': str(precision == Precision.fp16),
+        'xla': xla,
+        'lstm_impl': lstm_impl,
+        'inference': str(mode == Mode.inference),
+        'loadgen': str(mode == Mode.loadgen),
+        'loadgen_report': loadgen_report,
+        'profile_steps': profile_steps,
+        'profile_dir': log_dir,
+        # Print lines as they come, the log is parsed while the script runs.
+        'PYTHONUNBUFFERED': 1,
     }
     script_name = 't.sh'
     envs['script_path'] = os.path.join(tool_path, '%s_bm.py' % network)
     if gpu_count > 1:
         envs['gpu_count'] = str(gpu_count)
+        envs['gradient_aggregation'] = gradient_aggregation
         envs['script_path'] = os.path.join(tool_path, '%s_multigpu_bm.py' % network)
         script_name = 'tm.sh'
     if synthetic == Synthetic.true:
@@ -297,13 +330,27 @@ def run(log_dir, dev_id, net_type, network, gpu_count, learning_rate, cpu_count=
         save_benchmark_result(average_batch_time, benchmark_accuracy)
         return
 
+    # The probe times training steps, inference runs keep the default layout of the device unless one is given.
+    if data_format == DataFormat.auto and synthetic == Synthetic.false and mode == Mode.train \
+            and layout_probe.supports(network, gpu_count):
+        with CpuLimiter(cpu_count_for_gpu):
+            data_format = layout_probe.choose_layout(tool_path, network, envs, dev_id, batch_size, precision, log_dir,
+                                                     gpu_count)
+    if data_format and data_format != DataFormat.auto:
+        envs['data_format'] = data_format
+
     envs_str = ' '.join(['%s=%s' % (k, v) for k, v in envs.items()])
     cmd = '%s bash %s' % (envs_str, script_path)
 
     start_time = time.time()
     logger.debug('Executing shell: %s' % cmd)
-    with GPUAccounting(gpu_usage_csv), CpuLimiter(cpu_count_for_gpu):
-        if os.system(cmd) != 0:
+    log_parser = TensorflowLogParser(log_path)
+    with GPUAccounting(gpu_usage_csv), GPUSampler(gpu_timeline_csv, dev_id), CpuLimiter(cpu_count_for_gpu):
+        process = subprocess.Popen(cmd, shell=True)
+        for name, value in log_parser.follow(lambda: process.poll() is not None):
+            if name == 'step':
+                logger.debug('%s: step %s, %s examples/sec, %s sec/batch' % ((network,) + value))
+        if process.returncode != 0:
             logger.error('Executing shell failed: %s.' % cmd)
             save_benchmark_result(average_batch_time, benchmark_accuracy)
             return
@@ -315,29 +362,101 @@ def run(log_dir, dev_id, net_type, network, gpu_count, learning_rate, cpu_count=
 
     # Parse log file and extract benchmark info
     # average_batch_time
-    average_batch_time = extract_info_tensorflow_synthetic(log_path) \
-        if synthetic == Synthetic.true else extract_info_tensorflow(log_path)
-
-    # In multiple GPUs case, average_batch_time belongs to one GPU.
-    average_batch_time /= gpu_count
+    if mode == Mode.train:
+        average_batch_time = extract_info_tensorflow_synthetic(log_parser) \
+            if synthetic == Synthetic.true else extract_info_tensorflow(log_parser)
+
+        # In multiple GPUs case, average_batch_time belongs to one GPU.
+        average_batch_time /= gpu_count
+    inference_throughput, inference_p50, inference_p90, inference_p99 = extract_info_tensorflow_inference(log_parser)
+    loadgen_peak_qps, loadgen_p99 = extract_info_tensorflow_loadgen(log_parser)
+    profiled_steps = extract_info_tensorflow_profiled_steps(log_parser)
+    if mode == Mode.loadgen:
+        logger.info('Latency-vs-throughput curve written to %s' % loadgen_report)
+    input_memory_mb = extract_info_tensorflow_input_memory(log_parser)
+    used_precision = extract_info_tensorflow_precision(log_parser)
+    if used_precision != precision:
+        logger.warning('Requested precision %s but the script ran in %s' % (precision, used_precision))
+    used_data_format = extract_info_tensorflow_data_format(log_parser)
+    used_xla = extract_info_tensorflow_xla(log_parser)
+    if used_xla != xla:
+        logger.warning('Requested XLA mode %s but the script ran with %s' % (xla, used_xla))
+    compile_time = extract_info_tensorflow_compile_time(log_parser)
+    used_lstm_impl = extract_info_tensorflow_lstm_impl(log_parser)
+    model_name = device_specs.device_model(dev_id)
+    flops_per_step, parameters = extract_info_tensorflow_flops(log_parser)
+    memory_bytes_per_step = extract_info_tensorflow_memory_bytes(log_parser)
+    achieved_tflops, peak_fraction = '-', '-'
+    arithmetic_intensity, attainable_tflops, roofline_bound = '-', '-', '-'
+    if mode == Mode.train:
+        # average_batch_time is per batch_size examples, a step of all devices takes gpu_count of them.
+        achieved_tflops, peak_fraction = device_specs.efficiency(flops_per_step, average_batch_time * gpu_count,
+                                                                 model_name, used_precision, gpu_count)
+        arithmetic_intensity, attainable_tflops, roofline_bound = device_specs.roofline(
+            flops_per_step, memory_bytes_per_step, model_name, used_precision, gpu_count)
+        if roofline_bound != '-':
+            logger.info('%s is %s-bound at %s FLOPs/byte: %s of %s attainable TFLOPS'
+                        % (network, roofline_bound, arithmetic_intensity, achieved_tflops, attainable_tflops))
 
     # Evaluation
-    if synthetic == Synthetic.false:
-        benchmark_accuracy = evaluation(batch_size, network, tool_path, log_dir, train_dir, log_path)
+    if synthetic == Synthetic.false and mode == Mode.train:
+        benchmark_accuracy = evaluation(batch_size, network, tool_path, log_dir, train_dir, log_path, log_parser)
 
     # Save log file
     with open(log_path, "a") as logFile:
         logFile.write("\nTotal time: %s\ncmd: %s" % (str(time_elapsed), cmd))
 
-    test_result = TestResultEntry(Framework.tensorflow, net_type, network, dev_id.replace(',', ';'), str(gpu_count),
-                                  cpu_count_for_gpu, batch_size, num_epochs, epoch_size, learning_rate, synthetic,
-                                  average_batch_time, benchmark_accuracy, gpu_utilization, mem_utilization,
-                                  max_memory_usage)
+    test_result = TestResultEntry(framework=Framework.tensorflow,
+                                  network_type=net_type,
+                                  network_name=network,
+                                  device_id=dev_id.replace(',', ';'),
+                                  device_count=str(gpu_count),
+                                  cpu_count=cpu_count_for_gpu,
+                                  batch_size=batch_size,
+                                  number_of_epochs=num_epochs,
+                                  epoch_size=epoch_size,
+                                  learning_rate=learning_rate,
+                                  synthetic=synthetic,
+                                  training_speed=average_batch_time,
+                                  accuracy=benchmark_accuracy,
+                                  gpu_utilization=gpu_utilization,
+                                  mem_utilization=mem_utilization,
+                                  max_memory_usage=max_memory_usage,
+                                  input_memory_mb=input_memory_mb,
+                                  precision=used_precision,
+                                  gradient_aggregation=gradient_aggregation if gpu_count > 1 else '-',
+                                  scaling_efficiency='-',
+                                  data_format=used_data_format,
+                                  xla=used_xla,
+                                  compile_time=compile_time,
+                                  lstm_impl=used_lstm_impl,
+                                  mode=mode,
+                                  inference_throughput=inference_throughput,
+                                  inference_p50_ms=inference_p50,
+                                  inference_p90_ms=inference_p90,
+                                  inference_p99_ms=inference_p99,
+                                  loadgen_peak_qps=loadgen_peak_qps,
+                                  loadgen_p99_ms=loadgen_p99,
+                                  profiled_steps=profiled_steps,
+                                  device_model=model_name,
+                                  flops_per_step=flops_per_step,
+                                  parameters=parameters,
+                                  achieved_tflops=achieved_tflops,
+                                  peak_fraction=peak_fraction,
+                                  memory_bytes_per_step=memory_bytes_per_step,
+                                  arithmetic_intensity=arithmetic_intensity,
+                                  attainable_tflops=attainable_tflops,
+                                  roofline_bound=roofline_bound,
+                                  repeat=repeat,
+                                  fingerprint=fingerprint.current())
+    if test_result_file:
+        test_result = test_result._replace(scaling_efficiency=efficiency_of_new_row(test_result, test_result_file))
 
     if test_result_file and os.path.isfile(test_result_file):
-        with open(test_result_file, 'a') as f:
-            test_result_str = ','.join([str(e) for e in test_result])
-            f.write('%s\n' % test_result_str)
+        with open(test_result_file, 'ab') as f:
+            csv.writer(f).writerow(test_result)
+        with ResultStore(store_path_of(test_result_file)) as store:
+            store.add(test_result, step_times=extract_info_tensorflow_step_times(log_parser))
 
     if train_dir and os.path.isdir(train_dir):  # train_dir may be not used and thus not exist
         shutil.rmtree(train_dir)
@@ -364,6 +483,24 @@ def set_launch_args():
     parser.add_argument('-netType', type=str, help='network type')
     parser.add_argument('-test_summary_file', type=str, help='File to record benchmark result.')
     parser.add_argument('-synthetic', type=str, default=Synthetic.false, help='whether to use the synthetic data')
+    parser.add_argument('-precision', type=str, default=Precision.fp32, choices=[Precision.fp32, Precision.fp16],
+                        help='fp32, or fp16 compute with fp32 master weights and dynamic loss scaling')
+    parser.add_argument('-gradientAggregation', type=str, default=GradientAggregation.central,
+                        choices=[GradientAggregation.central, GradientAggregation.round_robin, GradientAggregation.ring],
+                        help='gradient aggregation of multi-GPU runs')
+    parser.add_argument('-dataFormat', type=str, default=DataFormat.auto,
+                        choices=[DataFormat.auto, DataFormat.nchw, DataFormat.nhwc],
+                        help='image layout of cnn runs, auto probes the faster one')
+    parser.add_argument('-xla', type=str, default=Xla.off, choices=[Xla.off, Xla.global_jit, Xla.scoped],
+                        help='XLA JIT mode')
+    parser.add_argument('-lstmImpl', type=str, default=LstmImpl.unrolled,
+                        choices=[LstmImpl.unrolled, LstmImpl.dynamic, LstmImpl.block, LstmImpl.cudnn],
+                        help='LSTM implementation of lstm runs')
+    parser.add_argument('-mode', type=str, default=Mode.train, choices=[Mode.train, Mode.inference, Mode.loadgen],
+                        help='train, time forward-only inference of the frozen model or load it with clients')
+    parser.add_argument('-profileSteps', type=int, default=0,
+                        help='steady-state training steps to trace into log_dir, 0 for none')
+    parser.add_argument('-repeat', type=int, default=1, help='which run of its config row this is, from 1')
     args = parser.parse_args()
     # print(args)
     run(log_dir=args.log_dir,
@@ -379,6 +516,14 @@ def set_launch_args():
         epoch_size=args.epochSize,
         synthetic=args.synthetic,
         test_result_file=args.test_summary_file,
+        precision=args.precision,
+        gradient_aggregation=args.gradientAggregation,
+        data_format=args.dataFormat,
+        xla=args.xla,
+        lstm_impl=args.lstmImpl,
+        mode=args.mode,
+        profile_steps=args.profileSteps,
+        repeat=args.repeat,
         )
 
 
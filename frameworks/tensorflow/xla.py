@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+""" xla.py: XLA JIT modes of the training scripts and compile time accounting.
+
+  * off     no XLA.
+  * global  session wide auto-clustering (global_jit_level ON_1), covering the optimizer updates as well.
+  * scoped  only the ops built inside jit_scope(), i.e. the model and its gradients, are compiled.
+
+The first training step pays for graph optimisation, cuDNN autotuning and, with XLA, the compilation of the
+clusters. StepTimer keeps that step out of the steady-state average and reports how much longer than the
+average it took as compile_time. It also prints the steady-state step times (at most MAX_STEP_SAMPLES, evenly
+spread over the run) for the confidence intervals of resultprocess/regression.py.
+"""
+
+import contextlib
+
+import tensorflow as tf
+
+OFF = 'off'
+GLOBAL = 'global'
+SCOPED = 'scoped'
+MODES = (OFF, GLOBAL, SCOPED)
+XLA_TEMPLATE = 'xla: %s'
+COMPILE_TIME_TEMPLATE = 'compile_time: %.6f'
+STEP_TIMES_PREFIX = 'step_times: '
+MAX_STEP_SAMPLES = 1000
+
+# Values of the former boolean --xla flag.
+_LEGACY_MODES = {'true': GLOBAL, 'false': OFF}
+
+
+def normalize_mode(mode):
+    mode = _LEGACY_MODES.get(str(mode).lower(), str(mode).lower())
+    if mode not in MODES:
+        raise ValueError('Unknown XLA mode: %s (expected one of %s)' % (mode, ', '.join(MODES)))
+    return mode
+
+
+def configure_session(config, mode):
+    """Turn on global JIT in the tf.ConfigProto config if mode asks for it."""
+    if normalize_mode(mode) == GLOBAL:
+        config.graph_options.optimizer_options.global_jit_level = tf.OptimizerOptions.ON_1
+    return config
+
+
+@contextlib.contextmanager
+def _no_scope():
+    yield
+
+
+def jit_scope(mode):
+    """Context compiling the ops built inside it when mode is scoped, a no-op otherwise."""
+    if normalize_mode(mode) == SCOPED:
+        from tensorflow.contrib.compiler import jit
+        return jit.experimental_jit_scope()
+    return _no_scope()
+
+
+def print_mode(mode):
+    print(XLA_TEMPLATE % normalize_mode(mode))
+
+
+class StepTimer(object):
+    """Collects step durations, treating the first one as the warm-up (compile) step."""
+
+    def __init__(self):
+        self.first_step_time = None
+        self._total = 0.0
+        self._steps = 0
+        self.step_times = []
+
+    def add(self, duration):
+        if self.first_step_time is None:
+            self.first_step_time = duration
+        else:
+            self._total += duration
+            self._steps += 1
+            self.step_times.append(duration)
+
+    def average_step_time(self):
+        """Average duration of the steps after the first one (of the first one if it is the only one)."""
+        if self._steps == 0:
+            return self.first_step_time or 0.0
+        return self._total / self._steps
+
+    def compile_time(self):
+        if self.first_step_time is None:
+            return 0.0
+        return max(0.0, self.first_step_time - self.average_step_time())
+
+    def print_compile_time(self):
+        print(COMPILE_TIME_TEMPLATE % self.compile_time())
+
+    def samples(self, max_samples=MAX_STEP_SAMPLES):
+        """At most max_samples steady-state step times, evenly spread over the run."""
+        stride = max(1, (len(self.step_times) + max_samples - 1) // max_samples)
+        return self.step_times[::stride]
+
+    def print_step_times(self):
+        print(STEP_TIMES_PREFIX + ','.join('%.6f' % t for t in self.samples()))
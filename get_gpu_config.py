@@ -4,11 +4,20 @@
 """ get_gpu_config.py: Get gpu config.
 
 Created by gogleyin on 5/5/18.
+
+The normalized `nvidia-smi -q -x` output keeps what a GPU is and how it is set up (names, memory sizes, driver,
+VBIOS, ECC and persistence mode, power limits, application clocks) and drops what changes from one query to the
+next or between machines of the same config (timestamps, serials, bus ids, temperatures, clocks, utilization,
+used memory) or what the benchmark itself switches (accounting mode). It is the GPU part of the machine
+fingerprint, see fingerprint.py.
 """
 
+import subprocess
 import xml.etree.ElementTree as ET
 from xml.etree.ElementTree import tostring
 
+from nvidiasmi import TOOL
+
 
 children = 'children'
 black_tags = {
@@ -23,7 +32,13 @@ black_tags = {
             'gpu_part_number',
             'fan_speed',
             'performance_state',
+            # GPUAccounting turns accounting on for every run and leaves it on, so the first sweep after a boot
+            # would see it disabled and later ones enabled.
+            'accounting_mode',
+            'accounting_mode_buffer_size',
             'clocks_throttle_reasons',
+            'clocks_event_reasons',
+            'clocks',
             'utilization',
             'encoder_stats',
             'ecc_errors',
@@ -40,6 +55,7 @@ black_tags = {
             'pci_sub_system_id',
             'replay_counter',
             'tx_util', 'rx_util',
+            'pci_gpu_link_info',  # the current link generation and width drop with the power state
         ],
         'fb_memory_usage': [
             'used',
@@ -82,8 +98,15 @@ def process_gpu_xml_info(xml_content):
     :param xml_content: obtained from `nvidia-smi -q -x`
     :return: string
     """
-    tree = ET.fromstring(xml_content)
-    _process(tree)
+    return _process(ET.ElementTree(ET.fromstring(xml_content)))
+
+
+def query_gpu_config():
+    """Normalized `nvidia-smi -q -x` of this machine, None if nvidia-smi is not available."""
+    try:
+        return process_gpu_xml_info(subprocess.check_output('%s -q -x' % TOOL, shell=True))
+    except (subprocess.CalledProcessError, OSError, ET.ParseError):
+        return None
 
 
 def _process(tree):
@@ -95,16 +118,21 @@ def _process(tree):
 
     for gpu in root.findall('gpu'):
         gpu.attrib = {}  # remove gpu's <id> property
+        # Tags differ between driver versions, the ones a driver does not report are skipped.
         for k, v in black_tags['gpu'].items():
             if k == children:
                 for item in v:
                     child = gpu.find(item)
-                    gpu.remove(child)
+                    if child is not None:
+                        gpu.remove(child)
             else:
                 child = gpu.find(k)
+                if child is None:
+                    continue
                 for item in v:
                     grand_child = child.find(item)
-                    child.remove(grand_child)
+                    if grand_child is not None:
+                        child.remove(grand_child)
     return tostring(root)
 
 
@@ -5,6 +5,10 @@ MNIST_DATA_DIR = os.path.join(os.environ['HOME'], 'data/tensorflow/MNIST_data')
 RESNET_EPOCH_SIZE = 50000
 ALEXNET_EPOCH_SIZE = 50000
 FCN_EPOCH_SIZE = 60000
+BENCHMARK_CACHE_DIR = os.path.join(os.environ['HOME'], '.gpubenchmark')
+# Peaks of the host CPUs for the roofline of CPU rows (see device_specs.py), measured when None.
+CPU_PEAK_TFLOPS = None
+CPU_MEMORY_BANDWIDTH_GBS = None
 
 
 class Framework(object):
@@ -39,3 +43,38 @@ class Status(object):
     enabled = '1'
     disabled = '0'
 
+
+class Precision(object):
+    fp32 = 'fp32'
+    fp16 = 'fp16'  # fp16 compute, fp32 master weights, dynamic loss scaling
+
+
+class GradientAggregation(object):
+    central = 'central'
+    round_robin = 'round_robin'
+    ring = 'ring'
+
+
+class DataFormat(object):
+    auto = 'auto'  # probed per device and model, see frameworks/tensorflow/layout_probe.py
+    nchw = 'NCHW'
+    nhwc = 'NHWC'
+
+
+class Xla(object):
+    off = 'off'
+    global_jit = 'global'  # session wide auto-clustering
+    scoped = 'scoped'  # only the model and its gradients, see frameworks/tensorflow/xla.py
+
+
+class LstmImpl(object):
+    unrolled = 'unrolled'
+    dynamic = 'dynamic'
+    block = 'block'
+    cudnn = 'cudnn'  # block on CPU
+
+
+class Mode(object):
+    train = 'train'
+    inference = 'inference'  # frozen forward-only graph, see frameworks/tensorflow/inference.py
+    loadgen = 'loadgen'  # the frozen graph under concurrent client load, see frameworks/tensorflow/loadgen.py
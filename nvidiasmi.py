@@ -150,6 +150,45 @@ class GPU(object):
             cmd += ' > %s' % to_file
         subprocess.check_call(cmd, shell=True)
 
+    def query(self, *fields):
+        """Values of --query-gpu fields, e.g. gpu.query('name', 'driver_version')."""
+        cmd = '%s --query-gpu=%s --format=csv,noheader' % (self._cmd_prefix, ','.join(fields))
+        output = subprocess.check_output(cmd, shell=True).strip().split('\n')[0]
+        return [value.strip() for value in output.split(',')]
+
+
+# Columns of the utilization timeline GPUSampler writes, nvidia-smi --query-gpu names.
+GPU_SAMPLE_FIELDS = [
+    'timestamp',
+    'index',
+    'utilization.gpu',
+    'utilization.memory',
+    'memory.used',
+]
+
+
+class GPUSampler(object):
+    """
+    Samples utilization and memory of the GPUs into a csv file while the context is open, e.g. to draw the
+    utilization timeline of a run (see resultprocess/htmlreport.py).
+    """
+    def __init__(self, log_to_file, device_id=None, interval_ms=500):
+        self._log_file_path = log_to_file
+        self._cmd = TOOL.split()
+        if device_id and len(device_id) > 0:
+            self._cmd += ['-i', device_id]
+        self._cmd += ['--query-gpu=%s' % ','.join(GPU_SAMPLE_FIELDS), '--format=csv,nounits',
+                      '-lms', str(interval_ms), '-f', log_to_file]
+        self._process = None
+
+    def __enter__(self):
+        self._process = subprocess.Popen(self._cmd)
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self._process.poll() is None:
+            self._process.terminate()
+        self._process.wait()
+
 
 class GPUManager(object):
     def __init__(self):
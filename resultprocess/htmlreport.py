@@ -0,0 +1,326 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+""" htmlreport.py: One static HTML file with the charts of a results directory.
+
+The report of a directory written by benchmark.py (all_results.csv and the config dirs below it) has:
+
+  * throughput     examples/sec over the batch size per device, a chart per network and a line per test
+                   configuration other than the batch size (variance.RUN_KEYS). Lines are named by device model,
+                   count and precision plus the columns that differ between the lines of the chart. The band
+                   around a line spans the fastest and slowest of the repeated runs of a point.
+  * scaling        multi-GPU efficiency over the device count per network and gradient aggregation, see
+                   scaling.py.
+  * gpu timelines  utilization of every GPU over the run, from the gpu-timeline.csv files nvidiasmi.GPUSampler
+                   writes to the config dirs.
+  * variance       mean, confidence interval and spread of the throughput of configurations run more than once,
+                   noisy ones flagged, see variance.py.
+
+Charts are inline SVG and styles inline CSS, the file has no scripts and loads nothing, so it can be mailed or
+attached to a hardware evaluation as it is. Run this file from the project root:
+
+    python -m resultprocess.htmlreport -d GpuBenchmarkLog_180408-100000 -o report.html
+"""
+
+import os
+import csv
+import math
+import datetime
+import logging
+from collections import namedtuple
+from xml.sax.saxutils import escape
+
+import numpy as np
+
+from resultprocess import scaling, variance
+
+logger = logging.getLogger(__name__)
+
+REPORT_FILE_NAME = 'report.html'
+RESULT_FILE_NAME = 'all_results.csv'
+TIMELINE_FILE_NAME = 'gpu-timeline.csv'
+TIMELINE_TIME_FORMAT = '%Y/%m/%d %H:%M:%S.%f'
+MAX_TIMELINE_POINTS = 600
+
+WIDTH, HEIGHT = 640, 320
+LEFT, RIGHT, TOP, BOTTOM = 64, 16, 16, 48
+PALETTE = ['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd', '#8c564b', '#e377c2', '#7f7f7f', '#bcbd22',
+           '#17becf']
+
+VARIANCE_FIELDS = ['network_name', 'device_model', 'device_count', 'batch_size', 'synthetic', 'precision',
+                   'data_format', 'xla', 'mode', 'runs', 'mean', 'std', 'ci_low', 'ci_high', 'min', 'max', 'cv', 'flag']
+# Columns of variance.RUN_KEYS always in a throughput line's name, or its x axis.
+NAMED_KEYS = ('network_name', 'batch_size', 'device_model', 'device_count', 'precision')
+
+# points are (x, y, low, high), low and high None for points without a band.
+Series = namedtuple('Series', ['name', 'points'])
+
+STYLE = """
+body { font-family: sans-serif; margin: 24px; color: #222; }
+h2 { border-bottom: 1px solid #ccc; margin-top: 32px; }
+.chart { display: inline-block; vertical-align: top; margin: 0 24px 24px 0; }
+.chart h3 { font-size: 14px; margin: 0 0 4px 0; }
+.legend { font-size: 12px; list-style: none; padding: 0; margin: 4px 0 0 0; max-width: 640px; }
+.legend li { display: inline-block; margin-right: 12px; }
+.legend span { display: inline-block; width: 12px; height: 12px; margin-right: 4px; vertical-align: middle; }
+table { border-collapse: collapse; font-size: 12px; }
+th, td { border: 1px solid #ccc; padding: 2px 6px; text-align: right; }
+th { background: #f0f0f0; }
+svg text { font-size: 11px; fill: #444; }
+"""
+
+
+def _ticks(low, high, count=5):
+    """Round tick values from below low to above high."""
+    if high <= low:
+        high = low + 1.0
+    step = (high - low) / count
+    magnitude = 10 ** math.floor(math.log10(step))
+    step = min(m * magnitude for m in (1, 2, 2.5, 5, 10) if m * magnitude >= step)
+    start = math.floor(low / step) * step
+    return [start + i * step for i in range(int(math.ceil((high - start) / step - 1e-9)) + 1)]
+
+
+def _label(value):
+    return ('%d' % value) if float(value).is_integer() else ('%g' % value)
+
+
+def line_chart(title, x_label, y_label, series, log_x=False, reference=None):
+    """
+    An SVG line chart with its legend, as an HTML fragment.
+    :param series: list of Series, the x values of a log_x chart must be positive
+    :param log_x: log2 x axis with a tick per x value, for batch sizes and device counts
+    :param reference: y of a dashed horizontal line, e.g. ideal scaling
+    """
+    points = [p for s in series for p in s.points]
+    if not points:
+        return ''
+    xs = sorted(set(p[0] for p in points))
+    ys = [v for p in points for v in p[1:] if v is not None] + ([reference] if reference is not None else [])
+    transform = (lambda v: math.log(v, 2)) if log_x else float
+    x_ticks = xs if log_x else _ticks(xs[0], xs[-1])
+    y_ticks = _ticks(0.0, max(ys) if max(ys) > 0 else 1.0)
+    x_low, x_high = transform(x_ticks[0]), transform(x_ticks[-1])
+    if x_high == x_low:
+        x_low, x_high = x_low - 1, x_high + 1
+    plot_width, plot_height = WIDTH - LEFT - RIGHT, HEIGHT - TOP - BOTTOM
+
+    def px(x):
+        return LEFT + (transform(x) - x_low) / (x_high - x_low) * plot_width
+
+    def py(y):
+        return TOP + plot_height - (y - y_ticks[0]) / (y_ticks[-1] - y_ticks[0]) * plot_height
+
+    svg = ['<svg xmlns="http://www.w3.org/2000/svg" width="%d" height="%d">' % (WIDTH, HEIGHT)]
+    for y in y_ticks:
+        svg.append('<line x1="%d" y1="%.1f" x2="%d" y2="%.1f" stroke="#e6e6e6"/>' % (LEFT, py(y), WIDTH - RIGHT, py(y)))
+        svg.append('<text x="%d" y="%.1f" text-anchor="end">%s</text>' % (LEFT - 4, py(y) + 4, _label(y)))
+    for x in x_ticks:
+        svg.append('<text x="%.1f" y="%d" text-anchor="middle">%s</text>' % (px(x), HEIGHT - BOTTOM + 14, _label(x)))
+    svg.append('<line x1="%d" y1="%d" x2="%d" y2="%d" stroke="#888"/>'
+               % (LEFT, HEIGHT - BOTTOM, WIDTH - RIGHT, HEIGHT - BOTTOM))
+    svg.append('<line x1="%d" y1="%d" x2="%d" y2="%d" stroke="#888"/>' % (LEFT, TOP, LEFT, HEIGHT - BOTTOM))
+    svg.append('<text x="%d" y="%d" text-anchor="middle">%s</text>'
+               % (LEFT + plot_width / 2, HEIGHT - 8, escape(x_label)))
+    svg.append('<text transform="translate(14,%d) rotate(-90)" text-anchor="middle">%s</text>'
+               % (TOP + plot_height / 2, escape(y_label)))
+    if reference is not None:
+        svg.append('<line x1="%d" y1="%.1f" x2="%d" y2="%.1f" stroke="#888" stroke-dasharray="4,4"/>'
+                   % (LEFT, py(reference), WIDTH - RIGHT, py(reference)))
+
+    legend = []
+    for index, s in enumerate(series):
+        color = PALETTE[index % len(PALETTE)]
+        line = sorted(s.points)
+        banded = [p for p in line if p[2] is not None and p[3] is not None]
+        if any(p[2] != p[3] for p in banded):
+            outline = ['%.1f,%.1f' % (px(p[0]), py(p[3])) for p in banded] + \
+                      ['%.1f,%.1f' % (px(p[0]), py(p[2])) for p in reversed(banded)]
+            svg.append('<polygon points="%s" fill="%s" fill-opacity="0.2" stroke="none"/>' % (' '.join(outline), color))
+        svg.append('<polyline points="%s" fill="none" stroke="%s" stroke-width="1.5"/>'
+                   % (' '.join('%.1f,%.1f' % (px(p[0]), py(p[1])) for p in line), color))
+        if len(line) <= 50:
+            for p in line:
+                svg.append('<circle cx="%.1f" cy="%.1f" r="3" fill="%s"><title>%s: %s, %s</title></circle>'
+                           % (px(p[0]), py(p[1]), color, escape(s.name), _label(p[0]), '%.4g' % p[1]))
+        legend.append('<li><span style="background:%s"></span>%s</li>' % (color, escape(s.name)))
+    svg.append('</svg>')
+    return '<div class="chart"><h3>%s</h3>%s<ul class="legend">%s</ul></div>' \
+           % (escape(title), '\n'.join(svg), ''.join(legend))
+
+
+def _mean(values):
+    return sum(values) / len(values)
+
+
+def throughput_charts(rows):
+    """A throughput over batch size per device chart per network, see the module docstring."""
+    charts = {}
+    for key, values in variance.group_runs(rows).items():
+        config = dict(zip(variance.RUN_KEYS, key))
+        try:
+            batch = int(config['batch_size']) // max(1, int(config['device_count']))
+        except ValueError:
+            continue
+        # One line per test configuration, only the batch size changes along it.
+        line = tuple(sorted((k, v) for k, v in config.items() if k != 'batch_size'))
+        lines = charts.setdefault(config['network_name'], {})
+        lines.setdefault(line, []).append((batch, _mean(values), min(values), max(values)))
+    result = []
+    for network in sorted(charts):
+        lines = charts[network]
+        configs = [dict(line) for line in lines]
+        varying = [k for k in variance.RUN_KEYS if k not in NAMED_KEYS and len(set(c[k] for c in configs)) > 1]
+        series = []
+        for line, points in lines.items():
+            config = dict(line)
+            name = '%s x%s %s' % (config['device_model'], config['device_count'], config['precision'])
+            for k in variance.RUN_KEYS:
+                if k in varying:
+                    name += ' %s=%s' % (k, config[k])
+                elif k in ('gradient_aggregation', 'mode') and config[k] not in ('-', 'train'):
+                    name += ' ' + config[k]
+            series.append(Series(name, sorted(points)))
+        result.append(line_chart('%s throughput' % network, 'batch size per device', 'examples/sec',
+                                 sorted(series, key=lambda s: s.name), log_x=True))
+    return result
+
+
+def scaling_charts(rows):
+    """A scaling efficiency over device count chart per network, see scaling.scaling_report."""
+    charts = {}
+    for entry in scaling.scaling_report(rows):
+        if entry['efficiency'] == '-':
+            continue
+        curves = charts.setdefault(entry['network_name'], {}).setdefault(
+            '%s batch %s' % (entry['precision'], entry['batch_per_device']), {})
+        curves.setdefault(entry['gradient_aggregation'], []).append(
+            (entry['device_count'], float(entry['efficiency']), None, None))
+    result = []
+    for network in sorted(charts):
+        series = []
+        for name, curves in sorted(charts[network].items()):
+            # The 1-device point starts the curve of every aggregation strategy.
+            base = curves.pop('-', [])
+            series += [Series('%s %s' % (name, aggregation), base + points)
+                       for aggregation, points in sorted(curves.items())]
+        if series:
+            result.append(line_chart('%s scaling efficiency' % network, 'devices', 'efficiency', series,
+                                     log_x=True, reference=1.0))
+    return result
+
+
+def read_timeline(path):
+    """
+    Samples of a gpu-timeline.csv (see nvidiasmi.GPUSampler).
+    :return: dict of GPU index to a (seconds since the first sample, utilization %, memory MiB) array
+    """
+    samples = {}
+    start = None
+    with open(path, 'rb') as f:
+        reader = csv.reader(f)
+        next(reader, None)  # skip the header
+        for values in reader:
+            if len(values) < 5:
+                continue
+            try:
+                when = datetime.datetime.strptime(values[0].strip(), TIMELINE_TIME_FORMAT)
+                sample = [float(values[2]), float(values[4])]
+            except ValueError:
+                continue
+            start = start or when
+            samples.setdefault(values[1].strip(), []).append([(when - start).total_seconds()] + sample)
+    return dict((index, np.array(values)) for index, values in samples.items())
+
+
+def _downsample(samples, count=MAX_TIMELINE_POINTS):
+    """samples reduced to at most count rows by averaging consecutive runs of them."""
+    if len(samples) <= count:
+        return samples
+    buckets = np.array_split(samples, count)
+    return np.array([bucket.mean(axis=0) for bucket in buckets])
+
+
+def timeline_charts(results_dir):
+    """A utilization and memory chart per gpu-timeline.csv below results_dir."""
+    charts = []
+    for directory, _, files in sorted(os.walk(results_dir)):
+        if TIMELINE_FILE_NAME not in files:
+            continue
+        path = os.path.join(directory, TIMELINE_FILE_NAME)
+        try:
+            timeline = read_timeline(path)
+        except (IOError, OSError, csv.Error) as e:
+            logger.warning('Could not read %s: %s' % (path, e))
+            continue
+        if not timeline:
+            continue
+        samples = dict((index, _downsample(values)) for index, values in timeline.items())
+        title = os.path.relpath(directory, results_dir)
+        charts.append(line_chart('%s GPU utilization' % title, 'seconds', 'utilization %',
+                                 [Series('GPU %s' % index, [(s[0], s[1], None, None) for s in samples[index]])
+                                  for index in sorted(samples)]))
+        charts.append(line_chart('%s GPU memory' % title, 'seconds', 'MiB',
+                                 [Series('GPU %s' % index, [(s[0], s[2], None, None) for s in samples[index]])
+                                  for index in sorted(samples)]))
+    return charts
+
+
+def variance_table(rows):
+    """Run-to-run variance of the configurations run more than once (see variance.py), as an HTML table."""
+    report = variance.variance_report(rows, min_runs=2)
+    if not report:
+        return '<p>No configuration was run more than once.</p>'
+    lines = ['<tr>%s</tr>' % ''.join('<td>%s</td>' % escape(str(entry[f])) for f in VARIANCE_FIELDS)
+             for entry in report]
+    return '<table><tr>%s</tr>%s</table>' % (''.join('<th>%s</th>' % f for f in VARIANCE_FIELDS), ''.join(lines))
+
+
+def build_report(results_dir, result_file=None):
+    """
+    The report of a results directory as an HTML string.
+    :param result_file: result csv, all_results.csv of results_dir by default
+    """
+    result_file = result_file or os.path.join(results_dir, RESULT_FILE_NAME)
+    rows = scaling.read_results(result_file) if os.path.isfile(result_file) else []
+    if not rows:
+        logger.warning('No results in %s' % result_file)
+    sections = [('Throughput', throughput_charts(rows)),
+                ('Scaling efficiency', scaling_charts(rows)),
+                ('GPU utilization', timeline_charts(results_dir))]
+    devices = sorted(set(row.get('device_model') or '-' for row in rows))
+    html = ['<!DOCTYPE html>', '<html><head><meta charset="utf-8">',
+            '<title>Benchmark report %s</title>' % escape(os.path.basename(os.path.abspath(results_dir))),
+            '<style>%s</style></head><body>' % STYLE,
+            '<h1>Benchmark report</h1>',
+            '<p>%s: %d results on %s, generated %s.</p>'
+            % (escape(os.path.abspath(results_dir)), len(rows), escape(', '.join(devices)),
+               datetime.datetime.now().strftime('%Y-%m-%d %H:%M'))]
+    for title, charts in sections:
+        html.append('<h2>%s</h2>' % title)
+        html.append('\n'.join(charts) if charts else '<p>Nothing to show.</p>')
+    html.append('<h2>Run-to-run variance</h2>')
+    html.append(variance_table(rows))
+    html.append('</body></html>')
+    return '\n'.join(html)
+
+
+def write_report(results_dir, output_file=None, result_file=None):
+    """Write the report of results_dir, to report.html in it by default. :return: the report file"""
+    output_file = output_file or os.path.join(results_dir, REPORT_FILE_NAME)
+    with open(output_file, 'w') as f:
+        f.write(build_report(results_dir, result_file))
+    return output_file
+
+
+if __name__ == '__main__':
+    import argparse
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description='Static HTML report of a benchmark results directory')
+    parser.add_argument('-d', '--results_dir', help='log directory written by benchmark.py')
+    parser.add_argument('-i', '--input', help='result csv, all_results.csv of the results directory by default',
+                        default=None)
+    parser.add_argument('-o', '--output', help='html file, report.html in the results directory by default',
+                        default=None)
+    args = parser.parse_args()
+    logging.info('Report written to %s' % write_report(args.results_dir, args.output, args.input))
@@ -4,41 +4,136 @@
 """ mergecsv.py: Handle result csv file.
 
 Created by gogleyin on 4/8/18.
+
+merge_csvs() streams result files of many hosts into one csv. Columns are matched by name: the merged header is
+the union of all input headers (TestResultFields order first, unknown columns after), and columns a file does not
+have are written as '-'. Files are parsed in a process pool and their rows written as soon as a file is done, in
+input order, so memory holds a file at a time rather than the whole merge. Identical runs (same values in every
+column, e.g. a file that was copied to two hosts or merged twice) are written once.
 """
 
 import os
 import csv
+import hashlib
 import logging
+import multiprocessing
+
+from benchmark import TestResultFields
+
+MISSING = '-'
+
+
+def read_header(path):
+    with open(path, 'rb') as csv_file:
+        return [name.strip() for name in next(csv.reader(csv_file), [])]
+
+
+def union_header(headers):
+    """Columns of all headers by name, known result columns in TestResultFields order and the others after them."""
+    names = set(name for header in headers for name in header)
+    extra = []
+    for header in headers:
+        extra += [name for name in header if name not in TestResultFields and name not in extra]
+    return [name for name in TestResultFields if name in names] + extra
+
 
-def merge_csvs(files, identifiers, new_field_name, output_file):
-    headline = None
-    final_rows = []
+def run_hash(values):
+    """Hash identifying a run by all of its values, see merge_csvs."""
+    return hashlib.sha1('\x1f'.join(values)).hexdigest()
+
+
+def _read_file(task):
+    """
+    Rows of one result file aligned to header. Runs in a worker process.
+    :param task: (path, identifier, new_field_name, header)
+    :return: (path, list of (hash, row), number of malformed rows skipped)
+    """
+    path, identifier, new_field_name, header = task
+    rows = []
+    malformed = 0
+    with open(path, 'rb') as csv_file:
+        reader = csv.reader(csv_file)
+        file_header = [name.strip() for name in next(reader, [])]
+        positions = dict((name, i) for i, name in enumerate(file_header))
+        for values in reader:
+            if not values:
+                continue
+            if len(values) > len(file_header):
+                malformed += 1
+                continue
+            row = [values[positions[name]] if name in positions and positions[name] < len(values) else MISSING
+                   for name in header]
+            # Rows of an already merged file keep their identifier.
+            identified = [identifier if name == new_field_name and value == MISSING else value
+                          for name, value in zip(header, row)]
+            rows.append((run_hash([v for name, v in zip(header, row) if name != new_field_name]), identified))
+    return path, rows, malformed
+
+
+def merge_csvs(files, identifiers, new_field_name, output_file, processes=None, dedupe=True):
+    """
+    Merge result files into one, adding a column that tells the files apart.
+    :param files: result csv files, missing ones are skipped with a warning
+    :param identifiers: value of new_field_name per file, e.g. the host it comes from
+    :param new_field_name: name of the identifying column, the first one of the merged file
+    :param processes: worker processes, one per CPU by default
+    :param dedupe: write identical runs once
+    :return: (rows written, duplicates dropped, malformed rows skipped)
+    """
+    inputs = []
     for index, f in enumerate(files):
         if not f or not os.path.isfile(f):
             logging.warning('File not exist: %s' % f)
             continue
-        identifier = identifiers[index]
-        with open(f, 'rb') as csv_file:
-            first_line = csv_file.readline()
-            if not headline:
-                headline = '%s,%s' % (new_field_name, first_line)
-                final_rows.append(headline)
-            rows = csv_file.readlines()
-            rows = ['%s,%s' % (identifier, row) for row in rows]
-            final_rows += rows
-    with open(output_file, 'wb') as output:
-        output.writelines(final_rows)
-
-if __name__ == '__main__':
-    csvs = [
-        '/Users/gogleyin/Documents/work/cloud/testdata/al-m40/GpuBenchmarkLog_180330-194133/all_results.csv',
-        '/Users/gogleyin/Documents/work/cloud/testdata/al-p100/GpuBenchmarkLog_180330-200111/all_results.csv',
-        '/Users/gogleyin/Documents/work/cloud/testdata/tx-m40/GpuBenchmarkLog_180330-164749/all_results.csv',
-        '/Users/gogleyin/Documents/work/cloud/testdata/tx-p40/GpuBenchmarkLog_180330-194439/all_results.csv',
-    ]
-    output_csv = '/Users/gogleyin/Desktop/all.csv'
-    ids = ['al-m40', 'al-p100', 'tx-m40', 'tx-p40']
-    merge_csvs(csvs, ids, 'gpu', output_csv)
+        inputs.append((f, identifiers[index], read_header(f)))
+    if not inputs:
+        return 0, 0, 0
+    header = [new_field_name] + [name for name in union_header([h for _, _, h in inputs]) if name != new_field_name]
+    for f, _, file_header in inputs:
+        missing = [name for name in header[1:] if name not in file_header]
+        if missing:
+            logging.info('%s has no %s, written as %s' % (f, ', '.join(missing), MISSING))
 
+    tasks = [(f, identifier, new_field_name, header) for f, identifier, _ in inputs]
+    pool = multiprocessing.Pool(processes)
+    seen = set()
+    written = duplicates = malformed = 0
+    try:
+        with open(output_file, 'wb') as output:
+            writer = csv.writer(output)
+            writer.writerow(header)
+            for path, rows, skipped in pool.imap(_read_file, tasks):
+                if skipped:
+                    logging.warning('Skipped %d rows with more values than columns in %s' % (skipped, path))
+                malformed += skipped
+                for key, row in rows:
+                    if dedupe and key in seen:
+                        duplicates += 1
+                        continue
+                    seen.add(key)
+                    writer.writerow(row)
+                    written += 1
+    finally:
+        pool.close()
+        pool.join()
+    return written, duplicates, malformed
 
 
+if __name__ == '__main__':
+    import argparse
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description='Merge the result csv files of several hosts into one')
+    parser.add_argument('-i', '--input', help='result csv files', nargs='+')
+    parser.add_argument('--ids', help='identifier per input file, comma separated, the parent directory names by '
+                                      'default', default=None)
+    parser.add_argument('-f', '--field', help='name of the identifier column', default='gpu')
+    parser.add_argument('-o', '--output', help='merged csv file')
+    parser.add_argument('-p', '--processes', help='worker processes, one per CPU by default', type=int, default=None)
+    parser.add_argument('--keep_duplicates', help='write identical runs as often as they occur', action='store_true')
+    args = parser.parse_args()
+    ids = args.ids.split(',') if args.ids else \
+        [os.path.basename(os.path.dirname(os.path.abspath(f))) for f in args.input]
+    written, duplicates, malformed = merge_csvs(args.input, ids, args.field, args.output, args.processes,
+                                               not args.keep_duplicates)
+    logging.info('Wrote %d rows to %s, dropped %d duplicates, skipped %d malformed rows'
+                 % (written, args.output, duplicates, malformed))
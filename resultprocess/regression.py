@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+""" regression.py: Throughput regressions between a baseline and a candidate set of stored results.
+
+Both sets are queries on a result store (see resultstore.py), e.g. everything recorded before and after a driver
+upgrade. Rows are matched by their configuration and hardware (MATCH_KEYS), every matched configuration is one
+comparison:
+
+  * samples      the examples/sec of every recorded steady-state step (batch_size / step time) of all runs of
+                 the set. Runs without step times (imported csv files, inference rows) give one sample per run.
+  * change       relative change of the mean throughput, candidate against baseline.
+  * ci           bootstrap confidence interval of the change, resampling both sets with replacement.
+  * effect_size  Cohen's d of the two sample sets.
+
+With same_machine, rows also have to come from machines with the same fingerprint (see fingerprint.py), e.g. to
+compare two code versions on a fleet without mixing hosts that are set up differently. Leave it off to compare
+across an upgrade of the driver or a library, which changes the fingerprint.
+
+A comparison is a REGRESSION (or IMPROVEMENT) when the whole interval lies below (above) zero and the change
+is at least min_change, so noise far below what anyone would act on is not flagged. A side with fewer than
+min_samples samples (e.g. one imported csv row) has no spread to resample; such a comparison only gets the
+change and the verdict INSUFFICIENT, which never fails the run. Run
+python -m resultprocess.regression from the project root to print the report; it exits with 1 when a regression
+was found, for use in CI jobs.
+"""
+
+import csv
+import logging
+
+import numpy as np
+
+from resultprocess.resultstore import ResultStore
+
+logger = logging.getLogger(__name__)
+
+# Columns that must be equal for a baseline and a candidate row to be compared.
+MATCH_KEYS = ('framework', 'network_type', 'network_name', 'device_count', 'batch_size', 'synthetic', 'precision',
+              'gradient_aggregation', 'data_format', 'xla', 'lstm_impl', 'mode', 'device_model')
+SAME_MACHINE_KEYS = MATCH_KEYS + ('fingerprint',)
+REPORT_FIELDS = list(SAME_MACHINE_KEYS) + ['baseline_runs', 'candidate_runs', 'baseline_throughput',
+                                           'candidate_throughput', 'change', 'ci_low', 'ci_high', 'effect_size',
+                                           'verdict']
+REGRESSION = 'REGRESSION'
+IMPROVEMENT = 'IMPROVEMENT'
+UNCHANGED = 'same'
+NO_BASELINE = 'NO_BASELINE'
+NO_CANDIDATE = 'NO_CANDIDATE'
+INSUFFICIENT = 'INSUFFICIENT'
+DEFAULT_CONFIDENCE = 0.95
+DEFAULT_MIN_CHANGE = 0.02
+DEFAULT_RESAMPLES = 2000
+DEFAULT_MIN_SAMPLES = 2
+
+
+def match_key(row, keys=MATCH_KEYS):
+    return tuple(str(row.get(key)) for key in keys)
+
+
+def throughput_samples(store, row):
+    """Examples/sec samples of a stored run, see the module docstring."""
+    if row.get('mode') in (None, 'train'):
+        step_times = [t for t in store.samples(row['id']) if t > 0]
+        if step_times and row.get('batch_size'):
+            return [row['batch_size'] / t for t in step_times]
+        if row.get('training_speed') and row.get('batch_size') and row.get('device_count'):
+            return [row['batch_size'] / (row['training_speed'] * row['device_count'])]
+        return []
+    value = row.get('inference_throughput') or row.get('loadgen_peak_qps')
+    return [value] if value else []
+
+
+def collect(store, match_keys=MATCH_KEYS, **filters):
+    """Throughput samples and run count per match_key of the runs matching filters (see ResultStore.query)."""
+    groups = {}
+    for row in store.query(**filters):
+        samples = throughput_samples(store, row)
+        if not samples:
+            continue
+        group = groups.setdefault(match_key(row, match_keys), [[], 0])
+        group[0].extend(samples)
+        group[1] += 1
+    return groups
+
+
+def bootstrap_change(baseline, candidate, confidence=DEFAULT_CONFIDENCE, resamples=DEFAULT_RESAMPLES, seed=0):
+    """
+    Relative change of the mean from baseline to candidate and its bootstrap confidence interval.
+    :return: (change, ci_low, ci_high)
+    """
+    baseline = np.asarray(baseline, dtype=np.float64)
+    candidate = np.asarray(candidate, dtype=np.float64)
+    rng = np.random.RandomState(seed)
+    baseline_means = baseline[rng.randint(0, len(baseline), (resamples, len(baseline)))].mean(axis=1)
+    candidate_means = candidate[rng.randint(0, len(candidate), (resamples, len(candidate)))].mean(axis=1)
+    changes = candidate_means / baseline_means - 1.0
+    tail = (1.0 - confidence) / 2.0 * 100.0
+    return candidate.mean() / baseline.mean() - 1.0, np.percentile(changes, tail), np.percentile(changes, 100 - tail)
+
+
+def effect_size(baseline, candidate):
+    """Cohen's d with the pooled standard deviation, 0.0 when both sets are constant."""
+    baseline = np.asarray(baseline, dtype=np.float64)
+    candidate = np.asarray(candidate, dtype=np.float64)
+    pooled = np.sqrt(((len(baseline) - 1) * baseline.var(ddof=1 if len(baseline) > 1 else 0) +
+                      (len(candidate) - 1) * candidate.var(ddof=1 if len(candidate) > 1 else 0)) /
+                     max(1, len(baseline) + len(candidate) - 2))
+    if pooled == 0:
+        return 0.0
+    return (candidate.mean() - baseline.mean()) / pooled
+
+
+def compare(baseline_groups, candidate_groups, confidence=DEFAULT_CONFIDENCE, min_change=DEFAULT_MIN_CHANGE,
+            resamples=DEFAULT_RESAMPLES, match_keys=MATCH_KEYS, min_samples=DEFAULT_MIN_SAMPLES):
+    """
+    Compare the groups of collect() of two sets.
+    :param match_keys: the keys both sets were collected with
+    :param min_samples: samples each side needs for an interval and a verdict
+    :return: list of dicts with REPORT_FIELDS keys, regressions first
+    """
+    report = []
+    for key in sorted(set(baseline_groups) | set(candidate_groups)):
+        entry = dict(zip(match_keys, key))
+        entry.update(baseline_runs=0, candidate_runs=0, baseline_throughput='-', candidate_throughput='-',
+                     change='-', ci_low='-', ci_high='-', effect_size='-')
+        for name, groups in (('baseline', baseline_groups), ('candidate', candidate_groups)):
+            if key in groups:
+                samples, runs = groups[key]
+                entry.update({name + '_runs': runs, name + '_throughput': '%.1f' % np.mean(samples)})
+        if key not in baseline_groups:
+            entry['verdict'] = NO_BASELINE
+        elif key not in candidate_groups:
+            entry['verdict'] = NO_CANDIDATE
+        elif min(len(baseline_groups[key][0]), len(candidate_groups[key][0])) < max(2, min_samples):
+            change = np.mean(candidate_groups[key][0]) / np.mean(baseline_groups[key][0]) - 1.0
+            entry.update(change='%.2f%%' % (change * 100), verdict=INSUFFICIENT)
+        else:
+            baseline, candidate = baseline_groups[key][0], candidate_groups[key][0]
+            change, low, high = bootstrap_change(baseline, candidate, confidence, resamples)
+            entry.update(change='%.2f%%' % (change * 100), ci_low='%.2f%%' % (low * 100),
+                         ci_high='%.2f%%' % (high * 100), effect_size='%.2f' % effect_size(baseline, candidate))
+            entry['verdict'] = UNCHANGED
+            if high < 0 and -change >= min_change:
+                entry['verdict'] = REGRESSION
+            elif low > 0 and change >= min_change:
+                entry['verdict'] = IMPROVEMENT
+        report.append(entry)
+    order = {REGRESSION: 0, IMPROVEMENT: 1}
+    return sorted(report, key=lambda e: order.get(e['verdict'], 2))
+
+
+def parse_filters(spec):
+    """'network=alexnet,since=2018-04-01' -> query keywords, see ResultStore.query"""
+    filters = {}
+    for item in spec.split(','):
+        if item.strip():
+            key, _, value = item.partition('=')
+            filters[key.strip()] = value.strip()
+    return filters
+
+
+def write_report(report, output_file):
+    with open(output_file, 'wb') as f:
+        writer = csv.DictWriter(f, REPORT_FIELDS)
+        writer.writeheader()
+        writer.writerows(report)
+
+
+def format_report(report):
+    columns = ['network_name', 'device_model', 'device_count', 'batch_size', 'precision', 'xla', 'mode',
+               'baseline_throughput', 'candidate_throughput', 'change', 'ci_low', 'ci_high', 'effect_size', 'verdict']
+    lines = [columns] + [[str(e[c]) for c in columns] for e in report]
+    widths = [max(len(line[i]) for line in lines) for i in range(len(columns))]
+    return '\n'.join('  '.join(v.ljust(w) for v, w in zip(line, widths)).rstrip() for line in lines)
+
+
+if __name__ == '__main__':
+    import sys
+    import argparse
+    logging.basicConfig(level=logging.DEBUG)
+    parser = argparse.ArgumentParser(description='Throughput regressions between two sets of stored results')
+    parser.add_argument('-db', '--store', help='result store file, see resultstore.py', default='results.db')
+    parser.add_argument('-b', '--baseline', help='query of the baseline set, e.g. "until=2018-04-01"',
+                        required=True)
+    parser.add_argument('-c', '--candidate', help='query of the candidate set, e.g. "since=2018-04-02"',
+                        required=True)
+    parser.add_argument('--confidence', help='confidence level of the intervals', type=float,
+                        default=DEFAULT_CONFIDENCE)
+    parser.add_argument('--min_change', help='smallest relative change to flag', type=float,
+                        default=DEFAULT_MIN_CHANGE)
+    parser.add_argument('--resamples', help='bootstrap resamples', type=int, default=DEFAULT_RESAMPLES)
+    parser.add_argument('--min_samples', help='samples each side needs for a verdict, at least 2', type=int,
+                        default=DEFAULT_MIN_SAMPLES)
+    parser.add_argument('--same_machine', help='only compare rows of machines with the same fingerprint',
+                        action='store_true')
+    parser.add_argument('-o', '--output', help='csv file to write the report to', default=None)
+    args = parser.parse_args()
+    keys = SAME_MACHINE_KEYS if args.same_machine else MATCH_KEYS
+    with ResultStore(args.store) as result_store:
+        result = compare(collect(result_store, keys, **parse_filters(args.baseline)),
+                         collect(result_store, keys, **parse_filters(args.candidate)),
+                         args.confidence, args.min_change, args.resamples, keys, args.min_samples)
+    print(format_report(result))
+    if args.output:
+        write_report(result, args.output)
+    sys.exit(1 if any(e['verdict'] == REGRESSION for e in result) else 0)
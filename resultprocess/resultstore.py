@@ -0,0 +1,313 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+""" resultstore.py: SQLite store of benchmark results with typed columns and a query API.
+
+Every result row is one row of the runs table, with a column per TestResultFields entry plus when and where it was
+recorded (recorded_at, host) and a free source tag (e.g. the machine a merged csv came from). Numbers are stored
+as INTEGER or REAL and '-' as NULL, so filters and sorting work on values rather than strings. The ';'-joined
+per-device columns of multi-GPU rows (device_id, gpu_utilization, mem_utilization, max_memory_usage) are kept as
+text in runs for the csv export and split into one typed row per device in the run_devices child table. The
+steady-state step times a training script printed go to the run_samples child table.
+
+    store = ResultStore('results.db')
+    store.import_csv('all_results.csv', source='al-p100')
+    rows = store.query(network='alexnet', batch_size=64, device_model='V100', since='2018-04-01')
+    store.export_csv('alexnet.csv', network='alexnet')
+
+Every test records its result in results.db next to all_results.csv. Run python -m resultprocess.resultstore
+from the project root to import csv files into a store and to query or export it.
+"""
+
+import os
+import re
+import csv
+import socket
+import sqlite3
+import datetime
+import logging
+
+from benchmark import TestResultFields
+
+logger = logging.getLogger(__name__)
+
+STORE_FILE_NAME = 'results.db'
+NULL_VALUES = ('', '-', 'err', 'None', 'nan')
+
+INTEGER_FIELDS = ('device_count', 'cpu_count', 'batch_size', 'number_of_epochs', 'epoch_size', 'flops_per_step',
+                  'parameters', 'repeat', 'memory_bytes_per_step')
+REAL_FIELDS = ('learning_rate', 'training_speed', 'accuracy', 'input_memory_mb', 'scaling_efficiency',
+               'compile_time', 'inference_throughput', 'loadgen_peak_qps', 'achieved_tflops', 'peak_fraction',
+               'arithmetic_intensity', 'attainable_tflops')
+RUN_FIELDS = ['recorded_at', 'host', 'source'] + TestResultFields
+DEVICE_FIELDS = ['device_index', 'device_id', 'gpu_utilization', 'mem_utilization', 'max_memory_usage']
+# Columns of the runs table that hold one ';'-separated value per device.
+PER_DEVICE_FIELDS = DEVICE_FIELDS[1:]
+INDEXED_FIELDS = ('network_name', 'batch_size', 'device_model', 'recorded_at', 'source', 'fingerprint')
+MACHINE_FIELDS = ['fingerprint', 'hosts', 'device_models', 'runs', 'first_recorded', 'last_recorded']
+
+# query() keyword -> column, for the filters the reports use most.
+FILTER_ALIASES = {'network': 'network_name', 'since': 'recorded_at', 'until': 'recorded_at'}
+
+
+def column_type(field):
+    if field in INTEGER_FIELDS:
+        return 'INTEGER'
+    if field in REAL_FIELDS:
+        return 'REAL'
+    return 'TEXT'
+
+
+def to_value(field, value):
+    """Typed value of a csv field, None for the placeholders of missing values."""
+    if value is None:
+        return None
+    value = str(value).strip()
+    if value in NULL_VALUES:
+        return None
+    try:
+        if column_type(field) == 'INTEGER':
+            return int(float(value))
+        if column_type(field) == 'REAL':
+            return float(value)
+    except ValueError:
+        logger.warning('Not a number in column %s: %s' % (field, value))
+        return None
+    return value
+
+
+def _number(value):
+    """Leading number of an nvidia-smi value like '95 %' or '1234 MiB', None if there is none."""
+    result = re.match('\s*(-?\d+(\.\d+)?)', str(value))
+    return float(result.group(1)) if result else None
+
+
+def _to_csv(value):
+    return '-' if value is None else value
+
+
+def _row_dict(row):
+    if isinstance(row, dict):
+        return dict(row)
+    return row._asdict()
+
+
+class ResultStore(object):
+    """A results database, created on first use. Use it as a context manager or close() it."""
+
+    def __init__(self, path=STORE_FILE_NAME):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.row_factory = sqlite3.Row
+        self._create_schema()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def _create_schema(self):
+        columns = ',\n'.join('    "%s" %s' % (f, column_type(f)) for f in RUN_FIELDS)
+        with self.connection:
+            self.connection.execute('CREATE TABLE IF NOT EXISTS runs (\n    id INTEGER PRIMARY KEY,\n%s\n)'
+                                    % columns)
+            self.connection.execute('CREATE TABLE IF NOT EXISTS run_devices (\n'
+                                    '    run_id INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,\n'
+                                    '    device_index INTEGER NOT NULL,\n'
+                                    '    device_id TEXT,\n'
+                                    '    gpu_utilization REAL,\n'
+                                    '    mem_utilization REAL,\n'
+                                    '    max_memory_usage REAL,\n'
+                                    '    PRIMARY KEY (run_id, device_index)\n'
+                                    ')')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS run_samples (\n'
+                                    '    run_id INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,\n'
+                                    '    sample_index INTEGER NOT NULL,\n'
+                                    '    step_time REAL NOT NULL,\n'
+                                    '    PRIMARY KEY (run_id, sample_index)\n'
+                                    ')')
+            # Columns added to TestResultFields after the store was created.
+            existing = [r['name'] for r in self.connection.execute('PRAGMA table_info(runs)')]
+            for field in RUN_FIELDS:
+                if field not in existing:
+                    self.connection.execute('ALTER TABLE runs ADD COLUMN "%s" %s' % (field, column_type(field)))
+            for field in INDEXED_FIELDS:
+                self.connection.execute('CREATE INDEX IF NOT EXISTS runs_%s ON runs ("%s")' % (field, field))
+
+    def add(self, result, recorded_at=None, source=None, host=None, step_times=None):
+        """
+        Record a result row.
+        :param result: TestResultEntry or dict of TestResultFields as read from a result csv
+        :param step_times: steady-state step seconds of the run, see xla.StepTimer
+        :param recorded_at: datetime or ISO string, now by default
+        :param source: free tag of where the row comes from, e.g. the machine of a merged csv
+        :param host: host the benchmark ran on, this host by default
+        :return: id of the new run
+        """
+        with self.connection:
+            run_id = self._insert(_row_dict(result), recorded_at, source, host)
+            self.connection.executemany('INSERT INTO run_samples (run_id, sample_index, step_time) VALUES (?, ?, ?)',
+                                        [(run_id, i, t) for i, t in enumerate(step_times or [])])
+            return run_id
+
+    def _insert(self, row, recorded_at, source, host):
+        if isinstance(recorded_at, datetime.datetime):
+            recorded_at = recorded_at.isoformat(' ')
+        row.update(recorded_at=recorded_at or row.get('recorded_at') or datetime.datetime.now().isoformat(' '),
+                   source=source if source is not None else row.get('source'),
+                   host=host or row.get('host') or socket.gethostname())
+        fields = [f for f in RUN_FIELDS if f in row]
+        sql = 'INSERT INTO runs (%s) VALUES (%s)' % (', '.join('"%s"' % f for f in fields),
+                                                     ', '.join('?' * len(fields)))
+        values = [to_value(f, row[f]) if f in TestResultFields else row[f] for f in fields]
+        cursor = self.connection.execute(sql, values)
+        run_id = cursor.lastrowid
+        per_device = [str(row.get(f) or '').split(';') for f in PER_DEVICE_FIELDS]
+        for index in range(max(len(values) for values in per_device)):
+            device_values = [column[index] if index < len(column) else None for column in per_device]
+            self.connection.execute('INSERT INTO run_devices (run_id, %s) VALUES (?, ?, ?, ?, ?, ?)'
+                                    % ', '.join(DEVICE_FIELDS),
+                                    [run_id, index, to_value('device_id', device_values[0])] +
+                                    [_number(v) for v in device_values[1:]])
+        return run_id
+
+    def samples(self, run_id):
+        """Step times of a run in seconds, empty if none were recorded."""
+        cursor = self.connection.execute('SELECT step_time FROM run_samples WHERE run_id = ? ORDER BY sample_index',
+                                         (run_id,))
+        return [r[0] for r in cursor]
+
+    def import_csv(self, csv_file, source=None, recorded_at=None):
+        """
+        Record all rows of a result csv written by benchmark.py, in one transaction.
+        :param recorded_at: time of the rows, the modification time of csv_file by default
+        :return: number of imported rows
+        """
+        if recorded_at is None:
+            recorded_at = datetime.datetime.fromtimestamp(os.path.getmtime(csv_file))
+        count = 0
+        with open(csv_file, 'rb') as f, self.connection:
+            for row in csv.DictReader(f):
+                self._insert(row, recorded_at, source, None)
+                count += 1
+        return count
+
+    def query(self, order_by='recorded_at', **filters):
+        """
+        Runs matching all filters, oldest first.
+        :param filters: column=value for equality, with the aliases network (network_name), since and until
+            (inclusive bounds of recorded_at, ISO dates or datetimes). device_model matches any part of the
+            model name. A list or tuple value matches any of its elements.
+        :return: list of dicts of RUN_FIELDS plus id
+        """
+        clauses = []
+        parameters = []
+        for key, value in sorted(filters.items()):
+            if value is None:
+                continue
+            column = FILTER_ALIASES.get(key, key)
+            if column not in RUN_FIELDS and column != 'id':
+                raise ValueError('Unknown result column: %s' % key)
+            if key == 'since':
+                clauses.append('recorded_at >= ?')
+            elif key == 'until':
+                # A bare date includes the whole day.
+                clauses.append('date(recorded_at) <= ?' if len(str(value)) == 10 else 'recorded_at <= ?')
+            elif column == 'device_model':
+                clauses.append('device_model LIKE ?')
+                value = '%%%s%%' % value
+            elif isinstance(value, (list, tuple)):
+                clauses.append('"%s" IN (%s)' % (column, ', '.join('?' * len(value))))
+                parameters.extend(to_value(column, v) for v in value)
+                continue
+            else:
+                clauses.append('"%s" = ?' % column)
+                value = to_value(column, value)
+            parameters.append(str(value) if key in ('since', 'until') else value)
+        if order_by not in RUN_FIELDS and order_by != 'id':
+            raise ValueError('Unknown result column: %s' % order_by)
+        sql = 'SELECT * FROM runs%s ORDER BY "%s", id' % (' WHERE ' + ' AND '.join(clauses) if clauses else '',
+                                                         order_by)
+        return [dict(zip(r.keys(), tuple(r))) for r in self.connection.execute(sql, parameters)]
+
+    def machines(self, **filters):
+        """
+        Runs grouped by machine fingerprint (see fingerprint.py), e.g. to find which hosts of a fleet are set up
+        the same. Runs recorded before rows had a fingerprint are one group with fingerprint None.
+        :param filters: see query
+        :return: list of dicts of MACHINE_FIELDS, hosts and device_models ';'-joined
+        """
+        groups = {}
+        for row in self.query(**filters):
+            group = groups.setdefault(row['fingerprint'], {'fingerprint': row['fingerprint'], 'hosts': set(),
+                                                            'device_models': set(), 'runs': 0,
+                                                            'first_recorded': row['recorded_at']})
+            group['hosts'].add(row['host'] or '-')
+            group['device_models'].add(row['device_model'] or '-')
+            group['runs'] += 1
+            group['last_recorded'] = row['recorded_at']
+        for group in groups.values():
+            group.update(hosts=';'.join(sorted(group['hosts'])), device_models=';'.join(sorted(group['device_models'])))
+        return sorted(groups.values(), key=lambda g: g['first_recorded'])
+
+    def devices(self, run_id):
+        """Per-device rows of a run as dicts of DEVICE_FIELDS, in device order."""
+        cursor = self.connection.execute('SELECT %s FROM run_devices WHERE run_id = ? ORDER BY device_index'
+                                         % ', '.join(DEVICE_FIELDS), (run_id,))
+        return [dict(zip(DEVICE_FIELDS, tuple(r))) for r in cursor]
+
+    def export_csv(self, output_file, fields=None, **filters):
+        """
+        Write the runs matching filters (see query) as a result csv.
+        :param fields: columns to write, TestResultFields by default, RUN_FIELDS to keep the store columns
+        :return: number of written rows
+        """
+        fields = fields or TestResultFields
+        rows = self.query(**filters)
+        with open(output_file, 'wb') as f:
+            writer = csv.writer(f)
+            writer.writerow(fields)
+            for row in rows:
+                writer.writerow([_to_csv(row[field]) for field in fields])
+        return len(rows)
+
+
+def store_path_of(result_file):
+    """The store recorded next to a result csv."""
+    return os.path.join(os.path.dirname(os.path.abspath(result_file)), STORE_FILE_NAME)
+
+
+if __name__ == '__main__':
+    import argparse
+    logging.basicConfig(level=logging.DEBUG)
+    parser = argparse.ArgumentParser(description='Import result csv files into a result store and query it')
+    parser.add_argument('-db', '--store', help='result store file', default=STORE_FILE_NAME)
+    parser.add_argument('-i', '--input', help='result csv files to import', nargs='*', default=[])
+    parser.add_argument('-s', '--source', help='source tag of the imported rows, e.g. the machine', default=None)
+    parser.add_argument('-n', '--network', help='only rows of this network', default=None)
+    parser.add_argument('-b', '--batch_size', help='only rows of this batch size', type=int, default=None)
+    parser.add_argument('-m', '--device_model', help='only rows whose device model contains this', default=None)
+    parser.add_argument('--since', help='only rows recorded on or after this date (YYYY-MM-DD)', default=None)
+    parser.add_argument('--until', help='only rows recorded on or before this date (YYYY-MM-DD)', default=None)
+    parser.add_argument('-f', '--fingerprint', help='only rows of machines with this fingerprint', default=None)
+    parser.add_argument('--machines', help='list the machine fingerprints of the matching rows', action='store_true')
+    parser.add_argument('-o', '--output', help='csv file to export the matching rows to', default=None)
+    args = parser.parse_args()
+    with ResultStore(args.store) as store:
+        for input_file in args.input:
+            logger.info('Imported %d rows from %s' % (store.import_csv(input_file, source=args.source), input_file))
+        criteria = dict(network=args.network, batch_size=args.batch_size, device_model=args.device_model,
+                        since=args.since, until=args.until, fingerprint=args.fingerprint)
+        if args.machines:
+            for machine in store.machines(**criteria):
+                print(','.join(str(machine[f]) for f in MACHINE_FIELDS))
+        elif args.output:
+            logger.info('Exported %d rows to %s' % (store.export_csv(args.output, RUN_FIELDS, **criteria),
+                                                     args.output))
+        elif not args.input:
+            for row in store.query(**criteria):
+                print(','.join(str(_to_csv(row[f])) for f in RUN_FIELDS))
@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+""" scaling.py: Multi-GPU scaling efficiency of result rows.
+
+training_speed in all_results.csv is the step time divided by the device count and batch_size is the global
+batch (tm.sh splits it over the devices), so throughput is batch_size / (training_speed * device_count).
+An N-device row is compared with the 1-device row of the same per-device batch size (weak scaling):
+
+    efficiency = throughput(N) / (N * throughput(1))
+
+scaling_report() turns a whole result file into speedup/efficiency curves over 1, 2, 4 and 8 devices and flags
+points below a threshold. Run this file directly to print the report of an all_results.csv.
+"""
+
+import csv
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Columns that must match between an N-device row and its 1-device baseline, besides the per-device batch.
+BASELINE_KEYS = ('framework', 'network_type', 'network_name', 'synthetic', 'precision', 'xla')
+
+
+def _get(row, key, default=None):
+    if isinstance(row, dict):
+        return row.get(key, default)
+    return getattr(row, key, default)
+
+
+def device_count(row):
+    return int(_get(row, 'device_count'))
+
+
+def batch_per_device(row):
+    return int(_get(row, 'batch_size')) // device_count(row)
+
+
+def throughput(row):
+    """Examples per second of a result row, None if the row has no valid timing."""
+    try:
+        speed = float(_get(row, 'training_speed'))
+    except (TypeError, ValueError):
+        return None
+    if speed <= 0:
+        return None
+    return int(_get(row, 'batch_size')) / (speed * device_count(row))
+
+
+def baseline_key(row):
+    return tuple(str(_get(row, key, '')) for key in BASELINE_KEYS) + (batch_per_device(row),)
+
+
+def find_baseline(row, rows):
+    """The last 1-device row of rows matching row, or None."""
+    key = baseline_key(row)
+    baseline = None
+    for candidate in rows:
+        if device_count(candidate) == 1 and baseline_key(candidate) == key and throughput(candidate):
+            baseline = candidate
+    return baseline
+
+
+def scaling_efficiency(row, baseline):
+    current = throughput(row)
+    base = throughput(baseline) if baseline is not None else None
+    if not current or not base:
+        return None
+    return current / (device_count(row) * base)
+
+
+def read_results(result_file):
+    with open(result_file, 'rb') as f:
+        return [r for r in csv.DictReader(f)]
+
+
+def efficiency_of_new_row(row, result_file):
+    """Scaling efficiency of row against the rows already written to result_file, formatted for the csv."""
+    if device_count(row) == 1:
+        return '1.000' if throughput(row) else '-'
+    try:
+        rows = read_results(result_file)
+    except (IOError, OSError):
+        rows = []
+    efficiency = scaling_efficiency(row, find_baseline(row, rows))
+    if efficiency is None:
+        logger.warning('No 1-device baseline for %s, run it before the multi-device rows.' % (baseline_key(row),))
+        return '-'
+    return '%.3f' % efficiency
+
+
+REPORT_FIELDS = ['framework', 'network_type', 'network_name', 'synthetic', 'precision', 'xla', 'batch_per_device',
+                 'gradient_aggregation', 'device_count', 'runs', 'throughput', 'speedup', 'efficiency', 'flag']
+DEFAULT_DEVICE_COUNTS = (1, 2, 4, 8)
+
+
+def scaling_report(rows, threshold=0.8, device_counts=DEFAULT_DEVICE_COUNTS):
+    """
+    Speedup and efficiency curves of result rows.
+    Rows are grouped by network, synthetic, precision, XLA mode and batch per device. Every multi-device gradient
+    aggregation strategy gets its own curve against the group's 1-device throughput. Repeated rows are
+    averaged.
+    :param rows: dicts as read by read_results
+    :param threshold: efficiency below which a point is flagged
+    :param device_counts: device counts to report, others are ignored
+    :return: list of dicts with REPORT_FIELDS keys
+    """
+    groups = {}
+    for row in rows:
+        value = throughput(row)
+        if value is None or device_count(row) not in device_counts:
+            continue
+        aggregation = (row.get('gradient_aggregation') or '-') if device_count(row) > 1 else '-'
+        points = groups.setdefault(baseline_key(row), {})
+        points.setdefault((aggregation, device_count(row)), []).append(value)
+
+    report = []
+    for key in sorted(groups):
+        points = groups[key]
+        baselines = points.get(('-', 1))
+        base = sum(baselines) / len(baselines) if baselines else None
+        for aggregation, count in sorted(points, key=lambda p: (p[0] != '-', p[0], p[1])):
+            values = points[(aggregation, count)]
+            value = sum(values) / len(values)
+            entry = dict(zip(BASELINE_KEYS, key[:-1]))
+            entry.update(batch_per_device=key[-1], gradient_aggregation=aggregation, device_count=count,
+                         runs=len(values), throughput='%.1f' % value, speedup='-', efficiency='-', flag='')
+            if base:
+                efficiency = value / (count * base)
+                entry.update(speedup='%.2f' % (value / base), efficiency='%.3f' % efficiency)
+                if efficiency < threshold:
+                    entry['flag'] = 'LOW'
+            elif count > 1:
+                entry['flag'] = 'NO_BASELINE'
+            report.append(entry)
+    return report
+
+
+def write_report(report, output_file):
+    with open(output_file, 'wb') as f:
+        writer = csv.DictWriter(f, REPORT_FIELDS)
+        writer.writeheader()
+        writer.writerows(report)
+
+
+def format_report(report):
+    columns = ['network_name', 'synthetic', 'precision', 'xla', 'batch_per_device', 'gradient_aggregation',
+               'device_count', 'throughput', 'speedup', 'efficiency', 'flag']
+    lines = [[str(c) for c in columns]] + [[str(e[c]) for c in columns] for e in report]
+    widths = [max(len(line[i]) for line in lines) for i in range(len(columns))]
+    return '\n'.join('  '.join(v.ljust(w) for v, w in zip(line, widths)).rstrip() for line in lines)
+
+
+if __name__ == '__main__':
+    import argparse
+    logging.basicConfig(level=logging.DEBUG)
+    parser = argparse.ArgumentParser(description='Multi-GPU speedup and efficiency report of all_results.csv')
+    parser.add_argument('-i', '--input', help='result csv written by benchmark.py')
+    parser.add_argument('-o', '--output', help='csv file to write the report to', default=None)
+    parser.add_argument('-t', '--threshold', help='flag efficiencies below this value', type=float, default=0.8)
+    parser.add_argument('-d', '--device_counts', help='device counts to report, comma separated',
+                        default=','.join(str(c) for c in DEFAULT_DEVICE_COUNTS))
+    args = parser.parse_args()
+    counts = tuple(int(c) for c in args.device_counts.split(','))
+    result = scaling_report(read_results(args.input), threshold=args.threshold, device_counts=counts)
+    print(format_report(result))
+    if args.output:
+        write_report(result, args.output)
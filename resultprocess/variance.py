@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+""" variance.py: Run-to-run variance of repeated result rows.
+
+Rows with the same configuration (RUN_KEYS) are runs of one test, e.g. a config row with repeats 5 or the same
+row in several sweeps. For every test the report has the throughput's mean, its sample standard deviation, the
+95% confidence interval of the mean (Student's t), and the minimum and maximum. A test is flagged NOISY when
+its coefficient of variation (std / mean) exceeds the threshold. Differences between tests that are not well
+beyond their spread should not decide anything.
+
+Throughput is examples/sec, see throughput(). Run this file directly to print the report of an all_results.csv.
+"""
+
+import csv
+import math
+import logging
+
+import numpy as np
+
+from resultprocess import scaling
+
+logger = logging.getLogger(__name__)
+
+# Columns of a result row that make up one test, the rows of a test are its runs.
+RUN_KEYS = ('framework', 'network_name', 'device_model', 'device_count', 'batch_size', 'synthetic', 'precision',
+            'gradient_aggregation', 'data_format', 'xla', 'lstm_impl', 'mode')
+REPORT_FIELDS = list(RUN_KEYS) + ['runs', 'mean', 'std', 'ci_low', 'ci_high', 'min', 'max', 'cv', 'flag']
+DEFAULT_CV_THRESHOLD = 0.02
+NOISY = 'NOISY'
+
+# Two-sided 95% quantiles of Student's t by degrees of freedom (1 to 30), the normal quantile beyond.
+T_95 = [12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228, 2.201, 2.179, 2.160, 2.145, 2.131,
+        2.120, 2.110, 2.101, 2.093, 2.086, 2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042]
+Z_95 = 1.960
+
+
+def throughput(row):
+    """Examples/sec of a result row: inference throughput or load sweep peak for serving rows, see scaling.py."""
+    mode = row.get('mode') or 'train'
+    try:
+        if mode == 'inference':
+            value = float(row.get('inference_throughput'))
+        elif mode == 'loadgen':
+            value = float(row.get('loadgen_peak_qps'))
+        else:
+            value = scaling.throughput(row)
+    except (TypeError, ValueError):
+        return None
+    return None if value is None or math.isnan(value) else value
+
+
+def run_key(row):
+    return tuple(str(row.get(key) or '-') for key in RUN_KEYS)
+
+
+def group_runs(rows):
+    """Throughputs of the runs of every test (run_key) of rows, in row order."""
+    groups = {}
+    for row in rows:
+        value = throughput(row)
+        if value:
+            groups.setdefault(run_key(row), []).append(value)
+    return groups
+
+
+def t_quantile(degrees_of_freedom):
+    if degrees_of_freedom <= len(T_95):
+        return T_95[degrees_of_freedom - 1]
+    return Z_95
+
+
+def summarize(values):
+    """
+    Statistics of the runs of a test.
+    :return: (mean, std, ci_low, ci_high, min, max, cv), std, the interval and cv None for a single run
+    """
+    values = np.asarray(values, dtype=np.float64)
+    mean = values.mean()
+    if len(values) < 2:
+        return mean, None, None, None, values.min(), values.max(), None
+    std = values.std(ddof=1)
+    half_width = t_quantile(len(values) - 1) * std / math.sqrt(len(values))
+    return mean, std, mean - half_width, mean + half_width, values.min(), values.max(), std / mean
+
+
+def variance_report(rows, threshold=DEFAULT_CV_THRESHOLD, min_runs=1):
+    """
+    Variance of the tests of result rows.
+    :param rows: dicts as read by scaling.read_results
+    :param threshold: coefficient of variation above which a test is flagged
+    :param min_runs: leave out tests with fewer runs
+    :return: list of dicts with REPORT_FIELDS keys, noisy tests first
+    """
+    report = []
+    for key, values in sorted(group_runs(rows).items()):
+        if len(values) < min_runs:
+            continue
+        mean, std, low, high, minimum, maximum, cv = summarize(values)
+        entry = dict(zip(RUN_KEYS, key))
+        entry.update(runs=len(values), mean='%.1f' % mean, std='-', ci_low='-', ci_high='-', min='%.1f' % minimum,
+                     max='%.1f' % maximum, cv='-', flag='')
+        if std is not None:
+            entry.update(std='%.1f' % std, ci_low='%.1f' % low, ci_high='%.1f' % high, cv='%.2f%%' % (cv * 100))
+            if cv > threshold:
+                entry['flag'] = NOISY
+        report.append(entry)
+    return sorted(report, key=lambda e: e['flag'] != NOISY)
+
+
+def write_report(report, output_file):
+    with open(output_file, 'wb') as f:
+        writer = csv.DictWriter(f, REPORT_FIELDS)
+        writer.writeheader()
+        writer.writerows(report)
+
+
+def format_report(report):
+    columns = ['network_name', 'device_model', 'device_count', 'batch_size', 'synthetic', 'precision', 'data_format',
+               'xla', 'mode', 'runs', 'mean', 'std', 'ci_low', 'ci_high', 'min', 'cv', 'flag']
+    lines = [columns] + [[str(e[c]) for c in columns] for e in report]
+    widths = [max(len(line[i]) for line in lines) for i in range(len(columns))]
+    return '\n'.join('  '.join(v.ljust(w) for v, w in zip(line, widths)).rstrip() for line in lines)
+
+
+if __name__ == '__main__':
+    import argparse
+    logging.basicConfig(level=logging.DEBUG)
+    parser = argparse.ArgumentParser(description='Run-to-run variance report of all_results.csv')
+    parser.add_argument('-i', '--input', help='result csv written by benchmark.py')
+    parser.add_argument('-o', '--output', help='csv file to write the report to', default=None)
+    parser.add_argument('-t', '--threshold', help='flag coefficients of variation above this value', type=float,
+                        default=DEFAULT_CV_THRESHOLD)
+    parser.add_argument('-m', '--min_runs', help='leave out tests with fewer runs', type=int, default=2)
+    args = parser.parse_args()
+    result = variance_report(scaling.read_results(args.input), threshold=args.threshold, min_runs=args.min_runs)
+    print(format_report(result))
+    if args.output:
+        write_report(result, args.output)
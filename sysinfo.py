@@ -0,0 +1,356 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+""" sysinfo.py: Collect the hardware and software setup of this machine before a sweep.
+
+Every probe (GPUs and driver, CUDA, cuDNN, TensorFlow, kernel, CPU, memory) runs in its own thread, commands are
+killed after a timeout, so one hanging tool (e.g. sudo asking for a password) costs the timeout and not the
+sweep. Each probe gives the text it read and the facts parsed from it. benchmark.py writes both to the log
+directory: system-info.txt for people and system-info.json for scripts, e.g.
+
+  python sysinfo.py -i GpuBenchmarkLog_*/system-info.json -q tensorflow.version gpu.driver_version
+
+Static probes (versions, CPU model) only change with a reboot or a package upgrade. Their results are cached
+in BENCHMARK_CACHE_DIR under a key of the boot id and the modification times of the package directories, so
+only the GPU, kernel and memory probes run on every sweep.
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import signal
+import hashlib
+import platform
+import threading
+import subprocess
+import xml.etree.ElementTree as ET
+from collections import namedtuple
+from distutils import sysconfig
+
+from globalconfig import BENCHMARK_CACHE_DIR
+from nvidiasmi import TOOL
+import logging
+logger = logging.getLogger(__name__ if __name__ != '__main__' else os.path.splitext(os.path.basename(__file__))[0])
+logger.setLevel(logging.DEBUG)
+
+CACHE_FILE = os.path.join(BENCHMARK_CACHE_DIR, 'sysinfo.json')
+TEXT_FILE_NAME = 'system-info.txt'
+JSON_FILE_NAME = 'system-info.json'
+DEFAULT_TIMEOUT = 10.0
+BOOT_ID_FILE = '/proc/sys/kernel/random/boot_id'
+CUDA_DIR = '/usr/local/cuda'
+CUDNN_HEADERS = ['/usr/include/cudnn_version.h', '/usr/include/cudnn.h', '/usr/local/cuda/include/cudnn_version.h',
+                 '/usr/local/cuda/include/cudnn.h', '/usr/include/x86_64-linux-gnu/cudnn_v7.h']
+TENSORFLOW_PACKAGES = ['tensorflow-gpu', 'tensorflow']
+
+Probe = namedtuple('Probe', ['name', 'title', 'static', 'function'])
+PROBES = []  # in the order of system-info.txt
+_info = []
+
+
+def probe(name, title, static=False):
+    """Decorator registering function(timeout) -> (text, facts) as a probe, see the module docstring."""
+    def register(function):
+        PROBES.append(Probe(name, title, static, function))
+        return function
+    return register
+
+
+def run_command(cmd, timeout=DEFAULT_TIMEOUT):
+    """
+    Stdout of a shell command, killing it with its children after timeout seconds.
+    :raise RuntimeError: if it timed out, or failed without output
+    """
+    killed = []
+
+    def kill():
+        killed.append(True)
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except OSError:
+            pass
+
+    with open(os.devnull, 'r') as devnull:
+        process = subprocess.Popen(cmd, shell=True, stdin=devnull, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                   close_fds=True, preexec_fn=os.setsid)
+    timer = threading.Timer(timeout, kill)
+    timer.start()
+    try:
+        output, error = process.communicate()
+    finally:
+        timer.cancel()
+    if killed:
+        raise RuntimeError('timed out after %.0f seconds: %s' % (timeout, cmd))
+    if process.returncode != 0 and not output.strip():
+        reason = error.strip().splitlines()[-1] if error.strip() else 'exit code %d' % process.returncode
+        raise RuntimeError('%s: %s' % (cmd, reason))
+    return output
+
+
+def _read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def _xml_facts(element):
+    """Nested dicts of an nvidia-smi xml element, lists for repeated tags (e.g. gpu)."""
+    if not len(element):
+        return (element.text or '').strip()
+    facts = dict(element.attrib)
+    for child in element:
+        value = _xml_facts(child)
+        if child.tag in facts:
+            if not isinstance(facts[child.tag], list):
+                facts[child.tag] = [facts[child.tag]]
+            facts[child.tag].append(value)
+        else:
+            facts[child.tag] = value
+    return facts
+
+
+def _xml_text(element, depth=0):
+    """`nvidia-smi -q` style text of an xml element."""
+    lines = []
+    for child in element:
+        label = '    ' * depth + child.tag.replace('_', ' ').capitalize()
+        if child.attrib:
+            label += ' ' + ' '.join(child.attrib.values())
+        if len(child):
+            lines.append(label)
+            lines.extend(_xml_text(child, depth + 1))
+        else:
+            lines.append('%-40s : %s' % (label, (child.text or '').strip()))
+    return lines
+
+
+@probe('gpu', 'driver configurations')
+def probe_gpu(timeout):
+    root = ET.fromstring(run_command('%s -q -x' % TOOL, timeout))
+    facts = _xml_facts(root)
+    if isinstance(facts.get('gpu'), dict):
+        facts['gpu'] = [facts['gpu']]
+    return '\n'.join(_xml_text(root)), facts
+
+
+@probe('cuda', 'CUDA version', static=True)
+def probe_cuda(timeout):
+    text = run_command('nvcc --version || %s/bin/nvcc --version' % CUDA_DIR, timeout)
+    release = re.search('release (\d+\.\d+)', text)
+    build = re.search('\sV([\d.]+)', text)
+    return text, {'release': release.group(1) if release else None, 'build': build.group(1) if build else None}
+
+
+@probe('cudnn', 'cuDNN version', static=True)
+def probe_cudnn(timeout):
+    for header in CUDNN_HEADERS:
+        if not os.path.isfile(header):
+            continue
+        lines = re.findall('#define CUDNN_(?:MAJOR|MINOR|PATCHLEVEL)\s+\d+', _read(header))
+        if len(lines) == 3:
+            version = '.'.join(re.search('(\d+)$', line).group(1) for line in lines)
+            return '\n'.join([header] + lines), {'version': version, 'header': header}
+    raise RuntimeError('no cuDNN header in %s' % ', '.join(CUDNN_HEADERS))
+
+
+@probe('tensorflow', 'Tensorflow version', static=True)
+def probe_tensorflow(timeout):
+    text = run_command('%s -m pip show %s' % (sys.executable, ' '.join(TENSORFLOW_PACKAGES)), timeout)
+    packages = []
+    for block in re.split('\n-{3,}\n', text):
+        fields = dict((k.strip().lower(), v.strip()) for k, _, v in
+                      (line.partition(':') for line in block.splitlines() if ':' in line))
+        if fields.get('name'):
+            packages.append({'name': fields['name'], 'version': fields.get('version'),
+                             'location': fields.get('location')})
+    return text, {'version': packages[0]['version'] if packages else None, 'packages': packages}
+
+
+@probe('kernel', 'Linux version')
+def probe_kernel(timeout):
+    text = _read('/proc/version')
+    return text, {'release': platform.release(), 'version': text.strip()}
+
+
+@probe('cpu', 'CPU info', static=True)
+def probe_cpu(timeout):
+    blocks = [dict((k.strip(), v.strip()) for k, _, v in (line.partition(':') for line in block.splitlines()))
+              for block in _read('/proc/cpuinfo').strip().split('\n\n')]
+    cores = set((b.get('physical id'), b.get('core id')) for b in blocks if 'core id' in b)
+    facts = {
+        'model_name': blocks[0].get('model name', 'unknown'),
+        'sockets': len(set(b.get('physical id') for b in blocks)),
+        'physical_cores': len(cores) or len(blocks),
+        'logical_cpus': len(blocks),
+        'flags': sorted(blocks[0].get('flags', '').split()),
+    }
+    text = '\n'.join('%-16s : %s' % (key, ' '.join(value) if isinstance(value, list) else value)
+                     for key, value in sorted(facts.items()))
+    return text, facts
+
+
+@probe('memory', 'Memory info')
+def probe_memory(timeout):
+    text = _read('/proc/meminfo')
+    facts = {}
+    for name, value in re.findall('(\w+(?:\(\w+\))?):\s+(\d+)', text):
+        facts[name] = int(value)
+    return text, facts
+
+
+def cache_key():
+    """Key of the static probes: the boot id and the modification times of the package directories."""
+    paths = [sysconfig.get_python_lib(), sysconfig.get_python_lib(plat_specific=True), CUDA_DIR] + CUDNN_HEADERS
+    key = {'boot_id': _read(BOOT_ID_FILE).strip() if os.path.isfile(BOOT_ID_FILE) else None,
+           'python': sys.executable,
+           'mtimes': dict((path, os.path.getmtime(os.path.realpath(path))) for path in sorted(set(paths))
+                          if os.path.exists(path))}
+    return hashlib.sha1(json.dumps(key, sort_keys=True)).hexdigest()
+
+
+def load_cache(cache_file=CACHE_FILE):
+    if not os.path.isfile(cache_file):
+        return {}
+    try:
+        with open(cache_file, 'r') as f:
+            return json.load(f)
+    except ValueError:
+        logger.warning('Ignoring corrupt system info cache: %s' % cache_file)
+        return {}
+
+
+def save_cache(cache, cache_file=CACHE_FILE):
+    cache_dir = os.path.dirname(cache_file)
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    tmp_file = cache_file + '.tmp'
+    with open(tmp_file, 'w') as f:
+        json.dump(cache, f, indent=2, sort_keys=True)
+    os.rename(tmp_file, cache_file)
+
+
+def _run_probe(item, timeout, results):
+    start = time.time()
+    try:
+        text, facts = item.function(timeout)
+        results[item.name] = {'text': text, 'data': facts, 'error': None}
+    except Exception as e:
+        logger.warning('[Querying system info] %s failed: %s' % (item.name, e))
+        results[item.name] = {'text': '', 'data': None, 'error': str(e)}
+    results[item.name]['seconds'] = round(time.time() - start, 3)
+
+
+def collect(timeout=DEFAULT_TIMEOUT, cache_file=CACHE_FILE):
+    """
+    Run the probes concurrently, static ones only if they are not cached for the current cache_key().
+    :param cache_file: None to run every probe and leave the cache alone
+    :return: dict with the probe results under 'probes', see get() to look up facts
+    """
+    start = time.time()
+    key = cache_key()
+    cache = load_cache(cache_file) if cache_file else {}
+    cached = cache.get('probes', {}) if cache.get('key') == key else {}
+    results = {}
+    threads = []
+    for item in PROBES:
+        if item.static and item.name in cached:
+            results[item.name] = dict(cached[item.name], cached=True)
+            continue
+        thread = threading.Thread(target=_run_probe, args=(item, timeout, results))
+        thread.daemon = True
+        thread.start()
+        threads.append(thread)
+    deadline = start + timeout + 1
+    for thread in threads:
+        thread.join(max(0, deadline - time.time()))
+    results = dict(results)  # probes still running past the deadline must not change the returned info
+    for item in PROBES:
+        results.setdefault(item.name, {'text': '', 'data': None, 'error': 'timed out', 'seconds': timeout})
+        results[item.name].setdefault('cached', False)
+        results[item.name]['title'] = item.title
+    fresh = dict((item.name, results[item.name]) for item in PROBES
+                 if item.static and not results[item.name]['cached'] and not results[item.name]['error'])
+    if cache_file and fresh:
+        cached = dict(cached, **fresh)
+        save_cache({'key': key, 'probes': dict((name, {'text': result['text'], 'data': result['data'],
+                                                        'error': None, 'seconds': result['seconds']})
+                                                       for name, result in cached.items())}, cache_file)
+    info = {'collected_at': time.strftime('%Y-%m-%d %H:%M:%S'), 'cache_key': key,
+            'seconds': round(time.time() - start, 3), 'probes': results}
+    _info[:] = [info]
+    return info
+
+
+def system_info():
+    """Result of the last collect() of this process, collected once if there is none."""
+    return _info[0] if _info else collect()
+
+
+def get(info, path, default=None):
+    """
+    A fact of collect()'s result by a dotted path of the probe name and keys or list indexes,
+    e.g. 'gpu.gpu.0.product_name' or 'cpu.model_name'.
+    """
+    name, _, rest = path.partition('.')
+    value = info['probes'].get(name, {}).get('data')
+    for part in rest.split('.') if rest else []:
+        if isinstance(value, list) and part.isdigit() and int(part) < len(value):
+            value = value[int(part)]
+        elif isinstance(value, dict) and part in value:
+            value = value[part]
+        else:
+            return default
+    return default if value is None else value
+
+
+def format_text(info):
+    sections = []
+    for item in PROBES:
+        result = info['probes'][item.name]
+        header = ('============= Querying %s: ' % item.title).ljust(58, '=')
+        body = result['text'].rstrip() if not result['error'] else 'Failed: %s' % result['error']
+        sections.append('%s\n%s\n' % (header, body))
+    return '\n'.join(sections)
+
+
+def write_system_info(log_dir, timeout=DEFAULT_TIMEOUT, cache_file=CACHE_FILE):
+    """Collect and write TEXT_FILE_NAME and JSON_FILE_NAME to log_dir, return the collected info."""
+    info = collect(timeout, cache_file)
+    with open(os.path.join(log_dir, TEXT_FILE_NAME), 'w') as f:
+        f.write(format_text(info))
+    with open(os.path.join(log_dir, JSON_FILE_NAME), 'w') as f:
+        json.dump(info, f, indent=2, sort_keys=True)
+    return info
+
+
+if __name__ == '__main__':
+    import argparse
+    logging.basicConfig(level=logging.DEBUG)
+    parser = argparse.ArgumentParser(description='Collect or query the system info of benchmark runs')
+    parser.add_argument('-i', '--input', help='system-info.json files to query instead of collecting', nargs='+',
+                        default=None)
+    parser.add_argument('-q', '--query', help='dotted paths of facts to print, e.g. cuda.release', nargs='+',
+                        default=None)
+    parser.add_argument('-o', '--output', help='directory to write the text and json files to', default=None)
+    parser.add_argument('-t', '--timeout', help='seconds before a probe is killed', type=float,
+                        default=DEFAULT_TIMEOUT)
+    parser.add_argument('--no_cache', help='run the static probes too', action='store_true')
+    args = parser.parse_args()
+    if args.input:
+        infos = []
+        for path in args.input:
+            with open(path, 'r') as f:
+                infos.append((path, json.load(f)))
+    elif args.output:
+        infos = [(args.output, write_system_info(args.output, args.timeout, None if args.no_cache else CACHE_FILE))]
+    else:
+        infos = [('', collect(args.timeout, None if args.no_cache else CACHE_FILE))]
+    for source, info in infos:
+        if not args.query:
+            print(format_text(info))
+            continue
+        for path in args.query:
+            value = get(info, path)
+            print('%s%s: %s' % (source + ' ' if len(infos) > 1 else '', path,
+                                json.dumps(value) if isinstance(value, (dict, list)) else value))